@@ -1,110 +1,218 @@
-print("--- THIS IS THE NEW FILE, TEST 123 ---")
 from dotenv import load_dotenv
 load_dotenv() # Loads the .env file
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, stream_with_context
 import sqlite3
 import os
 import hashlib
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+import time
+import uuid
+from datetime import date
 import json
+import math
+import click
 import urllib.request
 import urllib.error
-import google.generativeai as genai
+import secrets
+from database import init_app as init_db_pool, get_db, release_db
+from auth import AuthBusy, Authenticator, LoginThrottle
+from money import Money, InvalidMoney, MoneyJSONProvider, ZERO, money_fields
+import exports
+import history
+import importer
+import investments
+import ledger
+import summaries
+import transfers
+import audit
+import chat_history
+import metrics
+import migrations
+import sharedstate
+from feed import Broker, FeedFull, LedgerWatcher
+from viewmodels import FragmentCache, load_account_view
+from recommender import Recommender
+from sessions import ServerSessionInterface, rotate as rotate_session
+from chat import (ChatService, LazyGeminiModel, ChatUnavailable, PolicyCatalogCache, ResponseCache,
+                  build_prompt, is_blocking_worker, prompt_key)
 
 DB_PATH = "simple_bank.db"
 
+
 def create_app() -> Flask:
     app = Flask(__name__)
-    app.secret_key = "dev-secret"
+    app.json = MoneyJSONProvider(app)
+    # Formats a raw integer-cents column, e.g. {{ row.amount_cents|money }}
+    app.add_template_filter(lambda cents: Money.from_db(cents or 0), "money")
+    # APP_PROFILE=production stops template re-checks, lets browsers cache
+    # static files and samples fewer requests for metrics
+    app.config["APP_PROFILE"] = os.getenv("APP_PROFILE", "development")
+    production = app.config["APP_PROFILE"] == "production"
+    # Without SECRET_KEY, development gets a random key kept in the shared state
+    app.secret_key = os.getenv("SECRET_KEY")
+    if not app.secret_key and production:
+        raise RuntimeError("SECRET_KEY must be set when APP_PROFILE=production")
     # Ensure templates and static files don't get cached while developing
-    app.config["TEMPLATES_AUTO_RELOAD"] = True
-    app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0
-    # Configure Gemini API key from env
+    app.config["TEMPLATES_AUTO_RELOAD"] = not production
+    app.config["SEND_FILE_MAX_AGE_DEFAULT"] = int(os.getenv("STATIC_MAX_AGE", "3600")) if production else 0
+    # Apply pending migrations at boot; production expects `python migrations.py` instead
+    app.config["AUTO_MIGRATE"] = os.getenv("AUTO_MIGRATE", "0" if production else "1") == "1"
+    # Policies one user may hold at once
+    app.config["INVEST_MAX_POLICIES"] = int(os.getenv("INVEST_MAX_POLICIES", str(investments.MAX_HOLDINGS)))
+    # Largest batch accepted by /api/transfers/batch
+    app.config["BATCH_MAX_ITEMS"] = int(os.getenv("BATCH_MAX_ITEMS", "50000"))
+    # Chatbot pool: worker threads, calls allowed in flight, seconds per reply
+    app.config["CHAT_MAX_WORKERS"] = int(os.getenv("CHAT_MAX_WORKERS", "4"))
+    app.config["CHAT_MAX_IN_FLIGHT"] = int(os.getenv("CHAT_MAX_IN_FLIGHT", "16"))
+    app.config["CHAT_TIMEOUT"] = float(os.getenv("CHAT_TIMEOUT", "30"))
+    # Memoized model replies: entries kept and seconds each one stays fresh
+    app.config["CHAT_CACHE_SIZE"] = int(os.getenv("CHAT_CACHE_SIZE", "512"))
+    app.config["CHAT_CACHE_TTL"] = float(os.getenv("CHAT_CACHE_TTL", "600"))
+    # Chat history kept per conversation, and the token budget sent to the model
+    app.config["CHAT_HISTORY_MAX_TURNS"] = int(os.getenv("CHAT_HISTORY_MAX_TURNS", "20"))
+    app.config["CHAT_HISTORY_MAX_TOKENS"] = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "2000"))
+    # Audit log: sink (sqlite, jsonl or off) and where it writes, queue bound,
+    # events per group commit, seconds between flushes (the most a crash can
+    # lose), and milliseconds record() waits for room before dropping
+    app.config["AUDIT_SINK"] = os.getenv("AUDIT_SINK", "sqlite")
+    app.config["AUDIT_PATH"] = os.getenv("AUDIT_PATH", "audit" if app.config["AUDIT_SINK"] == "jsonl" else "audit.db")
+    app.config["AUDIT_QUEUE_SIZE"] = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+    app.config["AUDIT_BATCH_SIZE"] = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+    app.config["AUDIT_FLUSH_INTERVAL"] = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.2"))
+    app.config["AUDIT_BLOCK_MS"] = float(os.getenv("AUDIT_BLOCK_MS", "50"))
+    app.config["AUDIT_SEGMENT_BYTES"] = int(os.getenv("AUDIT_SEGMENT_BYTES", str(64 * 2 ** 20)))
+    # Answer clear recommendation requests from local rules instead of the model
+    app.config["CHAT_RULES"] = os.getenv("CHAT_RULES", "1") == "1"
+    # Live feed: open feeds per process, seconds between ledger polls, and
+    # seconds between keep-alive comments on idle streams
+    app.config["FEED_MAX_SUBSCRIBERS"] = int(os.getenv("FEED_MAX_SUBSCRIBERS", "5000"))
+    app.config["FEED_POLL_INTERVAL"] = float(os.getenv("FEED_POLL_INTERVAL", "1.0"))
+    app.config["FEED_HEARTBEAT"] = float(os.getenv("FEED_HEARTBEAT", "15"))
+    # Postings between balance checkpoints written by `flask ledger-checkpoint`
+    app.config["LEDGER_CHECKPOINT_EVERY"] = int(os.getenv("LEDGER_CHECKPOINT_EVERY", "1000"))
+    # Password hashing: werkzeug KDF method, hashing threads, hashes queued or
+    # running before logins are refused, and seconds allowed per hash
+    app.config["AUTH_HASH_METHOD"] = os.getenv("AUTH_HASH_METHOD", "scrypt:32768:8:1")
+    app.config["AUTH_HASH_WORKERS"] = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+    app.config["AUTH_HASH_MAX_IN_FLIGHT"] = int(os.getenv("AUTH_HASH_MAX_IN_FLIGHT", "16"))
+    app.config["AUTH_HASH_TIMEOUT"] = float(os.getenv("AUTH_HASH_TIMEOUT", "10"))
+    # Login attempts allowed in a burst, and refilled per minute, per username and per IP
+    app.config["AUTH_USER_BURST"] = int(os.getenv("AUTH_USER_BURST", "5"))
+    app.config["AUTH_USER_PER_MINUTE"] = float(os.getenv("AUTH_USER_PER_MINUTE", "5"))
+    app.config["AUTH_IP_BURST"] = int(os.getenv("AUTH_IP_BURST", "30"))
+    app.config["AUTH_IP_PER_MINUTE"] = float(os.getenv("AUTH_IP_PER_MINUTE", "60"))
+    # State shared by all workers: backend (sqlite or memory) and its file,
+    # where sessions live (server or cookie), seconds an unused session
+    # lasts, and seconds between checks for cache invalidations
+    app.config["STATE_BACKEND"] = os.getenv("STATE_BACKEND", "sqlite")
+    app.config["STATE_PATH"] = os.getenv("STATE_PATH", "state.db")
+    app.config["SESSION_STORE"] = os.getenv("SESSION_STORE", "server")
+    app.config["SESSION_TTL"] = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+    app.config["STATE_POLL_INTERVAL"] = float(os.getenv("STATE_POLL_INTERVAL", "1.0"))
+    # Request instrumentation: off switch, share of requests with SQL/template
+    # timing, and the threshold (ms) for the slow-query log (0 disables it)
+    app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "1") == "1"
+    app.config["METRICS_SAMPLE_RATE"] = float(os.getenv("METRICS_SAMPLE_RATE", "0.05" if production else "1.0"))
+    app.config["SLOW_QUERY_MS"] = float(os.getenv("SLOW_QUERY_MS", "0"))
+    # Policy projections: longest horizon in years, most Monte Carlo paths,
+    # and cached (policy set, horizon, paths) results
+    app.config["PROJECTION_MAX_YEARS"] = int(os.getenv("PROJECTION_MAX_YEARS", "40"))
+    app.config["PROJECTION_MAX_PATHS"] = int(os.getenv("PROJECTION_MAX_PATHS", "10000"))
+    app.config["PROJECTION_CACHE_SIZE"] = int(os.getenv("PROJECTION_CACHE_SIZE", "256"))
+    # Gemini API key; the SDK itself is only imported on the first chatbot call
     app.config["GEMINI_API_KEY"] = os.getenv("GEMINI_API_KEY")
-    print("Gemini key loaded:", bool(app.config["GEMINI_API_KEY"]))
-    
-    # --- ADD THIS NEW BLOCK ---
-    global model  # Make the model globally accessible
+    model = LazyGeminiModel(app.config["GEMINI_API_KEY"]) if app.config["GEMINI_API_KEY"] else None
+    if model is None:
+        app.logger.warning("GEMINI_API_KEY is not set; the chatbot only gives rule-based recommendations")
+
+    # ---------- Database schema ----------
+    # Migrations run once per deploy with `python migrations.py`; booting
+    # only checks that nothing is pending
+    conn = sqlite3.connect(DB_PATH)
     try:
-        api_key = app.config["GEMINI_API_KEY"]
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found. Make sure it's in your .env file.")
-
-        genai.configure(api_key=api_key)
-        # Initialize the model here
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        print("Gemini model initialized successfully.")
-    except Exception as e:
-        print(f"Error initializing Gemini model: {e}")
-        model = None
-    # --- END OF NEW BLOCK ---
-
-    # ---------- Initialize Database ----------
-    def init_db():
-        """Create database and tables if they don't exist"""
-        conn = sqlite3.connect(DB_PATH)
-        conn.execute("PRAGMA foreign_keys = ON;")
-        
-        # Execute schema (CREATE TABLE IF NOT EXISTS handles duplicates)
-        with open('schema.sql', 'r') as f:
-            schema_sql = f.read()
-        conn.executescript(schema_sql)
-        # Lightweight migration: ensure new policy columns exist and reseed to 8 entries
-        try:
-            cur = conn.execute("PRAGMA table_info(policies)")
-            cols = {row[1] for row in cur.fetchall()}
-            to_add = []
-            if 'min_investment' not in cols:
-                to_add.append("ALTER TABLE policies ADD COLUMN min_investment REAL DEFAULT 0;")
-            if 'goal' not in cols:
-                to_add.append("ALTER TABLE policies ADD COLUMN goal TEXT;")
-            if 'lock_in' not in cols:
-                to_add.append("ALTER TABLE policies ADD COLUMN lock_in TEXT;")
-            if 'liquidity' not in cols:
-                to_add.append("ALTER TABLE policies ADD COLUMN liquidity TEXT;")
-            for stmt in to_add:
-                conn.execute(stmt)
-
-            # Ensure exactly 8 policies exist as per latest defaults
-            count = conn.execute("SELECT COUNT(*) FROM policies").fetchone()[0]
-            if count != 8:
-                conn.execute("DELETE FROM policies")
-                conn.executescript("""
-                INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment, description, goal, lock_in, liquidity) VALUES
-                    (1, 'Safe Savings', 'Low', 3.0, 50, 'A secure, low-yield savings product backed by government or bank securities. Ideal for conservative investors or those maintaining emergency funds.', 'Capital preservation and quick liquidity.', 'None (withdraw anytime)', 'High');
-                INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment, description, goal, lock_in, liquidity) VALUES
-                    (2, 'Short-Term Bond Fund', 'Low', 4.0, 100, 'Invests in short-duration bonds and debt instruments. Slightly higher returns than savings accounts but minimal volatility.', 'Low-risk short-term growth (1–2 years).', NULL, 'Moderate');
-                INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment, description, goal, lock_in, liquidity) VALUES
-                    (3, 'Balanced Growth', 'Medium', 6.5, 200, 'A mix of equity (60%) and debt (40%) to balance risk and reward. Designed for users with medium risk tolerance and long-term goals.', 'Steady wealth growth.', '2 years recommended', NULL);
-                INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment, description, goal, lock_in, liquidity) VALUES
-                    (4, 'Aggressive Equity', 'High', 12.0, 300, 'Focuses on high-growth stocks and equity funds. Suitable for users willing to tolerate market volatility for higher returns.', 'Long-term capital appreciation.', '3 years recommended', NULL);
-                INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment, description, goal, lock_in, liquidity) VALUES
-                    (5, 'Global Opportunity Fund', 'High', 10.0, 250, 'Diversified portfolio across international markets and emerging economies. Offers global diversification and currency exposure.', 'Diversified long-term growth.', '3–5 years recommended', NULL);
-                INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment, description, goal, lock_in, liquidity) VALUES
-                    (6, 'Green Future Fund', 'Medium', 7.0, 150, 'Invests in renewable energy, EVs, and sustainable infrastructure. Great for eco-conscious investors seeking moderate returns with positive impact.', 'Ethical investing and stable growth.', '2 years recommended', NULL);
-                INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment, description, goal, lock_in, liquidity) VALUES
-                    (7, 'Digital Assets Index', 'High', 15.0, 200, 'Exposure to leading digital assets (crypto index) with auto-balancing and capped volatility. High reward potential but carries substantial risk.', 'Growth and diversification for tech-savvy investors.', '3–4 years', NULL);
-                INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment, description, goal, lock_in, liquidity) VALUES
-                    (8, 'Real Estate Mini Trust', 'Medium', 8.0, 250, 'Fractional real-estate investment in rental and commercial properties. Provides steady passive income through rent yields.', 'Passive income and inflation hedge.', '2 years', NULL);
-                """)
-                conn.commit()
-        except sqlite3.Error:
-            # Ignore migration errors in dev
-            pass
-        
+        pending = migrations.pending(conn)
+        if pending and app.config["AUTO_MIGRATE"]:
+            migrations.migrate(conn)
+        elif pending:
+            raise RuntimeError(f"Database needs migrating ({', '.join(pending)}); run `python migrations.py`")
+    finally:
         conn.close()
-        print("Database initialized successfully!")
 
-    # Initialize database on startup
-    init_db()
+    # ---------- Instrumentation (/metrics) ----------
+    if app.config["METRICS_ENABLED"]:
+        metrics_registry = metrics.init_app(app)
+        connection_factory = metrics.InstrumentedConnection
+    else:
+        metrics_registry = metrics.Registry()
+        connection_factory = sqlite3.Connection
+
+    # ---------- Pooled DB connections (returned on app-context teardown) ----------
+    db_pool = init_db_pool(app, DB_PATH, factory=connection_factory)
+
+    # ---------- Shared state (sessions, login buckets, cache invalidations) ----------
+    state = sharedstate.open_backend(app.config["STATE_BACKEND"], app.config["STATE_PATH"])
+    app.extensions["shared_state"] = state
+    if not app.secret_key:
+        # The first worker to boot picks the key; the others read it back
+        state.add("app:secret_key", secrets.token_hex(32))
+        app.secret_key = state.get("app:secret_key")
+    if app.config["SESSION_STORE"] == "server":
+        app.session_interface = ServerSessionInterface(state, ttl=app.config["SESSION_TTL"])
+    elif app.config["SESSION_STORE"] != "cookie":
+        raise ValueError(f"unknown SESSION_STORE {app.config['SESSION_STORE']!r}; use server or cookie")
+
+    # ---------- Authentication (bounded hashing pool + login throttling) ----------
+    authenticator = Authenticator(
+        app.config["AUTH_HASH_METHOD"],
+        max_workers=app.config["AUTH_HASH_WORKERS"],
+        max_in_flight=app.config["AUTH_HASH_MAX_IN_FLIGHT"],
+        timeout=app.config["AUTH_HASH_TIMEOUT"],
+    )
+    login_throttle = LoginThrottle(
+        user_burst=app.config["AUTH_USER_BURST"],
+        user_per_minute=app.config["AUTH_USER_PER_MINUTE"],
+        ip_burst=app.config["AUTH_IP_BURST"],
+        ip_per_minute=app.config["AUTH_IP_PER_MINUTE"],
+        backend=state,
+    )
+    app.extensions["authenticator"] = authenticator
+    app.extensions["login_throttle"] = login_throttle
 
-    # ---------- Helper to connect to DB ----------
-    def get_db():
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON;")
-        return conn
+    # ---------- Audit log (write-behind, grouped commits off the request path) ----------
+    audit_sink = audit.open_sink(app.config["AUDIT_SINK"], app.config["AUDIT_PATH"],
+                                 app.config["AUDIT_SEGMENT_BYTES"])
+    audit_log = audit.AuditLog(
+        audit_sink,
+        max_queue=app.config["AUDIT_QUEUE_SIZE"],
+        batch_size=app.config["AUDIT_BATCH_SIZE"],
+        flush_interval=app.config["AUDIT_FLUSH_INTERVAL"],
+        block_timeout=app.config["AUDIT_BLOCK_MS"] / 1000,
+    ) if audit_sink is not None else None
+    app.extensions["audit_log"] = audit_log
+
+    def audit_event(action, user_id=None, **detail):
+        """Queue an audit event for the current request; never blocks on disk."""
+        if audit_log is not None:
+            audit_log.record(action, user_id if user_id is not None else session.get("user_id"),
+                             request.remote_addr, **detail)
+
+    # Rendered fragments shared by every user (invalidated via cache_versions)
+    fragments = FragmentCache()
+    app.extensions["fragments"] = fragments
+
+    def too_many_attempts(template, wait):
+        seconds = math.ceil(wait)
+        flash(f"Too many attempts. Please try again in {seconds} seconds.", "error")
+        response = app.make_response((render_template(template), 429))
+        response.headers["Retry-After"] = str(seconds)
+        return response
+
+    # ---------- Live feed (in-process pub/sub fed by a ledger watcher) ----------
+    broker = Broker(max_subscribers=app.config["FEED_MAX_SUBSCRIBERS"])
+    ledger_watcher = LedgerWatcher(db_pool, broker, interval=app.config["FEED_POLL_INTERVAL"])
+    app.extensions["feed_broker"] = broker
+    app.extensions["ledger_watcher"] = ledger_watcher
 
     # ---------- ROUTES ----------
     @app.route("/")
@@ -138,7 +246,11 @@ def create_app() -> Flask:
                     return render_template("register.html")
 
                 # Hash the password
-                password_hash = generate_password_hash(password)
+                try:
+                    password_hash = authenticator.hash_password(password)
+                except AuthBusy as e:
+                    flash(str(e), "error")
+                    return render_template("register.html"), 503
                 
                 # Insert user
                 cur = db.execute(
@@ -149,12 +261,13 @@ def create_app() -> Flask:
                 
                 # Create account with initial balance
                 acc_no = f"AC{100000 + user_id}"
-                initial_balance = 1000.00  # Give new users $1000 to test with
+                initial_balance = Money.parse("1000.00")  # Give new users $1000 to test with
                 db.execute(
-                    "INSERT INTO accounts (user_id, account_number, balance) VALUES (?, ?, ?)",
+                    "INSERT INTO accounts (user_id, account_number, balance_cents) VALUES (?, ?, ?)",
                     (user_id, acc_no, initial_balance)
                 )
                 db.commit()
+                audit_event("register", user_id, username=username, account_number=acc_no)
                 
                 flash("Registration successful! Please login.", "success")
                 return redirect(url_for("login"))
@@ -163,8 +276,6 @@ def create_app() -> Flask:
                 db.rollback()
                 flash(f"Database error: {str(e)}", "error")
                 return render_template("register.html")
-            finally:
-                db.close()
         
         return render_template("register.html")
 
@@ -174,6 +285,12 @@ def create_app() -> Flask:
             username = request.form["username"]
             password = request.form["password"]
 
+            # Throttled attempts are turned away before any hashing
+            wait = login_throttle.check(username, request.remote_addr or "unknown")
+            if wait:
+                audit_event("login_throttled", username=username)
+                return too_many_attempts("login.html", wait)
+
             db = get_db()
             try:
                 user = db.execute(
@@ -181,20 +298,34 @@ def create_app() -> Flask:
                     (username,)
                 ).fetchone()
 
-                if user and check_password_hash(user["password_hash"], password):
+                try:
+                    ok, new_hash = authenticator.verify(user["password_hash"], password) if user else (False, None)
+                except AuthBusy as e:
+                    flash(str(e), "error")
+                    return render_template("login.html"), 503
+
+                if ok:
+                    if new_hash:
+                        # Upgrade hashes made with older KDF settings
+                        db.execute("UPDATE users SET password_hash = ? WHERE id = ?", (new_hash, user["id"]))
+                        db.commit()
+                    login_throttle.succeeded(username)
+                    # A new session id at login, so an id planted before it is useless
+                    rotate_session(session)
                     session["user_id"] = user["id"]
                     session["username"] = user["username"]
+                    audit_event("login", user["id"], rehashed=bool(new_hash))
                     flash("Login successful!", "success")
                     return redirect(url_for("dashboard"))
                 else:
+                    audit_event("login_failed", user["id"] if user else None, username=username,
+                                reason="bad_password" if user else "unknown_user")
                     flash("Invalid username or password", "error")
                     return render_template("login.html")
                     
             except sqlite3.Error as e:
                 flash(f"Database error: {str(e)}", "error")
                 return render_template("login.html")
-            finally:
-                db.close()
         
         return render_template("login.html")
 
@@ -206,37 +337,21 @@ def create_app() -> Flask:
         
         db = get_db()
         try:
-            account = db.execute(
-                "SELECT account_number, balance FROM accounts WHERE user_id = ?",
-                (session["user_id"],)
-            ).fetchone()
+            # Account header and invested policies in one query
+            view = load_account_view(db, session["user_id"])
             
-            if not account:
+            if not view:
                 flash("Account not found", "error")
                 return redirect(url_for("login"))
             
-            # Fetch user's invested policies (if any)
-            user_policies = db.execute(
-                """
-                SELECT up.invested_at, p.name, p.description, p.risk_level, p.expected_return
-                FROM user_policies up
-                JOIN policies p ON p.id = up.policy_id
-                WHERE up.user_id = ?
-                ORDER BY up.invested_at DESC
-                """,
-                (session["user_id"],)
-            ).fetchall()
-            
             return render_template("dashboard.html", 
                                    username=session["username"],
-                                   account_number=account["account_number"],
-                                   balance=account["balance"],
-                                   user_policies=user_policies)
+                                   account_number=view.account_number,
+                                   balance=view.balance,
+                                   user_policies=view.investments)
         except sqlite3.Error as e:
             flash(f"Database error: {str(e)}", "error")
             return redirect(url_for("login"))
-        finally:
-            db.close()
 
     @app.route("/send_money", methods=["GET", "POST"])
     def send_money():
@@ -248,7 +363,7 @@ def create_app() -> Flask:
         try:
             # Get user's account info
             account = db.execute(
-                "SELECT id, account_number, balance FROM accounts WHERE user_id = ?",
+                "SELECT id, account_number, balance_cents FROM accounts WHERE user_id = ?",
                 (session["user_id"],)
             ).fetchone()
             
@@ -258,8 +373,13 @@ def create_app() -> Flask:
             
             if request.method == "POST":
                 recipient_account = request.form["recipient_account"].strip()
-                amount = float(request.form["amount"])
                 description = request.form.get("description", "").strip()
+                idempotency_key = (request.headers.get("Idempotency-Key")
+                                   or request.form.get("idempotency_key", "")).strip()
+                try:
+                    amount = Money.parse(request.form["amount"])
+                except InvalidMoney:
+                    amount = ZERO
                 
                 # Validate input
                 if not recipient_account:
@@ -267,85 +387,150 @@ def create_app() -> Flask:
                     return render_template("send_money.html", 
                                          username=session["username"],
                                          account_number=account["account_number"],
-                                         balance=account["balance"])
-                
-                if amount <= 0:
-                    flash("Amount must be greater than zero", "error")
-                    return render_template("send_money.html", 
-                                         username=session["username"],
-                                         account_number=account["account_number"],
-                                         balance=account["balance"])
-                
-                if amount > account["balance"]:
-                    flash("Insufficient funds", "error")
-                    return render_template("send_money.html", 
-                                         username=session["username"],
-                                         account_number=account["account_number"],
-                                         balance=account["balance"])
-                
-                # Check if recipient account exists
-                recipient = db.execute(
-                    "SELECT id, account_number FROM accounts WHERE account_number = ?",
-                    (recipient_account,)
-                ).fetchone()
-                
-                if not recipient:
-                    flash("Recipient account not found", "error")
-                    return render_template("send_money.html", 
-                                         username=session["username"],
-                                         account_number=account["account_number"],
-                                         balance=account["balance"])
-                
-                if recipient["id"] == account["id"]:
-                    flash("Cannot send money to yourself", "error")
-                    return render_template("send_money.html", 
-                                         username=session["username"],
-                                         account_number=account["account_number"],
-                                         balance=account["balance"])
+                                         balance=Money(account["balance_cents"]),
+                                         idempotency_key=idempotency_key)
                 
                 # Perform transaction
                 try:
-                    # Update sender's balance
-                    db.execute(
-                        "UPDATE accounts SET balance = balance - ? WHERE id = ?",
-                        (amount, account["id"])
-                    )
-                    
-                    # Update recipient's balance
-                    db.execute(
-                        "UPDATE accounts SET balance = balance + ? WHERE id = ?",
-                        (amount, recipient["id"])
-                    )
-                    
-                    # Record transaction
-                    db.execute(
-                        "INSERT INTO transactions (from_account_id, to_account_id, amount, tx_type, description) VALUES (?, ?, ?, ?, ?)",
-                        (account["id"], recipient["id"], amount, "transfer", description)
+                    result = transfers.transfer(
+                        db, account["id"], recipient_account, amount,
+                        description=description,
+                        idempotency_key=idempotency_key or None,
                     )
-                    
-                    db.commit()
-                    
-                    flash(f"Successfully sent ${amount:.2f} to {recipient_account}", "success")
-                    return redirect(url_for("transaction_history"))
-                    
+                except transfers.TransferError as e:
+                    flash(str(e), "error")
+                    return render_template("send_money.html", 
+                                         username=session["username"],
+                                         account_number=account["account_number"],
+                                         balance=Money(account["balance_cents"]),
+                                         idempotency_key=idempotency_key)
                 except sqlite3.Error as e:
-                    db.rollback()
                     flash(f"Transaction failed: {str(e)}", "error")
                     return render_template("send_money.html", 
                                          username=session["username"],
                                          account_number=account["account_number"],
-                                         balance=account["balance"])
+                                         balance=Money(account["balance_cents"]),
+                                         idempotency_key=idempotency_key)
+
+                audit_event("transfer", transaction_id=result.transaction_id, amount=result.amount,
+                            to_account=recipient_account, replayed=result.replayed)
+                if result.replayed:
+                    flash(f"Transfer of ${result.amount:.2f} to {recipient_account} was already sent", "info")
+                else:
+                    # Push the new transaction to live feeds right away
+                    ledger_watcher.poke()
+                    flash(f"Successfully sent ${amount:.2f} to {recipient_account}", "success")
+                return redirect(url_for("transaction_history"))
             
             return render_template("send_money.html", 
                                    username=session["username"],
                                    account_number=account["account_number"],
-                                   balance=account["balance"])
+                                   balance=Money(account["balance_cents"]),
+                                   idempotency_key=uuid.uuid4().hex)
                                    
         except sqlite3.Error as e:
             flash(f"Database error: {str(e)}", "error")
             return redirect(url_for("dashboard"))
-        finally:
-            db.close()
+
+    @app.route("/api/transfers/batch", methods=["POST"])
+    def transfer_batch_api():
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+
+        fmt = "csv" if request.mimetype == "text/csv" or request.args.get("format") == "csv" else "json"
+        try:
+            items = transfers.parse_batch(request.get_data(), fmt)
+        except transfers.InvalidBatch as e:
+            return {"error": "invalid_batch", "detail": str(e)}, 400
+        if not items:
+            return {"error": "empty_batch"}, 400
+        if len(items) > app.config["BATCH_MAX_ITEMS"]:
+            return {"error": "batch_too_large", "max_items": app.config["BATCH_MAX_ITEMS"]}, 413
+
+        db = get_db()
+        account = db.execute(
+            "SELECT id FROM accounts WHERE user_id = ?",
+            (session["user_id"],)
+        ).fetchone()
+        if not account:
+            return {"error": "account_not_found"}, 404
+
+        batch_key = (request.headers.get("Idempotency-Key") or request.args.get("idempotency_key") or "").strip()
+        results = transfers.transfer_batch(db, account["id"], items, batch_key=batch_key or None)
+        ledger_watcher.poke()
+        summary = transfers.summarize_batch(results)
+        audit_event("transfer_batch", batch_key=batch_key or None, **summary)
+        return {"summary": summary, "items": results}
+
+    @app.cli.command("transfer-batch")
+    @click.argument("source", type=click.File("rb"))
+    @click.option("--from", "from_account", required=True, help="Sender account number, e.g. AC100001.")
+    @click.option("--format", "fmt", type=click.Choice(["json", "csv"]), default=None,
+                  help="Input format; guessed from the file extension if omitted.")
+    @click.option("--key", default=None, help="Idempotency key, so a re-run does not post twice.")
+    def transfer_batch_command(source, from_account, fmt, key):
+        """Post a JSON or CSV batch of transfers from one account."""
+        fmt = fmt or ("csv" if source.name.lower().endswith(".csv") else "json")
+        try:
+            items = transfers.parse_batch(source.read(), fmt)
+        except transfers.InvalidBatch as e:
+            raise click.ClickException(str(e))
+
+        db = get_db()
+        account = db.execute(
+            "SELECT id FROM accounts WHERE account_number = ?", (from_account,)
+        ).fetchone()
+        if not account:
+            raise click.ClickException(f"Account {from_account} not found")
+
+        start = time.perf_counter()
+        results = transfers.transfer_batch(db, account["id"], items, batch_key=key)
+        elapsed = time.perf_counter() - start
+        summary = transfers.summarize_batch(results)
+        for r in results:
+            if r["status"] == "rejected":
+                click.echo(f"row {r['index']}: {r['recipient_account']} {r['amount']} rejected ({r['error']})", err=True)
+        click.echo(json.dumps(summary, default=str))
+        if summary["posted"]:
+            click.echo(f"Posted {summary['posted']} transfers in {elapsed:.3f}s "
+                       f"({summary['posted'] / elapsed:.0f}/s)")
+
+    @app.cli.command("import-users")
+    @click.argument("source", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), default=None,
+                  help="Input format; guessed from the file extension if omitted.")
+    @click.option("--run-id", default=None,
+                  help="Names the import for resuming; defaults to the file name and size.")
+    @click.option("--workers", type=int, default=None, help="Hashing processes (default: CPU count).")
+    @click.option("--batch-size", type=int, default=1000, help="Users per transaction.")
+    @click.option("--balance", "default_balance", default="0",
+                  help="Opening balance for rows without a balance column.")
+    @click.option("--hash-method", default=None, help="werkzeug hash method (default AUTH_HASH_METHOD).")
+    def import_users_command(source, fmt, run_id, workers, batch_size, default_balance, hash_method):
+        """Create users and accounts in bulk from a CSV or JSONL file."""
+        try:
+            default_balance = Money.parse(default_balance)
+        except InvalidMoney as e:
+            raise click.ClickException(str(e))
+        run_id = run_id or f"{os.path.basename(source)}:{os.path.getsize(source)}"
+
+        def progress(stats):
+            click.echo(f"{stats.resumed_from + stats.read} rows, {stats.imported} imported "
+                       f"({stats.rate:.0f} rows/s)", err=True)
+
+        stats = importer.import_users(
+            get_db(), importer.read_rows(source, fmt), run_id, source=source,
+            hash_method=hash_method or app.config["AUTH_HASH_METHOD"], workers=workers,
+            batch_size=batch_size, default_balance=default_balance, progress=progress,
+        )
+        if not stats.read and stats.resumed_from:
+            click.echo(f"Run {run_id} already finished ({stats.resumed_from} rows)")
+            return
+        for row_number, reason in stats.rejected:
+            click.echo(f"row {row_number}: {reason}", err=True)
+        click.echo(f"Imported {stats.imported} of {stats.read} rows in {stats.elapsed:.2f}s "
+                   f"({stats.rate:.0f} rows/s); {stats.duplicates} duplicates, {stats.invalid} invalid"
+                   + (f"; resumed after row {stats.resumed_from}" if stats.resumed_from else ""))
 
     @app.route("/transaction_history")
     def transaction_history():
@@ -357,7 +542,7 @@ def create_app() -> Flask:
         try:
             # Get user's account info
             account = db.execute(
-                "SELECT id, account_number, balance FROM accounts WHERE user_id = ?",
+                "SELECT id, account_number, balance_cents FROM accounts WHERE user_id = ?",
                 (session["user_id"],)
             ).fetchone()
             
@@ -365,37 +550,241 @@ def create_app() -> Flask:
                 flash("Account not found", "error")
                 return redirect(url_for("login"))
             
-            # Get all transactions for this account
-            transactions = db.execute("""
-                SELECT 
-                    t.id,
-                    t.amount,
-                    t.tx_type,
-                    t.description,
-                    t.created_at,
-                    t.from_account_id,
-                    t.to_account_id,
-                    fa.account_number as from_account_number,
-                    ta.account_number as to_account_number
-                FROM transactions t
-                LEFT JOIN accounts fa ON t.from_account_id = fa.id
-                LEFT JOIN accounts ta ON t.to_account_id = ta.id
-                WHERE t.from_account_id = ? OR t.to_account_id = ?
-                ORDER BY t.created_at DESC
-            """, (account["id"], account["id"])).fetchall()
-            
+            # Rows are loaded page by page from /api/transactions
             return render_template("transaction_history.html", 
                                    username=session["username"],
                                    account_number=account["account_number"],
-                                   balance=account["balance"],
+                                   balance=Money(account["balance_cents"]),
                                    account_id=account["id"],
-                                   transactions=transactions)
+                                   page_size=history.DEFAULT_PAGE_SIZE)
                                    
         except sqlite3.Error as e:
             flash(f"Database error: {str(e)}", "error")
             return redirect(url_for("dashboard"))
-        finally:
-            db.close()
+
+    @app.route("/api/transactions")
+    def transactions_api():
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+
+        filters = {
+            "date_from": request.args.get("from", "").strip(),
+            "date_to": request.args.get("to", "").strip(),
+            "tx_type": request.args.get("type", "").strip(),
+            "search": request.args.get("q", "").strip(),
+        }
+        for value in (filters["date_from"], filters["date_to"]):
+            if value:
+                try:
+                    date.fromisoformat(value)
+                except ValueError:
+                    return {"error": "invalid_date", "value": value}, 400
+        try:
+            limit = int(request.args.get("limit", history.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return {"error": "invalid_limit"}, 400
+
+        db = get_db(readonly=True)
+        account = db.execute(
+            "SELECT id FROM accounts WHERE user_id = ?",
+            (session["user_id"],)
+        ).fetchone()
+        if not account:
+            return {"error": "account_not_found"}, 404
+
+        try:
+            page = history.fetch_page(db, account["id"], request.args.get("cursor"), filters, limit)
+        except history.InvalidCursor:
+            return {"error": "invalid_cursor"}, 400
+        return page
+
+    @app.route("/api/transactions/export")
+    def transactions_export_api():
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+
+        fmt = request.args.get("format", "csv")
+        if fmt not in exports.FORMATS:
+            return {"error": "invalid_format", "formats": sorted(exports.FORMATS)}, 400
+        filters = {
+            "date_from": request.args.get("from", "").strip(),
+            "date_to": request.args.get("to", "").strip(),
+        }
+        for value in filters.values():
+            if value:
+                try:
+                    date.fromisoformat(value)
+                except ValueError:
+                    return {"error": "invalid_date", "value": value}, 400
+        resume = request.args.get("resume") or None
+        if resume:
+            try:
+                history.decode_cursor(resume)
+            except history.InvalidCursor:
+                return {"error": "invalid_resume_token"}, 400
+        compress = request.args.get("gzip") in ("1", "true", "yes")
+
+        # Exports can stream for minutes; they read from the read pool so they
+        # never hold a connection transfers need
+        db = get_db(readonly=True)
+        account = db.execute(
+            "SELECT id, account_number FROM accounts WHERE user_id = ?",
+            (session["user_id"],)
+        ).fetchone()
+        if not account:
+            return {"error": "account_not_found"}, 404
+
+        mimetype, ext = exports.FORMATS[fmt]
+        filename = "statement-{}{}{}.{}".format(
+            account["account_number"],
+            f"-from-{filters['date_from']}" if filters["date_from"] else "",
+            f"-to-{filters['date_to']}" if filters["date_to"] else "",
+            ext + (".gz" if compress else ""),
+        )
+        # stream_with_context keeps the pooled connection checked out until the
+        # last chunk is sent
+        body = exports.export_stream(db, account["id"], fmt, filters, resume, compress)
+        response = Response(stream_with_context(body),
+                            mimetype="application/gzip" if compress else mimetype)
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    @app.route("/api/accounts/<int:account_id>/summary")
+    def account_summary_api(account_id):
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+
+        db = get_db(readonly=True)
+        owned = db.execute(
+            "SELECT 1 FROM accounts WHERE id = ? AND user_id = ?",
+            (account_id, session["user_id"])
+        ).fetchone()
+        if not owned:
+            return {"error": "account_not_found"}, 404
+
+        return summaries.range_totals(
+            db, account_id,
+            request.args.get("from", "").strip() or None,
+            request.args.get("to", "").strip() or None,
+        )
+
+    @app.route("/api/balance")
+    def balance_api():
+        """Current balance only, so refresh buttons need not reload the page.
+
+        ``?at=YYYY-MM-DD`` (or a full timestamp) returns the balance at the end
+        of that day instead, from the postings ledger.
+        """
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+
+        at = request.args.get("at", "").strip()
+        db = get_db(readonly=bool(at))
+        if at:
+            try:
+                at = ledger.parse_point_in_time(at)
+            except ValueError:
+                return {"error": "invalid_date", "value": request.args["at"]}, 400
+            account = db.execute(
+                "SELECT id, account_number FROM accounts WHERE user_id = ?", (session["user_id"],)
+            ).fetchone()
+            if not account:
+                return {"error": "account_not_found"}, 404
+            balance = ledger.balance_at(db, account["id"], at)
+            body = {"account_number": account["account_number"], "at": at,
+                    "balance": balance, "balance_cents": balance.cents}
+        else:
+            view = load_account_view(db, session["user_id"], with_investments=False)
+            if not view:
+                return {"error": "account_not_found"}, 404
+            body = {"account_number": view.account_number, "balance": view.balance,
+                    "balance_cents": view.balance.cents}
+        response = app.json.response(body)
+        response.headers["Cache-Control"] = "no-cache"
+        response.add_etag()
+        return response.make_conditional(request)
+
+    @app.route("/api/feed")
+    def feed_api():
+        """Server-Sent Events with new transactions and balances for this account."""
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+
+        account = get_db().execute(
+            "SELECT id FROM accounts WHERE user_id = ?", (session["user_id"],)
+        ).fetchone()
+        if not account:
+            return {"error": "account_not_found"}, 404
+        # An idle stream must not hold a pooled connection
+        release_db()
+
+        try:
+            subscription = broker.subscribe(account["id"])
+        except FeedFull as e:
+            return {"error": "feed_full", "detail": str(e)}, 503
+        ledger_watcher.start()
+        heartbeat = app.config["FEED_HEARTBEAT"]
+
+        def events():
+            try:
+                # Tell EventSource how long to wait before reconnecting
+                yield "retry: 5000\n\n"
+                while not subscription.closed:
+                    batch = subscription.wait(heartbeat)
+                    if not batch:
+                        yield ": keep-alive\n\n"
+                        continue
+                    yield "".join(f"event: {event}\ndata: {json.dumps(data)}\n\n" for event, data in batch)
+            finally:
+                broker.unsubscribe(subscription)
+
+        response = Response(events(), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+    @app.cli.command("rebuild-summaries")
+    @click.option("--account", "account_number", default=None,
+                  help="Only rebuild this account number, e.g. AC100001.")
+    def rebuild_summaries_command(account_number):
+        """Recompute account_daily_summary from the transactions table."""
+        db = get_db()
+        account_id = None
+        if account_number:
+            row = db.execute(
+                "SELECT id FROM accounts WHERE account_number = ?", (account_number,)
+            ).fetchone()
+            if not row:
+                raise click.ClickException(f"Account {account_number} not found")
+            account_id = row["id"]
+        start = time.perf_counter()
+        written = summaries.rebuild(db, account_id)
+        click.echo(f"Wrote {written} summary rows in {time.perf_counter() - start:.2f}s")
+
+    @app.cli.command("ledger-checkpoint")
+    @click.option("--every", type=int, default=None,
+                  help="Postings between checkpoints (default LEDGER_CHECKPOINT_EVERY).")
+    def ledger_checkpoint_command(every):
+        """Write balance checkpoints for postings added since the last run."""
+        start = time.perf_counter()
+        written = ledger.write_checkpoints(get_db(), every or app.config["LEDGER_CHECKPOINT_EVERY"])
+        click.echo(f"Wrote {written} checkpoints in {time.perf_counter() - start:.2f}s")
+
+    @app.cli.command("ledger-verify")
+    @click.option("--limit", type=int, default=50, help="Mismatching accounts to list.")
+    def ledger_verify_command(limit):
+        """Recompute every balance from postings and report accounts that disagree."""
+        start = time.perf_counter()
+        report = ledger.verify(get_db(), limit=limit)
+        elapsed = time.perf_counter() - start
+        for m in report.mismatches:
+            click.echo(f"{m.account_number or f'#{m.account_id} (no account)'}: "
+                       f"balance {m.stored}, postings {m.computed}, off by {m.stored - m.computed}")
+        click.echo(f"Checked {report.accounts} accounts in {elapsed:.2f}s; "
+                   f"{report.mismatch_count} mismatched; postings imbalance {report.imbalance}")
+        if not report.ok:
+            raise click.ClickException("ledger does not reconcile")
 
     @app.route("/profile", methods=["GET", "POST"])
     def profile():
@@ -424,6 +813,8 @@ def create_app() -> Flask:
                         (email if email else None, phone if phone else None, session["user_id"])
                     )
                     db.commit()
+                    # Which fields were set, not their values
+                    audit_event("profile_update", email=bool(email), phone=bool(phone))
                     flash("Profile updated successfully!", "success")
                     return redirect(url_for("profile"))
                 
@@ -452,18 +843,32 @@ def create_app() -> Flask:
                         (session["user_id"],)
                     ).fetchone()
                     
-                    # Verify current password
-                    if not check_password_hash(user["password_hash"], current_password):
-                        flash("Current password is incorrect", "error")
+                    # Current-password guesses share the login limits
+                    wait = login_throttle.check(session["username"], request.remote_addr or "unknown")
+                    if wait:
+                        flash(f"Too many attempts. Please try again in {math.ceil(wait)} seconds.", "error")
+                        return redirect(url_for("profile"))
+
+                    # Verify current password, then hash the new one
+                    try:
+                        ok, _ = authenticator.verify(user["password_hash"], current_password, rehash=False)
+                        if not ok:
+                            audit_event("password_change_failed", reason="bad_password")
+                            flash("Current password is incorrect", "error")
+                            return redirect(url_for("profile"))
+                        new_password_hash = authenticator.hash_password(new_password)
+                    except AuthBusy as e:
+                        flash(str(e), "error")
                         return redirect(url_for("profile"))
+                    login_throttle.succeeded(session["username"])
                     
                     # Update password
-                    new_password_hash = generate_password_hash(new_password)
                     db.execute(
                         "UPDATE users SET password_hash = ? WHERE id = ?",
                         (new_password_hash, session["user_id"])
                     )
                     db.commit()
+                    audit_event("password_change")
                     flash("Password changed successfully!", "success")
                     return redirect(url_for("profile"))
             
@@ -475,7 +880,7 @@ def create_app() -> Flask:
             
             # Get account info
             account = db.execute(
-                "SELECT account_number, balance FROM accounts WHERE user_id = ?",
+                "SELECT account_number, balance_cents FROM accounts WHERE user_id = ?",
                 (session["user_id"],)
             ).fetchone()
             
@@ -485,13 +890,11 @@ def create_app() -> Flask:
                                    phone=user["phone"] or "",
                                    created_at=user["created_at"],
                                    account_number=account["account_number"],
-                                   balance=account["balance"])
+                                   balance=Money(account["balance_cents"]))
                                    
         except sqlite3.Error as e:
             flash(f"Database error: {str(e)}", "error")
             return redirect(url_for("dashboard"))
-        finally:
-            db.close()
 
     @app.route("/policies", methods=["GET", "POST"])
     def policies():
@@ -500,73 +903,184 @@ def create_app() -> Flask:
             return redirect(url_for("login"))
 
         db = get_db()
-        try:
-            # Get account for header
-            account = db.execute(
-                "SELECT account_number, balance FROM accounts WHERE user_id = ?",
-                (session["user_id"],)
-            ).fetchone()
 
-            if request.method == "POST":
-                policy_id = request.form.get("policy_id")
-                if not policy_id:
-                    flash("No policy selected", "error")
-                    return redirect(url_for("policies"))
-
-                # Check current count
-                count_row = db.execute(
-                    "SELECT COUNT(*) AS c FROM user_policies WHERE user_id = ?",
-                    (session["user_id"],)
-                ).fetchone()
-                if count_row["c"] >= 2:
-                    flash("You can invest in at most 2 policies", "error")
-                    return redirect(url_for("policies"))
+        if request.method == "POST":
+            try:
+                policy_id = int(request.form.get("policy_id", ""))
+            except ValueError:
+                flash("No policy selected", "error")
+                return redirect(url_for("policies"))
+            amount = request.form.get("amount", "").strip() or None
+            redeem = request.form.get("action") == "redeem"
 
-                # Insert selection
-                try:
-                    db.execute(
-                        "INSERT INTO user_policies (user_id, policy_id) VALUES (?, ?)",
-                        (session["user_id"], int(policy_id))
-                    )
-                    db.commit()
-                    flash("Policy added to your investments", "success")
-                except sqlite3.IntegrityError as ie:
-                    msg = str(ie)
-                    if "at most 2" in msg:
-                        flash("You can invest in at most 2 policies", "error")
-                    elif "UNIQUE" in msg:
-                        flash("You have already invested in this policy", "info")
-                    else:
-                        flash(f"Unable to invest: {msg}", "error")
+            account = db.execute("SELECT id FROM accounts WHERE user_id = ?", (session["user_id"],)).fetchone()
+            if not account:
+                flash("Account not found", "error")
+                return redirect(url_for("login"))
+            try:
+                if redeem:
+                    result = investments.redeem(db, session["user_id"], account["id"], policy_id, amount)
+                else:
+                    result = investments.invest(db, session["user_id"], account["id"], policy_id, amount,
+                                                max_holdings=app.config["INVEST_MAX_POLICIES"])
+            except investments.InvestmentError as e:
+                flash(str(e), "error")
                 return redirect(url_for("policies"))
+            except sqlite3.Error as e:
+                flash(f"Unable to update your investments: {e}", "error")
+                return redirect(url_for("policies"))
+
+            ledger_watcher.poke()
+            if redeem:
+                audit_event("policy_redeem", policy_id=policy_id, amount=result.amount, closed=result.closed)
+                flash(f"Redeemed ${result.amount} to your account", "success")
+            else:
+                audit_event("policy_invest", policy_id=policy_id, amount=result.amount, opened=result.opened)
+                flash(f"Invested ${result.amount}" + ("" if result.opened else " more") + " in the policy", "success")
+            return redirect(url_for("policies"))
+
+        # Header and the user's policies in one query
+        view = load_account_view(db, session["user_id"])
 
-            # Fetch available policies
+        # The catalog is the same for everyone; it is re-rendered only after
+        # the policies table changes
+        def render_catalog():
             all_policies = db.execute(
-                "SELECT id, name, description, risk_level, expected_return, min_investment, goal, lock_in, liquidity FROM policies ORDER BY id"
+                "SELECT id, name, description, risk_level, expected_return, min_investment_cents, goal, lock_in, liquidity FROM policies ORDER BY id"
             ).fetchall()
+            return render_template("_policy_catalog.html", policies=all_policies)
 
-            # Fetch user's policies
-            user_policies = db.execute(
-                """
-                SELECT p.id, p.name, p.description, p.risk_level, p.expected_return, p.min_investment, p.goal, p.lock_in, p.liquidity, up.invested_at
-                FROM user_policies up
-                JOIN policies p ON p.id = up.policy_id
-                WHERE up.user_id = ?
-                ORDER BY up.invested_at DESC
-                """,
-                (session["user_id"],)
+        return render_template(
+            "policies.html",
+            username=session["username"],
+            account_number=view.account_number,
+            balance=view.balance,
+            policy_catalog=fragments.get(db, "policies", render_catalog),
+            user_policies=view.investments
+        )
+
+    @app.route("/api/investments", methods=["GET", "POST"])
+    def investments_api():
+        """GET lists the user's holdings; POST ``{policy_id, amount?}`` invests (amount defaults to the minimum)."""
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+        db = get_db()
+        if request.method == "GET":
+            return {"holdings": investments.holdings(db, session["user_id"]),
+                    "max_policies": app.config["INVEST_MAX_POLICIES"]}
+        return investment_action(db, investments.invest, max_holdings=app.config["INVEST_MAX_POLICIES"])
+
+    @app.route("/api/investments/redeem", methods=["POST"])
+    def redeem_api():
+        """POST ``{policy_id, amount?}``; without an amount the whole holding is redeemed."""
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+        return investment_action(get_db(), investments.redeem)
+
+    def investment_action(db, action, **kwargs):
+        body = request.get_json(silent=True) or {}
+        try:
+            policy_id = int(body.get("policy_id"))
+        except (TypeError, ValueError):
+            return {"error": "invalid_policy_id"}, 400
+        amount = body.get("amount")
+        account = db.execute("SELECT id FROM accounts WHERE user_id = ?", (session["user_id"],)).fetchone()
+        if not account:
+            return {"error": "account_not_found"}, 404
+        try:
+            result = action(db, session["user_id"], account["id"], policy_id,
+                            None if amount is None else str(amount), **kwargs)
+        except investments.InvestmentError as e:
+            return {"error": e.code, "detail": str(e)}, e.status
+        ledger_watcher.poke()
+        redeemed = action is investments.redeem
+        audit_event("policy_redeem" if redeemed else "policy_invest", policy_id=policy_id, amount=result.amount,
+                    **({"closed": result.closed} if redeemed else {"opened": result.opened}))
+        return {
+            "policy_id": result.policy_id,
+            "amount": result.amount,
+            "holding": result.holding,
+            "transaction_id": result.transaction_id,
+            "opened": result.opened,
+            "closed": result.closed,
+        }
+
+    def get_projector():
+        projector = app.extensions.get("projector")
+        if projector is None:
+            # NumPy adds ~100 ms to a worker boot, so it is loaded on first use
+            import projection
+            projector = app.extensions.setdefault(
+                "projector", projection.Projector(app.config["PROJECTION_CACHE_SIZE"]))
+        return projector
+
+    @app.route("/api/policies/projection")
+    def policy_projection_api():
+        """Projected value bands for policies: ``?ids=1,3`` or ``ids=all``, else the user's holdings.
+
+        ``years`` and ``paths`` set the horizon and Monte Carlo paths, and
+        ``amount`` the sum invested (default: each policy's minimum).
+        """
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+
+        max_years, max_paths = app.config["PROJECTION_MAX_YEARS"], app.config["PROJECTION_MAX_PATHS"]
+        try:
+            years = int(request.args.get("years", 10))
+            paths = int(request.args.get("paths", max_paths))
+        except ValueError:
+            return {"error": "invalid_horizon"}, 400
+        if not 1 <= years <= max_years:
+            return {"error": "invalid_horizon", "max_years": max_years}, 400
+        if not 100 <= paths <= max_paths:
+            return {"error": "invalid_paths", "min_paths": 100, "max_paths": max_paths}, 400
+        amount = None
+        if request.args.get("amount"):
+            try:
+                amount = Money.parse(request.args["amount"])
+            except InvalidMoney:
+                amount = ZERO
+            if amount <= ZERO:
+                return {"error": "invalid_amount"}, 400
+
+        columns = "p.id, p.name, p.risk_level, p.expected_return, p.min_investment_cents"
+        ids = request.args.get("ids", "").strip()
+        db = get_db(readonly=True)
+        if ids == "all":
+            rows = db.execute(f"SELECT {columns} FROM policies p ORDER BY p.id").fetchall()
+        elif ids:
+            try:
+                wanted = sorted({int(x) for x in ids.split(",") if x.strip()})
+            except ValueError:
+                return {"error": "invalid_ids"}, 400
+            rows = db.execute(
+                f"SELECT {columns} FROM policies p WHERE p.id IN (SELECT value FROM json_each(?)) ORDER BY p.id",
+                (json.dumps(wanted),),
             ).fetchall()
+        else:
+            rows = db.execute(
+                f"SELECT {columns} FROM user_policies up JOIN policies p ON p.id = up.policy_id "
+                "WHERE up.user_id = ? ORDER BY p.id",
+                (session["user_id"],),
+            ).fetchall() or db.execute(f"SELECT {columns} FROM policies p ORDER BY p.id").fetchall()
+        if not rows:
+            return {"error": "policy_not_found"}, 404
 
-            return render_template(
-                "policies.html",
-                username=session["username"],
-                account_number=account["account_number"],
-                balance=account["balance"],
-                policies=all_policies,
-                user_policies=user_policies
-            )
-        finally:
-            db.close()
+        projected = get_projector().project([dict(r) for r in rows], years, paths)
+        out = []
+        for row, proj in zip(rows, projected):
+            invested = amount or Money(row["min_investment_cents"] or 0)
+            out.append({
+                "id": row["id"],
+                "name": row["name"],
+                "risk_level": row["risk_level"],
+                "expected_return": row["expected_return"],
+                "volatility": proj["volatility"],
+                "invested": invested,
+                "bands_cents": {k: [round(invested.cents * m) for m in v] for k, v in proj["bands"].items()},
+                "probability_of_loss": proj["probability_of_loss"],
+            })
+        return {"years": years, "paths": paths, "percentiles": list(get_projector().percentiles), "policies": out}
 
     @app.route("/chatbot")
     def chatbot():
@@ -574,62 +1088,130 @@ def create_app() -> Flask:
             flash("Please login first", "error")
             return redirect(url_for("login"))
 
-        db = get_db()
-        try:
-            account = db.execute(
-                "SELECT account_number, balance FROM accounts WHERE user_id = ?",
-                (session["user_id"],)
-            ).fetchone()
-            return render_template(
-                "chatbot.html",
-                username=session["username"],
-                account_number=account["account_number"],
-                balance=account["balance"]
-            )
-        finally:
-            db.close()
-
-    def call_gemini_api(messages: list, policy_list: list, user_context: dict) -> str:
+        view = load_account_view(get_db(), session["user_id"], with_investments=False)
+        return render_template(
+            "chatbot.html",
+            username=session["username"],
+            account_number=view.account_number,
+            balance=view.balance
+        )
+
+    # Chatbot calls run on their own bounded pool, never on the request worker
+    chat_service = ChatService(
+        model,
+        max_workers=app.config["CHAT_MAX_WORKERS"],
+        max_in_flight=app.config["CHAT_MAX_IN_FLIGHT"],
+        timeout=app.config["CHAT_TIMEOUT"],
+    )
+    app.extensions["chat_service"] = chat_service
+    policy_catalog = PolicyCatalogCache()
+    reply_cache = ResponseCache(app.config["CHAT_CACHE_SIZE"], app.config["CHAT_CACHE_TTL"])
+    app.extensions["chat_reply_cache"] = reply_cache
+    recommender = Recommender()
+
+    sync_worker_warned = threading.Event()
+
+    def check_worker():
+        """Warn once per process when model calls tie up a sync worker for a whole reply."""
+        if not sync_worker_warned.is_set() and is_blocking_worker(request.environ):
+            sync_worker_warned.set()
+            app.logger.warning("Chatbot replies are being served by gunicorn's sync worker; each one "
+                               "holds the whole worker. Start gunicorn with gunicorn.conf.py (gthread).")
+
+    def call_gemini_api(messages: list, policy_block: str, user_context: dict) -> str:
         """
         Calls the Gemini API using the 'google-generativeai' library.
+        Identical prompts are answered from the reply cache.
+        Raises ChatBusy / ChatTimeout when the chat pool cannot serve the call.
         """
-        global model # Access the model we created in create_app
-        if model is None:
+        if chat_service.model is None:
             return "Gemini API is not configured on the server."
 
-        # Build the system instruction and prompt
-        system_instructions = (
-            "You are an AI investment assistant for Apex Bank. "
-            "First, ask the user about their preferences (risk level, time horizon, liquidity needs). "
-            "Then, recommend the top two policies from the provided list that best match. "
-            "Respond clearly with brief reasoning and the two choices."
-        )
-
-        # Create a combined prompt for the model
-        full_prompt = (
-            f"{system_instructions}\n\n"
-            f"--- AVAILABLE POLICIES ---\n{json.dumps(policy_list, indent=2)}\n\n"
-            f"--- USER CONTEXT ---\n{json.dumps(user_context, indent=2)}\n\n"
-            f"--- CONVERSATION HISTORY ---\n"
-        )
-
-        # Add conversation history
-        for m in messages:
-            # Change 'model' to 'assistant' for the prompt
-            role = m.get("role", "user").replace("model", "assistant")
-            full_prompt += f"{role}: {m.get('content', '')}\n"
-    
-        # Add the final "assistant:" prefix to prompt the model to respond
-        full_prompt += "assistant:"
-
+        full_prompt = build_prompt(messages, policy_block, user_context)
+        key = prompt_key(full_prompt)
+        cached = reply_cache.get(key)
+        if cached is not None:
+            metrics_registry.record_chat_reply("cache")
+            return cached
+        check_worker()
         try:
-            # The library's generate_content method is much simpler
-            response = model.generate_content(full_prompt)
-            return response.text
+            metrics_registry.record_chat_reply("model")
+            with metrics.timed_gemini(metrics_registry):
+                reply = chat_service.complete(full_prompt)
+        except ChatUnavailable:
+            raise
         except Exception as e:
             # Handle potential API errors
-            print(f"Gemini API Error: {e}")
+            app.logger.exception("Gemini API error")
             return f"Gemini API error: {str(e)}"
+        reply_cache.put(key, reply)
+        return reply
+
+    def load_chat_context(db):
+        """Policy catalog (as a list and serialized) and the user's own context for the prompt."""
+        # The catalog block is only rebuilt after the policies table changes
+        policies, policy_block = policy_catalog.get(db)
+
+        # Load user context
+        account = db.execute(
+            "SELECT account_number, balance_cents FROM accounts WHERE user_id = ?",
+            (session["user_id"],)
+        ).fetchone()
+        user_pols = db.execute(
+            """
+            SELECT p.id, p.name, p.risk_level, p.expected_return, p.min_investment_cents, up.invested_at
+            FROM user_policies up
+            JOIN policies p ON p.id = up.policy_id
+            WHERE up.user_id = ?
+            ORDER BY up.invested_at DESC
+            """,
+            (session["user_id"],)
+        ).fetchall()
+        user_context = {
+            "username": session.get("username"),
+            "balance": str(Money(account["balance_cents"])) if account else None,
+            "invested_policies": [money_fields(dict(x)) for x in user_pols]
+        }
+        return policies, policy_block, user_context
+
+    def rule_reply(message, history, policies, user_context):
+        """A local answer to a clear recommendation request, or None to ask the model."""
+        if not app.config["CHAT_RULES"]:
+            return None
+        balance = Money.parse(user_context["balance"]) if user_context["balance"] else ZERO
+        held = {p["id"] for p in user_context["invested_policies"]}
+        reply = recommender.recommend(message, history, policies, balance, held,
+                                      max_holdings=app.config["INVEST_MAX_POLICIES"])
+        if reply is not None:
+            metrics_registry.record_chat_reply("rules")
+        return reply
+
+    def conversation_id(db):
+        """The user's conversation from the cookie, starting one if needed."""
+        # Sessions from before server-side history carried the whole chat
+        session.pop("chat_history", None)
+        chat_id = session.get("chat_id")
+        if not chat_id or not chat_history.owns_conversation(db, chat_id, session["user_id"]):
+            chat_id = chat_history.start_conversation(db, session["user_id"])
+            session["chat_id"] = chat_id
+        return chat_id
+
+    def history_with(db, chat_id, user_message):
+        """The capped history window for the prompt, ending with ``user_message``."""
+        return chat_history.load_window(
+            db, chat_id, app.config["CHAT_HISTORY_MAX_TURNS"], app.config["CHAT_HISTORY_MAX_TOKENS"],
+            pending={"role": "user", "content": user_message},
+        )
+
+    def record_exchange(db, chat_id, user_message, reply):
+        """Store a user turn together with its reply.
+
+        Nothing is stored before the reply exists, so a busy or timed-out
+        model leaves no unanswered turn in the history.
+        """
+        max_turns = app.config["CHAT_HISTORY_MAX_TURNS"]
+        chat_history.append_message(db, chat_id, "user", user_message, max_turns)
+        chat_history.append_message(db, chat_id, "model", reply, max_turns)
 
     @app.route("/api/chatbot", methods=["POST"])
     def chatbot_api():
@@ -642,51 +1224,141 @@ def create_app() -> Flask:
             return {"error": "empty_message"}, 400
 
         db = get_db()
-        try:
-            # Load policy list
-            policies = db.execute(
-                "SELECT id, name, description, risk_level, expected_return, min_investment, goal, lock_in, liquidity FROM policies ORDER BY id"
-            ).fetchall()
-            policy_list = [dict(p) for p in policies]
+        policies, policy_block, user_context = load_chat_context(db)
 
-            # Load user context
-            account = db.execute(
-                "SELECT account_number, balance FROM accounts WHERE user_id = ?",
-                (session["user_id"],)
-            ).fetchone()
-            user_pols = db.execute(
-                """
-                SELECT p.id, p.name, p.risk_level, p.expected_return, p.min_investment, up.invested_at
-                FROM user_policies up
-                JOIN policies p ON p.id = up.policy_id
-                WHERE up.user_id = ?
-                ORDER BY up.invested_at DESC
-                """,
-                (session["user_id"],)
-            ).fetchall()
-            user_context = {
-                "username": session.get("username"),
-                "balance": account["balance"] if account else None,
-                "invested_policies": [dict(x) for x in user_pols]
-            }
+        # History lives server-side; the cookie only holds the conversation id
+        chat_id = conversation_id(db)
+        history = history_with(db, chat_id, user_message)
+
+        reply_text = rule_reply(user_message, history, policies, user_context)
+        if reply_text is None:
+            try:
+                reply_text = call_gemini_api(history, policy_block, user_context)
+            except ChatUnavailable as e:
+                return {"error": e.code, "detail": str(e)}, e.status
+
+        record_exchange(db, chat_id, user_message, reply_text)
+
+        return {"reply": reply_text}
+
+    @app.route("/api/chatbot/stream", methods=["POST"])
+    def chatbot_stream_api():
+        """Same as /api/chatbot, but streams the reply as Server-Sent Events."""
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+
+        body = request.get_json(silent=True) or {}
+        user_message = (body.get("message") or "").strip()
+        if not user_message:
+            return {"error": "empty_message"}, 400
+
+        db = get_db()
+        policies, policy_block, user_context = load_chat_context(db)
+        chat_id = conversation_id(db)
+        history = history_with(db, chat_id, user_message)
+
+        # A rule-based answer goes out like a memoized one
+        cached = rule_reply(user_message, history, policies, user_context)
+        if cached is None:
+            if chat_service.model is None:
+                return {"error": "chat_unavailable", "detail": "Gemini API is not configured on the server."}, 503
+            full_prompt = build_prompt(history, policy_block, user_context)
+            key = prompt_key(full_prompt)
+            cached = reply_cache.get(key)
+            metrics_registry.record_chat_reply("model" if cached is None else "cache")
+        if cached is None:
+            try:
+                check_worker()
+                chunks = chat_service.stream(full_prompt)
+            except ChatUnavailable as e:
+                return {"error": e.code, "detail": str(e)}, e.status
+
+        def sse(event, data):
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+        def events():
+            parts = []
+            try:
+                if cached is None:
+                    # Spans the whole streamed reply, first token to last
+                    with metrics.timed_gemini(metrics_registry):
+                        for text in chunks:
+                            parts.append(text)
+                            yield sse("token", {"text": text})
+                else:
+                    # A memoized or rule-based reply goes out as a single token
+                    parts.append(cached)
+                    yield sse("token", {"text": cached})
+                if cached is None and parts:
+                    reply_cache.put(key, "".join(parts))
+            except ChatUnavailable as e:
+                yield sse("error", {"error": e.code, "detail": str(e)})
+            except Exception as e:
+                app.logger.exception("Gemini API error")
+                yield sse("error", {"error": "chat_failed", "detail": f"Gemini API error: {e}"})
+            reply = "".join(parts)
+            if reply:
+                # A fresh connection just for the write, handed back right away
+                record_exchange(get_db(), chat_id, user_message, reply)
+                release_db()
+            yield sse("done", {"reply": reply})
+
+        # The reply can stream for as long as CHAT_TIMEOUT; it must not hold a
+        # pooled connection the banking routes need meanwhile
+        release_db()
+        response = Response(stream_with_context(events()), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+    @app.route("/api/chatbot/cache")
+    def chatbot_cache_stats():
+        """Hit rate and size of the reply cache, policy catalog rebuilds, and replies by source."""
+        if "user_id" not in session:
+            return {"error": "unauthorized"}, 401
+        stats = reply_cache.stats()
+        stats["policy_catalog_rebuilds"] = policy_catalog.rebuilds
+        replies = dict(metrics_registry.chat_replies)
+        stats["replies"] = replies
+        answered = sum(replies.values())
+        stats["model_call_rate"] = round(replies.get("model", 0) / answered, 4) if answered else 0.0
+        return stats
 
-            # Maintain chat history in session
-            history = session.get("chat_history", [])
-            history.append({"role": "user", "content": user_message})
+    # ---------- Cache invalidation across workers ----------
+    # `flask cache-invalidate` publishes to the "cache" channel; every worker
+    # drops the named in-process cache on its next request
+    def drop_cache(body):
+        name = json.loads(body).get("cache")
+        if name in ("replies", "all"):
+            reply_cache.clear()
+        if name in ("projections", "all") and "projector" in app.extensions:
+            app.extensions["projector"].clear()
+        if name in ("fragments", "all"):
+            fragments.invalidate()
 
-            reply_text = call_gemini_api(history, policy_list, user_context)
+    invalidations = sharedstate.ChannelReader(state, "cache", drop_cache,
+                                              interval=app.config["STATE_POLL_INTERVAL"])
+    app.extensions["cache_invalidations"] = invalidations
 
-            # Save assistant reply to history
-            history.append({"role": "model", "content": reply_text})
-            session["chat_history"] = history
+    @app.before_request
+    def poll_invalidations():
+        invalidations.poll()
 
-            return {"reply": reply_text}
-        finally:
-            db.close()
+    @app.cli.command("cache-invalidate")
+    @click.argument("cache", type=click.Choice(["replies", "projections", "fragments", "all"]))
+    def cache_invalidate_command(cache):
+        """Tell every worker to drop an in-process cache."""
+        msg_id = state.publish("cache", json.dumps({"cache": cache}))
+        click.echo(f"Published invalidation #{msg_id} for {cache}; workers apply it within "
+                   f"{app.config['STATE_POLL_INTERVAL']:g}s of their next request")
             
     @app.route("/logout")
     def logout():
+        if "user_id" in session:
+            audit_event("logout")
         session.clear()
+        # The logged-out session, flash and all, continues under a new id
+        rotate_session(session)
         flash("You have been logged out", "info")
         return redirect(url_for("home"))
 
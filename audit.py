@@ -0,0 +1,295 @@
+"""Write-behind audit log of user actions.
+
+Request handlers call ``AuditLog.record``, which only appends the event to
+a bounded in-memory queue. One writer thread per process drains the queue
+and writes the events in groups: one transaction (or one appended block and
+fsync) per ``batch_size`` events, or per ``flush_interval`` seconds,
+whichever comes first. Audit writes stay off the ledger database and off
+the request path. A crash loses every event not yet written: up to
+``max_queue`` queued events plus the batch being written. Only while the
+writer keeps up is that about one flush interval's worth.
+
+When the writer falls behind and the queue fills, ``record`` waits up to
+``block_timeout`` for room and then drops the event. Both the waits and
+the drops are counted, so the backpressure shows up in ``/metrics``.
+
+Two sinks are provided: ``SQLiteSink`` writes a separate audit database
+and ``JsonlSink`` appends to rotating JSONL segment files.
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+log = logging.getLogger(__name__)
+
+AUDIT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS audit_events (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      at TEXT NOT NULL,
+      action TEXT NOT NULL,
+      user_id INTEGER,
+      ip TEXT,
+      detail TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_audit_events_user ON audit_events (user_id, id);
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class SQLiteSink:
+    """Audit events in their own SQLite file, one transaction per batch.
+
+    The connection is opened by the first write, so it belongs to the
+    writer thread of the process that uses it, not to a pre-fork master.
+    """
+
+    def __init__(self, path, busy_timeout=30.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._conn = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # A committed batch survives power loss, not just a process crash;
+        # grouping is what keeps the fsync per batch affordable
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.executescript(AUDIT_SCHEMA)
+        return conn
+
+    def write(self, events):
+        if self._conn is None:
+            self._conn = self._connect()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(
+                "INSERT INTO audit_events (at, action, user_id, ip, detail) VALUES (?, ?, ?, ?, ?)",
+                [(e["at"], e["action"], e["user_id"], e["ip"],
+                  json.dumps(e["detail"], default=str) if e["detail"] else None) for e in events],
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class JsonlSink:
+    """Audit events appended to JSONL segment files in ``directory``.
+
+    Each batch is one write and one fsync. Every process writes its own
+    segments, named ``audit-<UTC start time>-<pid>.jsonl`` so they sort by
+    age. A new segment starts once the current one reaches ``max_bytes``,
+    so old segments can be shipped or deleted without touching the one
+    being written.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._file = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        self._file = open(os.path.join(self.directory, f"audit-{stamp}-{os.getpid()}.jsonl"), "ab")
+
+    def write(self, events):
+        if self._file is None or self._file.tell() >= self.max_bytes:
+            if self._file is not None:
+                self._file.close()
+            self._open()
+        block = "".join(json.dumps(e, default=str, separators=(",", ":")) + "\n" for e in events)
+        self._file.write(block.encode())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class AuditLog:
+    """Bounded queue in front of a sink, drained by one background writer."""
+
+    def __init__(self, sink, max_queue=10000, batch_size=500, flush_interval=0.2, block_timeout=0.05):
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._writing = 0
+        self._closed = False
+        self._thread = None
+        self._registered = False
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.blocked = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        """Start the writer thread in this process if it is not running yet."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+                if not self._registered:
+                    atexit.register(self.close)
+                    self._registered = True
+
+    def record(self, action, user_id=None, ip=None, **detail) -> bool:
+        """Queue one event; returns False if it was dropped because the queue stayed full."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            # First event in this process (or in a forked worker)
+            self.start()
+        event = {"at": _now(), "action": action, "user_id": user_id, "ip": ip, "detail": detail or None}
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.blocked += 1
+                deadline = time.monotonic() + self.block_timeout
+                while len(self._queue) >= self.max_queue:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        self.dropped += 1
+                        return False
+                    self._not_full.wait(remaining)
+            self._queue.append(event)
+            self.recorded += 1
+            depth = len(self._queue)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            # Wake the writer to start the interval clock, or for a full batch
+            if depth == 1 or depth >= self.batch_size:
+                self._not_empty.notify()
+        return True
+
+    def _take(self):
+        """Wait for a full batch or the flush interval, then take up to one batch."""
+        with self._lock:
+            deadline = None
+            while not self._closed and len(self._queue) < self.batch_size:
+                if self._queue and deadline is None:
+                    # The interval runs from the oldest waiting event
+                    deadline = time.monotonic() + self.flush_interval
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                self._not_empty.wait(timeout)
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            self._writing = count
+            self._not_full.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch:
+                start = time.perf_counter()
+                try:
+                    self.sink.write(batch)
+                    ok = True
+                except Exception:
+                    ok = False
+                    log.exception("Audit writer error")
+                with self._lock:
+                    if ok:
+                        self.written += len(batch)
+                        self.batches += 1
+                    else:
+                        self.failed += len(batch)
+                    self.last_flush_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._writing = 0
+                self._idle.notify_all()
+                if self._closed and not self._queue:
+                    return
+
+    def flush(self, timeout=5.0) -> bool:
+        """Wait until everything queued so far is written; False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._not_empty.notify()
+            while self._queue or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                # Written in full batches meanwhile; nudge the writer for the tail
+                self._not_empty.notify()
+                self._idle.wait(min(remaining, self.flush_interval))
+        return True
+
+    def close(self, timeout=5.0):
+        """Write what is queued, stop the writer and close the sink."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        else:
+            # No writer ever ran here; write the leftovers directly
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.batch_size))]
+                if not batch:
+                    break
+                self.sink.write(batch)
+                self.written += len(batch)
+                self.batches += 1
+        self.sink.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "max_depth": self.max_depth,
+                "recorded": self.recorded,
+                "written": self.written,
+                "batches": self.batches,
+                "blocked": self.blocked,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+            }
+
+
+def open_sink(kind, path, segment_bytes=64 * 2 ** 20):
+    """``sqlite`` or ``jsonl`` sink at ``path``; None for ``off``."""
+    if kind == "off":
+        return None
+    if kind == "jsonl":
+        return JsonlSink(path, segment_bytes)
+    if kind == "sqlite":
+        return SQLiteSink(path)
+    raise ValueError(f"unknown AUDIT_SINK {kind!r}; use sqlite, jsonl or off")
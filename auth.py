@@ -0,0 +1,164 @@
+"""Password hashing and login throttling.
+
+Hashing is slow on purpose, so it runs on a small dedicated pool with a cap
+on queued work. A burst of logins is then refused with ``AuthBusy`` instead
+of tying up every request worker. Stored hashes made with older KDF
+parameters are upgraded on the next successful login. Token buckets per
+username and per client IP turn away repeated attempts before any hashing
+happens. Given a shared-state backend (see sharedstate.py), the buckets
+live there, so the limits hold across every worker process.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"
+# Colons in a method string that spells out every parameter, e.g. "pbkdf2:sha256:600000"
+_FULL_METHOD_COLONS = {"scrypt": 3, "pbkdf2": 2}
+
+
+class AuthBusy(Exception):
+    """The hashing pool is saturated or did not answer in time."""
+
+
+class Authenticator:
+    """Hashes and verifies passwords on a bounded thread pool.
+
+    ``method`` is any werkzeug hash method string, for example
+    ``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``.
+    """
+
+    def __init__(self, method=DEFAULT_HASH_METHOD, max_workers=2, max_in_flight=16, timeout=10.0):
+        self.method = method
+        self._canonical = method if method.count(":") == _FULL_METHOD_COLONS.get(method.split(":")[0]) else None
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auth")
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusy("Too many sign-ins in progress, please try again shortly.")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise AuthBusy("Sign-in took too long, please try again shortly.") from None
+
+    def hash_password(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def canonical_method(self) -> str:
+        """The method with werkzeug's defaults filled in, as stored in hashes."""
+        if self._canonical is None:
+            # A short method such as "pbkdf2" is expanded by hashing once; this
+            # is deferred so it does not slow down worker boot
+            self._canonical = generate_password_hash("probe", method=self.method).split("$", 1)[0]
+        return self._canonical
+
+    def needs_rehash(self, stored_hash: str) -> bool:
+        return stored_hash.split("$", 1)[0] != self.canonical_method()
+
+    def verify(self, stored_hash: str, password: str, rehash=True):
+        """Return ``(ok, new_hash)``.
+
+        ``new_hash`` is set when the password matched but was stored with
+        other KDF parameters; the caller should save it in place of the old one.
+        """
+        ok = self._run(check_password_hash, stored_hash, password)
+        if ok and rehash and self.needs_rehash(stored_hash):
+            return True, self.hash_password(password)
+        return ok, None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TokenBucketLimiter:
+    """Thread-safe token buckets keyed by string, oldest keys evicted past ``max_keys``.
+
+    Each key may spend ``capacity`` attempts in a burst, refilled at
+    ``refill_per_second``.
+    """
+
+    def __init__(self, capacity, refill_per_second, max_keys=100000):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def consume(self, key, now=None) -> float:
+        """Take one token for ``key``; return 0 if allowed, else seconds until one is free."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.refill_per_second)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / self.refill_per_second if self.refill_per_second else float("inf")
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class SharedTokenBucketLimiter:
+    """``TokenBucketLimiter`` whose buckets live in a shared-state backend under ``prefix``.
+
+    Each attempt is one atomic ``take_token`` on the backend, so workers
+    cannot both spend the last token. Idle buckets are purged by the backend.
+    """
+
+    def __init__(self, backend, prefix, capacity, refill_per_second):
+        self.backend = backend
+        self.prefix = prefix
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+
+    def consume(self, key, now=None) -> float:
+        """Take one token for ``key``; return 0 if allowed, else seconds until one is free."""
+        return self.backend.take_token(self.prefix + key, self.capacity, self.refill_per_second, now)
+
+    def reset(self, key):
+        self.backend.reset_bucket(self.prefix + key)
+
+
+class LoginThrottle:
+    """Per-username and per-IP limits on login attempts.
+
+    Buckets are per process unless a shared-state ``backend`` is given.
+    """
+
+    def __init__(self, user_burst=5, user_per_minute=5, ip_burst=30, ip_per_minute=60, backend=None):
+        if backend is None:
+            self.users = TokenBucketLimiter(user_burst, user_per_minute / 60.0)
+            self.ips = TokenBucketLimiter(ip_burst, ip_per_minute / 60.0)
+        else:
+            self.users = SharedTokenBucketLimiter(backend, "login:user:", user_burst, user_per_minute / 60.0)
+            self.ips = SharedTokenBucketLimiter(backend, "login:ip:", ip_burst, ip_per_minute / 60.0)
+
+    def check(self, username, ip) -> float:
+        """Record an attempt; return seconds to wait, or 0 if it may go ahead."""
+        ip_wait = self.ips.consume(ip)
+        user_wait = self.users.consume(username.lower())
+        return max(ip_wait, user_wait)
+
+    def succeeded(self, username):
+        """A correct password clears that username's failed attempts."""
+        self.users.reset(username.lower())
@@ -0,0 +1,188 @@
+"""Transfer latency with audit events written inline vs. write-behind.
+
+Threads post transfers through ``transfers.transfer`` and audit each one.
+The modes are:
+
+* ``none``: no audit, the baseline
+* ``inline``: an INSERT and commit into ``audit_events`` in the bank
+  database right after the transfer, as a naive version would do it
+* ``sqlite`` / ``jsonl``: ``audit.AuditLog`` with the matching sink
+
+Each mode reports transfer p50/p95/p99, transfers/s, group commits, and
+backpressure (queue waits and drops). A crash test then records events at
+a steady rate in a child process, kills it with SIGKILL, and reports how
+many milliseconds of acknowledged events were lost. Compare that with
+``--flush-interval``.
+
+    python benchmarks/bench_audit.py --threads 8 --duration 5 --flush-interval 0.2
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import ConnectionPool  # noqa: E402
+from load_test import percentile  # noqa: E402
+from money import Money  # noqa: E402
+from stress_transfers import seed  # noqa: E402
+import audit  # noqa: E402
+import transfers  # noqa: E402
+
+MODES = ("none", "inline", "sqlite", "jsonl")
+
+CRASH_CHILD = """
+import sys, time
+sys.path.insert(0, {repo!r})
+import audit
+sink = audit.open_sink({kind!r}, {path!r})
+log = audit.AuditLog(sink, batch_size=500, flush_interval={interval!r})
+i = 0
+while True:
+    i += 1
+    log.record("tick", seq=i, at_ms=time.time() * 1000)
+    if i % 100 == 0:
+        print(i, time.time() * 1000, flush=True)
+    time.sleep(0.0002)
+"""
+
+
+def run(mode, tmp, args):
+    path = os.path.join(tmp, f"{mode}.db")
+    pool = ConnectionPool(path, size=args.threads)
+    seed(pool, args.accounts, 10 ** 9)
+    log = None
+    if mode == "inline":
+        conn = pool.acquire()
+        conn.executescript(audit.AUDIT_SCHEMA)
+        pool.release(conn)
+    elif mode in ("sqlite", "jsonl"):
+        target = os.path.join(tmp, "audit.db" if mode == "sqlite" else "audit")
+        log = audit.AuditLog(audit.open_sink(mode, target), batch_size=args.batch_size,
+                             flush_interval=args.flush_interval, max_queue=args.queue_size)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = []
+
+    def worker():
+        rng = random.Random()
+        local = []
+        while not stop.is_set():
+            src = rng.randint(1, args.accounts)
+            dst = rng.randint(1, args.accounts - 1)
+            dst += dst >= src
+            start = time.perf_counter()
+            conn = pool.acquire()
+            try:
+                result = transfers.transfer(conn, src, f"AC{100000 + dst}", Money(rng.randint(100, 5000)))
+                if mode == "inline":
+                    conn.execute(
+                        "INSERT INTO audit_events (at, action, user_id, ip, detail) VALUES (?, ?, ?, ?, ?)",
+                        (audit._now(), "transfer", src, "127.0.0.1",
+                         json.dumps({"transaction_id": result.transaction_id})))
+                    conn.commit()
+            finally:
+                pool.release(conn)
+            if log is not None:
+                log.record("transfer", src, "127.0.0.1", transaction_id=result.transaction_id)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    stats = {}
+    if log is not None:
+        log.flush()
+        stats = log.stats()
+        log.close()
+    pool.close_all()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "rate": len(latencies) / args.duration,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "batches": stats.get("batches", len(latencies) if mode == "inline" else 0),
+        "blocked": stats.get("blocked", 0),
+        "dropped": stats.get("dropped", 0),
+    }
+
+
+def crash_loss(kind, tmp, args):
+    """Milliseconds between the newest durable event and the last one acknowledged before SIGKILL."""
+    target = os.path.join(tmp, f"crash-{kind}" + (".db" if kind == "sqlite" else ""))
+    code = CRASH_CHILD.format(repo=REPO, kind=kind, path=target, interval=args.flush_interval)
+    child = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True)
+    last_ack = None
+    deadline = time.monotonic() + 1.5
+    for line in child.stdout:
+        last_ack = [float(x) for x in line.split()]
+        if time.monotonic() > deadline:
+            break
+    child.send_signal(signal.SIGKILL)
+    child.wait()
+    if kind == "sqlite":
+        conn = sqlite3.connect(target)
+        detail = conn.execute("SELECT detail FROM audit_events ORDER BY id DESC LIMIT 1").fetchone()
+        conn.close()
+        newest = json.loads(detail[0]) if detail else None
+    else:
+        lines = []
+        for name in sorted(os.listdir(target)):
+            with open(os.path.join(target, name)) as f:
+                lines += f.read().splitlines()
+        newest = json.loads(lines[-1])["detail"] if lines else None
+    if newest is None or last_ack is None:
+        return None
+    return max(0.0, last_ack[1] - newest["at_ms"]), int(last_ack[0] - newest["seq"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per mode")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=0.2)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--modes", default=",".join(MODES))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rows = [run(mode, tmp, args) for mode in args.modes.split(",")]
+        losses = {kind: crash_loss(kind, tmp, args) for kind in ("sqlite", "jsonl")}
+
+    print(f"{'mode':<7} {'xfer/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'commits':>8} "
+          f"{'blocked':>8} {'dropped':>8}")
+    for r in rows:
+        print(f"{r['mode']:<7} {r['rate']:>7.0f} {r['p50']:>7.2f} {r['p95']:>7.2f} {r['p99']:>7.2f} "
+              f"{r['batches']:>8} {r['blocked']:>8} {r['dropped']:>8}")
+    print(f"\nSIGKILL with flush interval {args.flush_interval * 1000:.0f} ms:")
+    for kind, loss in losses.items():
+        if loss is None:
+            print(f"  {kind}: nothing written before the kill")
+        else:
+            print(f"  {kind}: lost the last {loss[0]:.0f} ms of acknowledged events ({loss[1]} events)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Model call rate and chat latency with and without the rule-based recommender.
+
+Simulated users log in and hold short chats through ``POST /api/chatbot``.
+A chat mixes greetings, stated preferences, follow-up requests for picks,
+and open-ended questions. Gemini is replaced by a local fake that answers
+after a delay drawn around ``--model-latency``. The same chats run once
+with ``CHAT_RULES=0`` (every reply from the model) and once with
+``CHAT_RULES=1``. Each run reports the share of replies that needed a model
+call, p50/p95 chat latency, and p50/p95 for the replies the rules answered.
+
+    python benchmarks/bench_chat_routing.py --users 40 --clients 8 --model-latency 0.8
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import percentile  # noqa: E402
+
+PASSWORD = "bench-password"
+# Each chat is a few of these turns, in order
+OPENERS = ["hi", "Hello, I'd like some investment advice", "hey there", "Can you help me invest?"]
+PREFERENCES = [
+    "I want low risk and need to withdraw anytime, horizon 1 year",
+    "Recommend something aggressive for 5 years",
+    "I'm moderate risk, long term, interested in green energy. What should I invest in?",
+    "Which policy should I pick? High risk, 3 years",
+    "I have 2 years and want passive income with moderate risk",
+    "conservative, short term please",
+    "low risk, I might need the money for emergencies",
+    "balanced risk, 4 years, suggest two options",
+]
+FOLLOW_UPS = [
+    "Why is the first one better?",
+    "What is a bond fund?",
+    "Compare those two for me",
+    "How does the lock-in work?",
+    "thanks!",
+    "What about high risk instead?",
+    "And if my horizon is 10 years?",
+]
+
+
+MODEL_REPLY = "Here are two policies that could suit you: Safe Savings and Balanced Growth."
+
+
+class FakeReply:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel with a fixed-distribution delay."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        with self._lock:
+            self.calls += 1
+        time.sleep(random.lognormvariate(0, 0.35) * self.latency)
+        reply = FakeReply(MODEL_REPLY)
+        return iter([reply]) if stream else reply
+
+
+def conversation(rng):
+    turns = [rng.choice(OPENERS)] if rng.random() < 0.6 else []
+    turns.append(rng.choice(PREFERENCES))
+    turns += rng.sample(FOLLOW_UPS, rng.randint(0, 2))
+    return turns
+
+
+def run(rules, args, chats):
+    cwd = os.getcwd()
+    os.environ["CHAT_RULES"] = "1" if rules else "0"
+    os.environ["CHAT_MAX_IN_FLIGHT"] = str(max(16, args.clients * 2))
+    os.environ["CHAT_MAX_WORKERS"] = str(args.clients)
+    # Every simulated user signs in from the same address, and hashing is not what is measured
+    os.environ["AUTH_IP_BURST"] = str(args.users * 4)
+    os.environ["AUTH_HASH_METHOD"] = "pbkdf2:sha256:1000"
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(os.path.join(REPO, "schema.sql"), tmp)
+        os.chdir(tmp)
+        try:
+            import app as app_module
+            app = app_module.create_app()
+            model = FakeModel(args.model_latency)
+            app.extensions["chat_service"].model = model
+            registry = app.extensions.get("metrics")
+
+            latencies, by_rules, lock = [], [], threading.Lock()
+            queue = list(enumerate(chats))
+
+            def client():
+                local, local_rules = [], []
+                while True:
+                    with lock:
+                        if not queue:
+                            break
+                        user, turns = queue.pop()
+                    c = app.test_client()
+                    name = f"bench{user}"
+                    c.post("/register", data={"username": name, "password": PASSWORD,
+                                              "email": f"{name}@example.com", "phone": str(user)})
+                    c.post("/login", data={"username": name, "password": PASSWORD})
+                    for text in turns:
+                        start = time.perf_counter()
+                        reply = c.post("/api/chatbot", json={"message": text}).get_json().get("reply")
+                        elapsed = time.perf_counter() - start
+                        local.append(elapsed)
+                        if reply != MODEL_REPLY:
+                            local_rules.append(elapsed)
+                with lock:
+                    latencies.extend(local)
+                    by_rules.extend(local_rules)
+
+            threads = [threading.Thread(target=client) for _ in range(args.clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            app.extensions["chat_service"].shutdown()
+            replies = dict(registry.chat_replies) if registry else {}
+        finally:
+            os.chdir(cwd)
+    latencies.sort()
+    by_rules.sort()
+    return {
+        "rules": "on" if rules else "off",
+        "replies": len(latencies),
+        "model_calls": model.calls,
+        "call_rate": model.calls / len(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "rules_p95": percentile(by_rules, 95) * 1000,
+        "by_source": replies,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--model-latency", type=float, default=0.8, help="median seconds per fake model call")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    chats = [conversation(rng) for _ in range(args.users)]
+    rows = [run(False, args, chats), run(True, args, chats)]
+
+    print(f"{sum(map(len, chats))} chat turns from {args.users} users, model median {args.model_latency * 1000:.0f} ms")
+    print(f"{'rules':<6} {'replies':>8} {'model calls':>12} {'call rate':>10} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'rules p95 ms':>13}  by source")
+    for r in rows:
+        print(f"{r['rules']:<6} {r['replies']:>8} {r['model_calls']:>12} {r['call_rate']:>10.1%} {r['p50']:>8.1f} "
+              f"{r['p95']:>8.1f} {r['rules_p95']:>13.2f}  {r['by_source']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
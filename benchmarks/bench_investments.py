@@ -0,0 +1,201 @@
+"""Throughput of concurrent investment bursts, like the launch of a new fund.
+
+Seeds users with funded accounts and the default policies plus a new
+"Launch Fund". Threads then run a burst in which every user buys the new
+fund, tries a second and a third policy, tops up, and redeems part or all
+of a holding. Two paths are compared:
+
+* ``legacy``: the old route, COUNT(*) on ``user_policies`` followed by an
+  INSERT that the old ``trg_limit_user_policies`` trigger counts again.
+  No money moves.
+* ``service``: ``investments.invest`` / ``investments.redeem``, with the
+  debit, the guarded counter and the holding in one transaction.
+
+Each run reports operations/s, p50/p95/p99 latency and how many operations
+were rejected. After the service run, the script checks that no user is
+over the limit, that ``policy_count`` matches the holdings, that money is
+conserved across balances and holdings, and that ``ledger.verify`` passes.
+
+    python benchmarks/bench_investments.py --users 2000 --threads 8
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import ConnectionPool  # noqa: E402
+from load_test import percentile  # noqa: E402
+from money import Money  # noqa: E402
+import investments  # noqa: E402
+import ledger  # noqa: E402
+import migrations  # noqa: E402
+import transfers  # noqa: E402
+
+LAUNCH_FUND = 9
+START_BALANCE = Money.parse("5000.00")
+
+LEGACY_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS trg_limit_user_policies
+    BEFORE INSERT ON user_policies
+    FOR EACH ROW
+    BEGIN
+      SELECT CASE WHEN ((SELECT COUNT(*) FROM user_policies WHERE user_id = NEW.user_id) >= 2)
+      THEN RAISE(ABORT, 'User can invest in at most 2 policies') END;
+    END;
+"""
+
+
+def seed(path, users):
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn, os.path.join(REPO, "schema.sql"), log=lambda _: None)
+    conn.execute(
+        "INSERT INTO policies (id, name, risk_level, expected_return, min_investment_cents, description) "
+        "VALUES (?, 'Launch Fund', 'Medium', 9.0, 10000, 'New fund')", (LAUNCH_FUND,))
+    conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'x')",
+                     [(i, f"user{i}") for i in range(1, users + 1)])
+    conn.executemany("INSERT INTO accounts (id, user_id, account_number, balance_cents) VALUES (?, ?, ?, ?)",
+                     [(i, i, f"AC{100000 + i}", START_BALANCE) for i in range(1, users + 1)])
+    conn.commit()
+    conn.close()
+
+
+def legacy_invest(conn, user_id, policy_id):
+    def attempt():
+        count = conn.execute("SELECT COUNT(*) FROM user_policies WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if count >= investments.MAX_HOLDINGS:
+            return False
+        try:
+            conn.execute("INSERT INTO user_policies (user_id, policy_id) VALUES (?, ?)", (user_id, policy_id))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return False
+    return transfers.with_busy_retry(attempt)
+
+
+def plan(users, seed_value):
+    """Per user: the operations of the burst, in order."""
+    rng = random.Random(seed_value)
+    ops = []
+    for user in range(1, users + 1):
+        others = rng.sample(range(1, 9), 2)
+        steps = [("invest", LAUNCH_FUND, None), ("invest", others[0], None), ("invest", others[1], None)]
+        if rng.random() < 0.5:
+            steps.append(("invest", LAUNCH_FUND, str(rng.randint(10, 500))))
+        if rng.random() < 0.3:
+            steps.append(("redeem", LAUNCH_FUND, None if rng.random() < 0.5 else "20"))
+        ops.append((user, steps))
+    return ops
+
+
+def run(mode, path, ops, threads):
+    pool = ConnectionPool(path, size=threads)
+    if mode == "legacy":
+        conn = pool.acquire()
+        conn.execute(LEGACY_TRIGGER)
+        conn.commit()
+        pool.release(conn)
+    queue = list(reversed(ops))
+    lock = threading.Lock()
+    latencies, rejected = [], [0]
+
+    def worker():
+        local, refused = [], 0
+        while True:
+            with lock:
+                if not queue:
+                    break
+                user, steps = queue.pop()
+            for kind, policy_id, amount in steps:
+                # The old route could only open holdings
+                if mode == "legacy" and (kind != "invest" or amount is not None):
+                    continue
+                start = time.perf_counter()
+                conn = pool.acquire()
+                try:
+                    if mode == "legacy":
+                        refused += not legacy_invest(conn, user, policy_id)
+                    else:
+                        fn = investments.invest if kind == "invest" else investments.redeem
+                        try:
+                            fn(conn, user, user, policy_id, amount)
+                        except investments.InvestmentError:
+                            refused += 1
+                finally:
+                    pool.release(conn)
+                local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+            rejected[0] += refused
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    pool.close_all()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "ops": len(latencies),
+        "rate": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "rejected": rejected[0],
+    }
+
+
+def check(path, users):
+    conn = sqlite3.connect(path)
+    over = conn.execute("SELECT COUNT(*) FROM users WHERE policy_count > ?", (investments.MAX_HOLDINGS,)).fetchone()[0]
+    drift = conn.execute(
+        "SELECT COUNT(*) FROM users u WHERE policy_count <> "
+        "(SELECT COUNT(*) FROM user_policies up WHERE up.user_id = u.id)").fetchone()[0]
+    balances = conn.execute("SELECT SUM(balance_cents) FROM accounts").fetchone()[0]
+    held = conn.execute("SELECT COALESCE(SUM(amount_cents), 0) FROM user_policies").fetchone()[0]
+    ok = ledger.verify(conn).ok
+    conn.close()
+    conserved = balances + held == START_BALANCE.cents * users
+    return {"over_limit": over, "counter_drift": drift, "conserved": conserved, "ledger_ok": ok}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    ops = plan(args.users, args.seed)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("legacy", "service"):
+            path = os.path.join(tmp, f"{mode}.db")
+            seed(path, args.users)
+            rows.append(run(mode, path, ops, args.threads))
+        checks = check(os.path.join(tmp, "service.db"), args.users)
+
+    print(f"{args.users} users, {args.threads} threads")
+    print(f"{'path':<8} {'ops':>7} {'ops/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'rejected':>9}")
+    for r in rows:
+        print(f"{r['mode']:<8} {r['ops']:>7} {r['rate']:>7.0f} {r['p50']:>7.2f} {r['p95']:>7.2f} "
+              f"{r['p99']:>7.2f} {r['rejected']:>9}")
+    print("service checks:", ", ".join(f"{k}={v}" for k, v in checks.items()))
+    return 0 if checks["conserved"] and checks["ledger_ok"] and not checks["over_limit"] \
+        and not checks["counter_drift"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Compare ledger aggregations over REAL dollars and INTEGER cents.
+
+Builds two copies of the same synthetic ledger, one with the legacy
+``amount REAL`` column and one with ``amount_cents INTEGER``, then times
+the queries the app runs against large ledgers: per-account sent and
+received totals, a whole-ledger sum and the conditional balance-check
+debit. It also reports how far the REAL totals drift from the exact ones.
+
+    python benchmarks/bench_money_aggregation.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from money import Money  # noqa: E402
+
+QUERIES = {
+    "account totals": (
+        "SELECT SUM(CASE WHEN from_account_id = ?1 THEN {col} ELSE 0 END), "
+        "SUM(CASE WHEN to_account_id = ?1 THEN {col} ELSE 0 END) "
+        "FROM transactions WHERE from_account_id = ?1 OR to_account_id = ?1",
+        lambda rng, accounts: (rng.randint(1, accounts),),
+    ),
+    "ledger sum": ("SELECT SUM({col}) FROM transactions", lambda rng, accounts: ()),
+    "group by account": (
+        "SELECT from_account_id, SUM({col}) FROM transactions GROUP BY from_account_id",
+        lambda rng, accounts: (),
+    ),
+}
+
+
+def build(path, kind, rows, accounts, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    col_decl = "amount REAL NOT NULL" if kind == "real" else "amount_cents INTEGER NOT NULL"
+    bal_decl = "balance REAL NOT NULL" if kind == "real" else "balance_cents INTEGER NOT NULL"
+    conn.executescript(f"""
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = OFF;
+        CREATE TABLE accounts (id INTEGER PRIMARY KEY, {bal_decl});
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY, from_account_id INTEGER, to_account_id INTEGER, {col_decl});
+        CREATE INDEX idx_from ON transactions (from_account_id);
+        CREATE INDEX idx_to ON transactions (to_account_id);
+    """)
+    scale = 100.0 if kind == "real" else 1
+    conn.executemany(
+        "INSERT INTO accounts VALUES (?, ?)",
+        [(i, (10 ** 9) / scale if kind == "real" else 10 ** 9) for i in range(1, accounts + 1)],
+    )
+
+    def gen():
+        for _ in range(rows):
+            cents = rng.randint(1, 500000)
+            yield (rng.randint(1, accounts), rng.randint(1, accounts),
+                   cents / 100.0 if kind == "real" else cents)
+
+    conn.executemany("INSERT INTO transactions (from_account_id, to_account_id, {}) VALUES (?, ?, ?)".format(
+        "amount" if kind == "real" else "amount_cents"), gen())
+    conn.commit()
+    return conn
+
+
+def time_query(conn, sql, make_params, accounts, repeat, seed):
+    rng = random.Random(seed)
+    samples = []
+    result = None
+    for _ in range(repeat):
+        params = make_params(rng, accounts)
+        start = time.perf_counter()
+        result = conn.execute(sql, params).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def time_debits(conn, kind, accounts, repeat, seed):
+    rng = random.Random(seed)
+    if kind == "real":
+        sql = "UPDATE accounts SET balance = balance - ? WHERE id = ? AND balance >= ?"
+    else:
+        sql = "UPDATE accounts SET balance_cents = balance_cents - ? WHERE id = ? AND balance_cents >= ?"
+    start = time.perf_counter()
+    conn.execute("BEGIN")
+    for _ in range(repeat):
+        cents = rng.randint(1, 500000)
+        amount = cents / 100.0 if kind == "real" else cents
+        conn.execute(sql, (amount, rng.randint(1, accounts), amount))
+    conn.rollback()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conns = {}
+        for kind in ("real", "cents"):
+            start = time.perf_counter()
+            conns[kind] = build(os.path.join(tmp, f"{kind}.db"), kind, args.rows, args.accounts, args.seed)
+            print(f"built {kind:5} ledger with {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+        print(f"\n{'query':20} {'REAL ms':>10} {'cents ms':>10} {'speedup':>8}")
+        drift = None
+        for name, (template, make_params) in QUERIES.items():
+            real_ms, real_rows = time_query(conns["real"], template.format(col="amount"),
+                                            make_params, args.accounts, args.repeat, args.seed)
+            cents_ms, cents_rows = time_query(conns["cents"], template.format(col="amount_cents"),
+                                              make_params, args.accounts, args.repeat, args.seed)
+            print(f"{name:20} {real_ms:10.2f} {cents_ms:10.2f} {real_ms / cents_ms:7.2f}x")
+            if name == "ledger sum":
+                drift = abs(real_rows[0][0] * 100 - cents_rows[0][0])
+                exact = Money(cents_rows[0][0])
+
+        real_us = time_debits(conns["real"], "real", args.accounts, args.repeat * 100, args.seed)
+        cents_us = time_debits(conns["cents"], "cents", args.accounts, args.repeat * 100, args.seed)
+        print(f"{'balance check+debit':20} {real_us / 1000:10.4f} {cents_us / 1000:10.4f} "
+              f"{real_us / cents_us:7.2f}x")
+        print(f"\nexact ledger total {exact}; REAL sum is off by {drift:.4f} cents")
+        for conn in conns.values():
+            conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Policy projection latency: the engine alone and through the route.
+
+``engine cold`` runs every policy through ``projection.project`` with new
+shocks. ``engine shared`` reuses a horizon's shocks that are already
+simulated, as a new policy mix does. ``route`` times
+``GET /api/policies/projection`` with the Flask test client. Its first
+request is cold; the rest hit the result cache. The target is 50 ms for
+10k paths.
+
+    python benchmarks/bench_projection.py --paths 10000 --years 30 --runs 20
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import percentile  # noqa: E402
+import projection  # noqa: E402
+
+TARGET_MS = 50.0
+POLICIES = [
+    {"id": i, "risk_level": risk, "expected_return": rate}
+    for i, (risk, rate) in enumerate(
+        [("Low", 3.0), ("Medium", 6.0), ("High", 12.0), ("Low", 2.5),
+         ("Medium", 5.0), ("High", 9.0), ("Medium", 7.5), ("High", 15.0)], start=1)
+]
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)
+
+
+def route_samples(args):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(os.path.join(REPO, "schema.sql"), tmp)
+        os.chdir(tmp)
+        try:
+            import app as app_module
+            app = app_module.create_app()
+            client = app.test_client()
+            client.post("/register", data={"username": "bench", "password": "bench-pass",
+                                           "email": "bench@example.com", "phone": "0"})
+            client.post("/login", data={"username": "bench", "password": "bench-pass"})
+            url = f"/api/policies/projection?ids=all&years={args.years}&paths={args.paths}"
+            cold = timed(lambda: client.get(url), 1)
+            warm = timed(lambda: client.get(url), args.runs)
+        finally:
+            os.chdir(cwd)
+    return cold, warm
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", type=int, default=10000)
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    shocks = projection.simulate_shocks(args.years, args.paths)
+    rows = [
+        ("engine cold", timed(lambda: projection.project(POLICIES, args.years, args.paths), args.runs)),
+        ("engine shared", timed(lambda: projection.project(POLICIES, args.years, args.paths, shocks), args.runs)),
+    ]
+    cold, warm = route_samples(args)
+    rows += [("route cold", cold), ("route cached", warm)]
+
+    print(f"{len(POLICIES)} policies, {args.paths} paths, {args.years} years, target {TARGET_MS:.0f} ms")
+    print(f"{'case':<14} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  within target")
+    for name, samples in rows:
+        p95 = percentile(samples, 95)
+        print(f"{name:<14} {percentile(samples, 50):>8.2f} {p95:>8.2f} {samples[-1]:>8.2f}  "
+              f"{'yes' if p95 <= TARGET_MS else 'no'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Transfer latency while long statement exports run, per DB_READ_MODE.
+
+Seeds a database with ``load_test.seed_database``. Reporter threads then
+stream full statement exports with ``exports.iter_transactions`` and pause
+between chunks like a slow client. At the same time, writer threads post
+transfers. The run is repeated with reports on the read-write pool
+(``primary``), on ``mode=ro`` connections to the live file (``snapshot``),
+and on a backup copy (``backup``). Each run reports transfer
+p50/p95/p99/max, transfers/s, exports finished, and the WAL size at the end.
+
+    python benchmarks/bench_read_routing.py --users 200 --transactions 200000 --duration 10
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import ConnectionPool, ReplicaRefresher  # noqa: E402
+from load_test import percentile, seed_database  # noqa: E402
+from money import Money  # noqa: E402
+import exports  # noqa: E402
+import transfers  # noqa: E402
+
+MODES = ("primary", "snapshot", "backup")
+
+
+def reporter(pool, users, stop, pause, done, lock):
+    rng = random.Random()
+    while not stop.is_set():
+        conn = pool.acquire()
+        try:
+            for i, _ in enumerate(exports.iter_transactions(conn, rng.randint(1, users))):
+                if i % exports.FETCH_SIZE == 0:
+                    if stop.is_set():
+                        break
+                    time.sleep(pause)
+            else:
+                with lock:
+                    done[0] += 1
+        finally:
+            pool.release(conn)
+
+
+def writer(pool, users, stop, latencies, lock):
+    rng = random.Random()
+    local = []
+    while not stop.is_set():
+        src = rng.randint(1, users)
+        dst = rng.randint(1, users - 1)
+        dst += dst >= src
+        start = time.perf_counter()
+        conn = pool.acquire()
+        try:
+            transfers.transfer(conn, src, f"AC{100000 + dst}", Money(rng.randint(100, 5000)))
+        finally:
+            pool.release(conn)
+        local.append(time.perf_counter() - start)
+    with lock:
+        latencies.extend(local)
+
+
+def run(mode, path, args):
+    pool = ConnectionPool(path, size=args.pool_size)
+    replica = None
+    if mode == "primary":
+        read_pool = pool
+    elif mode == "snapshot":
+        read_pool = ConnectionPool(path, size=args.readers, readonly=True)
+    else:
+        replica = ReplicaRefresher(path, path + ".replica", args.staleness)
+        replica.refresh(force=True)
+        replica.start()
+        read_pool = ConnectionPool(replica.replica, size=args.readers, readonly=True)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies, done = [], [0]
+    threads = [threading.Thread(target=reporter, args=(read_pool, args.users, stop, args.pause, done, lock))
+               for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(pool, args.users, stop, latencies, lock))
+                for _ in range(args.writers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    wal = path + "-wal"
+    wal_mb = os.path.getsize(wal) / 2 ** 20 if os.path.exists(wal) else 0.0
+    latencies.sort()
+    result = {
+        "mode": mode,
+        "transfers": len(latencies),
+        "rate": len(latencies) / args.duration,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "max": latencies[-1] * 1000 if latencies else 0.0,
+        "exports": done[0],
+        "wal_mb": wal_mb,
+        "refreshes": replica.refreshes if replica else 0,
+    }
+    if read_pool is not pool:
+        read_pool.close_all()
+    pool.close_all()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent exports")
+    parser.add_argument("--writers", type=int, default=4, help="concurrent transfer threads")
+    parser.add_argument("--pool-size", type=int, default=4, help="read-write pool size")
+    parser.add_argument("--pause", type=float, default=0.005, help="seconds a slow client waits per chunk")
+    parser.add_argument("--staleness", type=float, default=5.0, help="backup mode refresh bound")
+    parser.add_argument("--modes", default=",".join(MODES))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded = os.path.join(tmp, "seed.db")
+        seed_database(seeded, args.users, args.transactions, args.seed)
+        rows = []
+        for mode in args.modes.split(","):
+            path = os.path.join(tmp, f"{mode}.db")
+            shutil.copy(seeded, path)
+            rows.append(run(mode, path, args))
+
+    print(f"{'mode':<9} {'xfer/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>8} "
+          f"{'exports':>8} {'wal MB':>7} {'refreshes':>9}")
+    for r in rows:
+        print(f"{r['mode']:<9} {r['rate']:>7.0f} {r['p50']:>7.2f} {r['p95']:>7.2f} {r['p99']:>7.2f} "
+              f"{r['max']:>8.1f} {r['exports']:>8} {r['wal_mb']:>7.1f} {r['refreshes']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
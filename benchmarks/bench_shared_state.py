@@ -0,0 +1,148 @@
+"""Lookup latency of the shared-state backends with many active sessions.
+
+For each of ``--sizes``, each backend is filled with that many sessions
+(payloads shaped like a logged-in session), then timed on:
+
+* ``get``: reading a random live session, what every request does
+* ``miss``: reading an id that is not there (expired or forged cookie)
+* ``set``: saving a session, what a login or flash does
+* ``bucket``: one login-throttle ``take_token``
+
+``sqlite xN`` repeats the gets and sets from ``--procs`` processes at once
+on the same file, as gunicorn workers would; every process also reads a
+key written by the parent to check the state really is shared. On fewer
+cores than processes, its tail includes time spent descheduled.
+
+    python benchmarks/bench_shared_state.py --sizes 1000,100000 --lookups 20000 --procs 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import secrets
+import sys
+import tempfile
+import time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import percentile  # noqa: E402
+import sharedstate  # noqa: E402
+from sessions import KEY_PREFIX  # noqa: E402
+
+TTL = 24 * 3600.0
+
+
+def payload(i):
+    # A logged-in session as ServerSessionInterface stores it
+    return f'{time.time():.0f}:{{"user_id":{i},"username":"user{i:06d}","chat_id":"{secrets.token_hex(16)}"}}'
+
+
+def fill(backend, count):
+    """``count`` session ids stored in ``backend``."""
+    sids = [secrets.token_urlsafe(32) for _ in range(count)]
+    if isinstance(backend, sharedstate.SQLiteStateBackend):
+        # One transaction for the seed; the timed part goes through the API
+        conn = backend._conn()
+        expires = time.time() + TTL
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO state_kv (key, value, expires_at) VALUES (?, ?, ?)",
+                         ((KEY_PREFIX + sid, payload(i), expires) for i, sid in enumerate(sids)))
+        conn.execute("COMMIT")
+    else:
+        for i, sid in enumerate(sids):
+            backend.set(KEY_PREFIX + sid, payload(i), TTL)
+    return sids
+
+
+def timed(fn, keys):
+    samples = []
+    for key in keys:
+        start = time.perf_counter()
+        fn(key)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples
+
+
+def measure(backend, sids, lookups):
+    live = random.choices(sids, k=lookups)
+    missing = [secrets.token_urlsafe(32) for _ in range(lookups)]
+    # Saves and throttle hits spread over as many keys as there are sessions
+    writes = random.choices(range(len(sids)), k=lookups)
+    return {
+        "get": timed(lambda sid: backend.get(KEY_PREFIX + sid), live),
+        "miss": timed(lambda sid: backend.get(KEY_PREFIX + sid), missing),
+        "set": timed(lambda i: backend.set(KEY_PREFIX + sids[i], payload(i), TTL), writes),
+        "bucket": timed(lambda i: backend.take_token(f"login:user:user{i:06d}", 5, 5 / 60), writes),
+    }
+
+
+def worker(path, sids, lookups, marker, results):
+    backend = sharedstate.SQLiteStateBackend(path)
+    # Written by the parent after the fill: visible here only if the state is shared
+    shared = backend.get(marker) is not None
+    live = random.choices(sids, k=lookups)
+    writes = random.choices(range(len(sids)), k=max(1, lookups // 10))
+    get = timed(lambda sid: backend.get(KEY_PREFIX + sid), live)
+    put = timed(lambda i: backend.set(KEY_PREFIX + sids[i], payload(i), TTL), writes)
+    results.put((shared, get, put))
+
+
+def multi_process(path, sids, lookups, procs):
+    marker = "bench:marker"
+    sharedstate.SQLiteStateBackend(path).set(marker, str(os.getpid()))
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=worker, args=(path, sids, lookups // procs, marker, results))
+               for _ in range(procs)]
+    for p in workers:
+        p.start()
+    collected = [results.get() for _ in workers]
+    for p in workers:
+        p.join()
+    return {
+        "get": sorted(s for _, get, _ in collected for s in get),
+        "set": sorted(s for _, _, put in collected for s in put),
+    }, all(shared for shared, _, _ in collected)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000",
+                        help="Comma-separated session counts to test.")
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--procs", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    rows = []
+    shared_ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            for kind in ("memory", "sqlite"):
+                path = os.path.join(tmp, f"state-{size}.db")
+                backend = sharedstate.open_backend(kind, path)
+                sids = fill(backend, size)
+                for op, samples in measure(backend, sids, args.lookups).items():
+                    rows.append((kind, size, op, samples))
+                if kind == "sqlite" and args.procs > 1:
+                    results, ok = multi_process(path, sids, args.lookups, args.procs)
+                    shared_ok = shared_ok and ok
+                    for op, samples in results.items():
+                        rows.append((f"sqlite x{args.procs}", size, op, samples))
+                backend.close()
+
+    print(f"{'backend':<10} {'sessions':>9} {'op':<7} {'p50 us':>8} {'p95 us':>8} {'p99 us':>8} {'mean us':>8}")
+    for kind, size, op, samples in rows:
+        mean = sum(samples) / len(samples) if samples else 0.0
+        print(f"{kind:<10} {size:>9} {op:<7} {percentile(samples, 50):>8.1f} {percentile(samples, 95):>8.1f} "
+              f"{percentile(samples, 99):>8.1f} {mean:>8.1f}")
+    if args.procs > 1:
+        print(f"state shared across processes: {'yes' if shared_ok else 'NO'}")
+    return 0 if shared_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
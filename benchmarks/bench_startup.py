@@ -0,0 +1,82 @@
+"""Worker boot time: importing app.py and calling create_app().
+
+Every sample runs in a fresh interpreter, as a new gunicorn worker would
+(or a master with --preload). Three cases are timed:
+
+* ``warm``: database already migrated, which is every boot after a deploy
+* ``fresh``: empty database, so create_app() applies every migration itself
+* ``genai``: ``import google.generativeai`` alone, the cost a worker now
+  pays on its first chatbot call instead of at boot
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PROBE = """
+import json, time, warnings
+warnings.simplefilter("ignore")
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app()
+t2 = time.perf_counter()
+import sys
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1,
+                  "genai_loaded": "google.generativeai" in sys.modules}))
+"""
+
+GENAI_PROBE = """
+import json, time, warnings
+warnings.simplefilter("ignore")
+t0 = time.perf_counter()
+import google.generativeai
+print(json.dumps({"import": time.perf_counter() - t0, "create_app": 0.0, "genai_loaded": True}))
+"""
+
+
+def sample(code, cwd, env):
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, PYTHONPATH=REPO, GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY", "bench-key"))
+    results = {"warm": [], "fresh": [], "genai": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(os.path.join(REPO, "schema.sql"), tmp)
+        subprocess.run([sys.executable, os.path.join(REPO, "migrations.py")], cwd=tmp, env=env,
+                       capture_output=True, check=True)
+        for _ in range(args.runs):
+            results["warm"].append(sample(PROBE, tmp, env))
+            fresh = os.path.join(tmp, "fresh")
+            os.makedirs(fresh, exist_ok=True)
+            shutil.copy(os.path.join(REPO, "schema.sql"), fresh)
+            results["fresh"].append(sample(PROBE, fresh, env))
+            shutil.rmtree(fresh)
+            results["genai"].append(sample(GENAI_PROBE, tmp, env))
+
+    print(f"{'case':<6} {'import ms':>10} {'create_app ms':>14} {'total ms':>9}  genai at boot")
+    for case, runs in results.items():
+        imp = statistics.median(r["import"] for r in runs) * 1000
+        create = statistics.median(r["create_app"] for r in runs) * 1000
+        loaded = any(r["genai_loaded"] for r in runs)
+        print(f"{case:<6} {imp:>10.1f} {create:>14.1f} {imp + create:>9.1f}  {'yes' if loaded else 'no'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""Latency and throughput benchmark for every route of the bank app.
+
+Seeds a synthetic database from a fixed random seed, then drives the app
+with concurrent logged-in clients. Clients go through Flask's test client,
+through a local gunicorn, or both. Each route and the concurrent transfer
+phase report p50/p95/p99 latency and throughput. Results can be saved as
+JSON baselines and compared against a later run.
+
+    python benchmarks/load_test.py --users 1000 --transactions 100000
+    python benchmarks/load_test.py --mode gunicorn --clients 16 --save benchmarks/baselines/main.json
+    python benchmarks/load_test.py --compare benchmarks/baselines/main.json
+
+The chatbot routes are left out because they call an external model.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+import ledger  # noqa: E402
+import summaries  # noqa: E402
+
+SCHEMA_PATH = os.path.join(REPO, "schema.sql")
+# Same file name the app opens relative to its working directory
+DB_NAME = "simple_bank.db"
+PASSWORD = "bench-password"
+START_BALANCE_CENTS = 10 ** 10
+SEED_CHUNK = 50000
+
+# name -> (method, path template); {account_id}, {from} and {to} are filled per client
+ROUTES = {
+    "dashboard": ("GET", "/dashboard"),
+    "send_money form": ("GET", "/send_money"),
+    "transaction_history": ("GET", "/transaction_history"),
+    "api transactions": ("GET", "/api/transactions?limit=50"),
+    "api transactions filtered": ("GET", "/api/transactions?type=transfer&from={from}&limit=50"),
+    "api account summary": ("GET", "/api/accounts/{account_id}/summary?from={from}&to={to}"),
+    "export csv 30d": ("GET", "/api/transactions/export?format=csv&from={from}"),
+    "profile": ("GET", "/profile"),
+    "policies": ("GET", "/policies"),
+}
+
+
+# ---------- synthetic data ----------
+
+def seed_database(path, users, transactions, seed, days=365):
+    """Create ``path`` with ``users`` users/accounts and ``transactions`` transfers."""
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    with open(SCHEMA_PATH) as f:
+        conn.executescript(f.read())
+    # Hashing is deliberately slow, so every synthetic user shares one hash
+    password_hash = generate_password_hash(PASSWORD)
+    conn.executemany(
+        "INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)",
+        ((i, f"bench{i}", password_hash) for i in range(1, users + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO accounts (id, user_id, account_number, balance_cents) VALUES (?, ?, ?, ?)",
+        ((i, i, f"AC{100000 + i}", START_BALANCE_CENTS) for i in range(1, users + 1)),
+    )
+    # Rollups and postings are rebuilt in one pass afterwards instead of per-row by triggers
+    conn.execute("DROP TRIGGER IF EXISTS trg_transactions_daily_summary")
+    conn.execute("DROP TRIGGER IF EXISTS trg_transactions_postings")
+    now = datetime.utcnow().replace(microsecond=0)
+    span = days * 86400
+
+    def rows():
+        for _ in range(transactions):
+            src = rng.randint(1, users)
+            dst = rng.randint(1, users - 1)
+            if dst >= src:
+                dst += 1
+            created = now - timedelta(seconds=rng.randrange(span))
+            yield (src, dst, rng.randint(100, 500000), "transfer", "bench",
+                   created.strftime("%Y-%m-%d %H:%M:%S"))
+
+    sql = ("INSERT INTO transactions (from_account_id, to_account_id, amount_cents, tx_type, description, "
+           "created_at) VALUES (?, ?, ?, ?, ?, ?)")
+    batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) >= SEED_CHUNK:
+            conn.executemany(sql, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+    conn.commit()
+    summaries.rebuild(conn)
+    # Apply the synthetic transfers to balances so the ledger reconciles
+    conn.execute("""
+        UPDATE accounts SET balance_cents = balance_cents + (
+            SELECT COALESCE(SUM(received_cents - sent_cents), 0)
+            FROM account_daily_summary WHERE account_id = accounts.id)
+    """)
+    conn.commit()
+    ledger.backfill(conn)
+    with open(SCHEMA_PATH) as f:
+        conn.executescript(f.read())
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+# ---------- clients ----------
+
+class FlaskClientDriver:
+    """Requests through ``app.test_client()`` inside this process."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        body = response.get_data()
+        return response.status_code, body
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpDriver:
+    """Requests over HTTP to a running server, with its own cookie jar."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def login(driver, user_id):
+    status, _ = driver.request("POST", "/login", {"username": f"bench{user_id}", "password": PASSWORD})
+    if status != 302:
+        raise RuntimeError(f"login failed for bench{user_id} with HTTP {status}")
+
+
+# ---------- measurement ----------
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, errors, elapsed):
+    samples.sort()
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+    }
+
+
+def run_phase(clients, requests_per_client, make_request, ok_statuses):
+    """Run ``make_request(driver, client_index, i)`` from every client at once."""
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(clients) + 1)
+
+    def worker(index, driver):
+        local, failed = [], 0
+        barrier.wait()
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            status = make_request(driver, index, i)
+            local.append(time.perf_counter() - start)
+            if status not in ok_statuses:
+                failed += 1
+        with lock:
+            samples.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(n, d)) for n, d in enumerate(clients)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return summarize(samples, errors[0], time.perf_counter() - start)
+
+
+def run_suite(clients, user_ids, args):
+    today = datetime.utcnow().date()
+    params = {"from": (today - timedelta(days=30)).isoformat(), "to": today.isoformat()}
+    results = {}
+    for name, (method, template) in ROUTES.items():
+        def hit(driver, index, i, method=method, template=template):
+            path = template.format(account_id=user_ids[index], **params)
+            return driver.request(method, path)[0]
+
+        results[name] = run_phase(clients, args.requests, hit, {200})
+        print_row(name, results[name])
+
+    def transfer(driver, index, i):
+        rng = random.Random(args.seed * 1000003 + index * 7919 + i)
+        dst = rng.randint(1, args.users - 1)
+        if dst >= user_ids[index]:
+            dst += 1
+        status, _ = driver.request("POST", "/send_money", {
+            "recipient_account": f"AC{100000 + dst}",
+            "amount": "1.00",
+            "description": "bench",
+            "idempotency_key": f"bench-{os.getpid()}-{time.monotonic_ns()}-{index}-{i}",
+        })
+        return status
+
+    # A successful transfer redirects back to the dashboard
+    results["concurrent transfers"] = run_phase(clients, args.requests, transfer, {302})
+    print_row("concurrent transfers", results["concurrent transfers"])
+    return results
+
+
+def print_header(title):
+    print(f"\n{title}")
+    print(f"{'route':28} {'reqs':>6} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+
+def print_row(name, r):
+    print(f"{name:28} {r['requests']:6} {r['errors']:4} {r['throughput_rps']:8.1f} "
+          f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f}")
+
+
+# ---------- drivers ----------
+
+def bench_test_client(args):
+    import app as bank_app
+
+    app = bank_app.create_app()
+    user_ids = pick_users(args)
+    clients = [FlaskClientDriver(app) for _ in user_ids]
+    for driver, user_id in zip(clients, user_ids):
+        login(driver, user_id)
+    print_header(f"test client, {len(clients)} concurrent clients")
+    return run_suite(clients, user_ids, args)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_gunicorn(workdir, args):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(REPO))
+    cmd = [
+        sys.executable, "-m", "gunicorn", "--preload",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--worker-class", "gthread", "--threads", str(args.threads),
+        "--log-level", "warning",
+        "app:create_app()",
+    ]
+    server = subprocess.Popen(cmd, cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                urllib.request.urlopen(base_url + "/", timeout=1).read()
+                break
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("gunicorn did not start: " + server.stderr.read().decode()[-2000:])
+                time.sleep(0.2)
+        user_ids = pick_users(args)
+        clients = [HttpDriver(base_url) for _ in user_ids]
+        for driver, user_id in zip(clients, user_ids):
+            login(driver, user_id)
+        print_header(f"gunicorn {args.workers}x{args.threads} gthread, {len(clients)} concurrent clients")
+        return run_suite(clients, user_ids, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def pick_users(args):
+    return random.Random(args.seed).sample(range(1, args.users + 1), args.clients)
+
+
+# ---------- baselines ----------
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {baseline_path} ({baseline['meta'].get('revision')})")
+    print(f"{'mode / route':42} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}")
+    for mode, routes in current["results"].items():
+        for name, r in routes.items():
+            old = baseline["results"].get(mode, {}).get(name)
+            if not old:
+                continue
+            cells = []
+            for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+                cells.append(f"{(r[key] - old[key]) / old[key] * 100:+8.1f}%" if old[key] else f"{'n/a':>9}")
+            print(f"{mode + ' / ' + name:42} {' '.join(cells)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mode", choices=["testclient", "gunicorn", "both"], default="testclient")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent logged-in clients")
+    parser.add_argument("--requests", type=int, default=50, help="requests per client per route")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument("--db", help="seeded database to reuse (created if missing)")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args(argv)
+    if args.clients > args.users:
+        parser.error("--clients cannot exceed --users")
+    # Every synthetic client logs in from 127.0.0.1
+    os.environ.setdefault("AUTH_IP_BURST", str(max(30, args.clients * 2)))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # The app reads schema.sql and opens its database relative to the cwd
+        shutil.copy(SCHEMA_PATH, workdir)
+        db_path = os.path.join(workdir, DB_NAME)
+        if args.db and os.path.exists(args.db):
+            print(f"reusing {args.db}")
+            conn = sqlite3.connect(args.db)
+            conn.execute(f"VACUUM INTO '{db_path}'")
+            conn.close()
+        else:
+            start = time.perf_counter()
+            seed_database(db_path, args.users, args.transactions, args.seed)
+            print(f"seeded {args.users} users and {args.transactions} transactions "
+                  f"in {time.perf_counter() - start:.1f}s")
+            if args.db:
+                conn = sqlite3.connect(db_path)
+                conn.execute(f"VACUUM INTO '{args.db}'")
+                conn.close()
+
+        results = {}
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            if args.mode in ("testclient", "both"):
+                results["testclient"] = bench_test_client(args)
+            if args.mode in ("gunicorn", "both"):
+                results["gunicorn"] = bench_gunicorn(workdir, args)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("save", "compare", "db")},
+        },
+        "results": results,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nsaved {args.save}")
+    if args.compare:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Concurrency stress test for the transfer engine.
+
+Many threads hammer a small set of accounts, with one hot account on one
+side of most transfers. At the end the script checks that no balance went
+negative, that the total amount of money is unchanged, and that every
+retried idempotency key posted only once.
+
+    python benchmarks/stress_transfers.py --threads 16 --transfers 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import ConnectionPool  # noqa: E402
+from money import Money  # noqa: E402
+import transfers  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "schema.sql")
+
+
+def seed(pool, accounts, balance):
+    conn = pool.acquire()
+    with open(SCHEMA_PATH) as f:
+        conn.executescript(f.read())
+    conn.executemany(
+        "INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'x')",
+        [(i, f"user{i}") for i in range(1, accounts + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO accounts (id, user_id, account_number, balance_cents) VALUES (?, ?, ?, ?)",
+        [(i, i, f"AC{100000 + i}", balance) for i in range(1, accounts + 1)],
+    )
+    conn.commit()
+    pool.release(conn)
+
+
+def worker(pool, accounts, count, hot_ratio, seed_value, outcomes, lock):
+    rng = random.Random(seed_value)
+    conn = pool.acquire()
+    local = {"ok": 0, "replayed": 0, "rejected": 0}
+    try:
+        for i in range(count):
+            if rng.random() < hot_ratio:
+                src, dst = 1, rng.randint(2, accounts)
+                if rng.random() < 0.5:
+                    src, dst = dst, src
+            else:
+                src, dst = rng.sample(range(1, accounts + 1), 2)
+            amount = Money(rng.randint(100, 25000))
+            key = f"{seed_value}-{i}"
+            # Every tenth transfer is sent twice to exercise idempotency
+            for _ in range(2 if i % 10 == 0 else 1):
+                try:
+                    result = transfers.transfer(conn, src, f"AC{100000 + dst}", amount, idempotency_key=key)
+                    local["replayed" if result.replayed else "ok"] += 1
+                except transfers.TransferError:
+                    local["rejected"] += 1
+    finally:
+        pool.release(conn)
+    with lock:
+        for k, v in local.items():
+            outcomes[k] += v
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--transfers", type=int, default=1000, help="transfers per thread")
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--balance", type=Money.parse, default=Money(100000))
+    parser.add_argument("--hot-ratio", type=float, default=0.8,
+                        help="share of transfers touching the hot account")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, "stress.db"), size=args.threads + 1)
+        seed(pool, args.accounts, args.balance.cents)
+
+        outcomes = {"ok": 0, "replayed": 0, "rejected": 0}
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=worker, args=(pool, args.accounts, args.transfers,
+                                                   args.hot_ratio, n, outcomes, lock))
+            for n in range(args.threads)
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        conn = pool.acquire()
+        total, lowest = conn.execute("SELECT SUM(balance_cents), MIN(balance_cents) FROM accounts").fetchone()
+        posted = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        dup_keys = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM transactions WHERE idempotency_key IS NOT NULL "
+            "GROUP BY from_account_id, idempotency_key HAVING COUNT(*) > 1)"
+        ).fetchone()[0]
+        pool.release(conn)
+        pool.close_all()
+
+    expected = args.accounts * args.balance.cents
+    print(f"transfers posted : {outcomes['ok']} ({posted} rows)")
+    print(f"replays returned : {outcomes['replayed']}")
+    print(f"rejected         : {outcomes['rejected']}")
+    print(f"elapsed          : {elapsed:.2f}s ({outcomes['ok'] / elapsed:.0f} transfers/s)")
+    print(f"money total      : {Money(total)} (expected {Money(expected)})")
+    print(f"lowest balance   : {Money(lowest)}")
+
+    failures = []
+    if total != expected:
+        failures.append("money was created or destroyed")
+    if lowest < 0:
+        failures.append("an account was overdrawn")
+    if posted != outcomes["ok"]:
+        failures.append("posted rows do not match successful transfers")
+    if dup_keys:
+        failures.append(f"{dup_keys} idempotency keys posted more than once")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
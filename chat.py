@@ -0,0 +1,287 @@
+"""Gemini chatbot calls, run off the request workers.
+
+Model calls go through a small dedicated thread pool with its own limit on
+in-flight requests and a per-request deadline. One slow LLM reply can then
+no longer hold up the banking pages. When the pool is saturated new chats
+are refused straight away instead of queueing behind the slow ones.
+"""
+import hashlib
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from database import cache_version
+from money import money_fields
+
+SYSTEM_INSTRUCTIONS = (
+    "You are an AI investment assistant for Apex Bank. "
+    "First, ask the user about their preferences (risk level, time horizon, liquidity needs). "
+    "Then, recommend the top two policies from the provided list that best match. "
+    "Respond clearly with brief reasoning and the two choices."
+)
+
+
+class ChatUnavailable(Exception):
+    """Base class for chats that could not be served."""
+
+    code = "chat_unavailable"
+    status = 503
+
+
+class ChatBusy(ChatUnavailable):
+    code = "chat_busy"
+    status = 503
+
+
+class ChatTimeout(ChatUnavailable):
+    code = "chat_timeout"
+    status = 504
+
+
+def is_blocking_worker(environ) -> bool:
+    """True under a gunicorn sync worker, where waiting on the model holds the whole worker.
+
+    gunicorn's threaded and async workers (gthread, gevent, eventlet) set
+    ``wsgi.multithread``; the sync worker does not.
+    """
+    return environ.get("SERVER_SOFTWARE", "").startswith("gunicorn") and not environ.get("wsgi.multithread")
+
+
+POLICY_COLUMNS = "id, name, description, risk_level, expected_return, min_investment_cents, goal, lock_in, liquidity"
+
+
+class PolicyCatalogCache:
+    """The policy catalog and its prompt block, rebuilt only when policies change.
+
+    Triggers on ``policies`` bump ``cache_versions['policies']``. Each use costs
+    one primary-key lookup instead of re-reading the table and re-running
+    ``json.dumps`` over it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._policies = []
+        self._block = ""
+        self.rebuilds = 0
+
+    def get(self, db):
+        """Return ``(policy_list, serialized_block)`` for the current catalog."""
+        version = cache_version(db, "policies")
+        with self._lock:
+            if version == self._version:
+                return self._policies, self._block
+        rows = db.execute(f"SELECT {POLICY_COLUMNS} FROM policies ORDER BY id").fetchall()
+        policies = [money_fields(dict(p)) for p in rows]
+        block = json.dumps(policies, indent=2)
+        with self._lock:
+            self._version, self._policies, self._block = version, policies, block
+            self.rebuilds += 1
+        return policies, block
+
+
+def build_prompt(messages: list, policy_block: str, user_context: dict) -> str:
+    """Combine instructions, policy catalog, user context and history into one prompt.
+
+    ``policy_block`` is the already-serialized catalog from PolicyCatalogCache.
+    """
+    parts = [
+        SYSTEM_INSTRUCTIONS, "\n\n",
+        "--- AVAILABLE POLICIES ---\n", policy_block, "\n\n",
+        "--- USER CONTEXT ---\n", json.dumps(user_context, indent=2), "\n\n",
+        "--- CONVERSATION HISTORY ---\n",
+    ]
+    for m in messages:
+        # Change 'model' to 'assistant' for the prompt
+        parts.append(m.get("role", "user").replace("model", "assistant"))
+        parts.append(": ")
+        parts.append(m.get("content", ""))
+        parts.append("\n")
+    # Add the final "assistant:" prefix to prompt the model to respond
+    parts.append("assistant:")
+    return "".join(parts)
+
+
+def prompt_key(prompt: str) -> str:
+    """Cache key for a prompt: case and runs of whitespace do not matter.
+
+    The prompt carries the user's name, balance and holdings, and a reply
+    may quote them back, so the key covers all of it and users never share
+    an entry. The cache only pays off when one user repeats a question with
+    nothing in their account changed since; questions common to many users
+    are served by the local rules in ``recommender.py`` instead.
+    """
+    normalized = " ".join(prompt.lower().split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class ResponseCache:
+    """A thread-safe LRU of model replies whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, max_entries=512, ttl=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class LazyGeminiModel:
+    """A ``genai.GenerativeModel`` that imports and configures the SDK on first use.
+
+    Importing ``google.generativeai`` takes most of a second. Doing it lazily
+    keeps that cost off every worker boot and off workers that never serve a
+    chat.
+    """
+
+    def __init__(self, api_key, name="gemini-2.5-flash"):
+        self.api_key = api_key
+        self.name = name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(self.name)
+            return self._model
+
+    def generate_content(self, prompt, stream=False):
+        return self._load().generate_content(prompt, stream=stream)
+
+
+class ChatService:
+    """Runs ``model.generate_content`` on a bounded pool with a deadline.
+
+    ``model`` is anything with a ``generate_content(prompt, stream=False)``
+    method shaped like ``genai.GenerativeModel``, which lets a local fake
+    stand in for the real SDK.
+    """
+
+    def __init__(self, model, max_workers=4, max_in_flight=16, timeout=30.0):
+        self.model = model
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat")
+        # Counts calls that are queued or running; a timed-out call keeps its
+        # slot until the model actually returns
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise ChatBusy("The assistant is busy, please try again shortly.")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    def complete(self, prompt: str) -> str:
+        """Return the whole reply, or raise ChatBusy / ChatTimeout."""
+        future = self._submit(self._generate, prompt)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise ChatTimeout("The assistant took too long to answer.") from None
+
+    def _produce(self, prompt, out, cancelled):
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                if cancelled.is_set():
+                    return
+                text = getattr(chunk, "text", "")
+                if text:
+                    out.put(("token", text))
+            out.put(("done", None))
+        except Exception as e:
+            out.put(("error", e))
+
+    def stream(self, prompt: str):
+        """Start a streamed reply and return an iterator of text chunks.
+
+        The pool slot is taken before this returns, so ChatBusy is raised
+        up front rather than halfway through a response. Iterating raises
+        ChatTimeout once the deadline passes, and re-raises model errors.
+        """
+        out = queue.Queue()
+        cancelled = threading.Event()
+        self._submit(self._produce, prompt, out, cancelled)
+        return self._drain(out, cancelled, time.monotonic() + self.timeout)
+
+    def _drain(self, out, cancelled, deadline):
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ChatTimeout("The assistant took too long to answer.")
+                try:
+                    kind, value = out.get(timeout=remaining)
+                except queue.Empty:
+                    raise ChatTimeout("The assistant took too long to answer.") from None
+                if kind == "token":
+                    yield value
+                elif kind == "done":
+                    return
+                else:
+                    raise value
+        finally:
+            # Client went away or we gave up: let the producer stop early
+            cancelled.set()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
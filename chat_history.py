@@ -0,0 +1,106 @@
+"""Server-side chatbot conversations.
+
+Messages are kept in SQLite, and the session cookie only carries the
+conversation id. Each conversation stores at most ``max_turns`` messages.
+The history handed to the model is also cut to a token budget, so prompt
+size stays flat however long a chat runs.
+"""
+import uuid
+
+DEFAULT_MAX_TURNS = 20
+DEFAULT_MAX_TOKENS = 2000
+# Older conversations beyond this many per user are deleted
+MAX_CONVERSATIONS_PER_USER = 5
+TRUNCATED_NOTE = "(Earlier messages in this conversation were omitted.)"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def start_conversation(db, user_id) -> str:
+    """Create an empty conversation for ``user_id`` and return its id."""
+    conversation_id = uuid.uuid4().hex
+    db.execute(
+        "INSERT INTO chat_conversations (id, user_id) VALUES (?, ?)",
+        (conversation_id, user_id),
+    )
+    db.execute(
+        """
+        DELETE FROM chat_conversations
+        WHERE user_id = ? AND id NOT IN (
+            SELECT id FROM chat_conversations WHERE user_id = ?
+            ORDER BY updated_at DESC, rowid DESC LIMIT ?
+        )
+        """,
+        (user_id, user_id, MAX_CONVERSATIONS_PER_USER),
+    )
+    db.commit()
+    return conversation_id
+
+
+def owns_conversation(db, conversation_id, user_id) -> bool:
+    return db.execute(
+        "SELECT 1 FROM chat_conversations WHERE id = ? AND user_id = ?",
+        (conversation_id, user_id),
+    ).fetchone() is not None
+
+
+def append_message(db, conversation_id, role, content, max_turns=DEFAULT_MAX_TURNS):
+    """Store one message and drop the conversation's oldest ones past ``max_turns``."""
+    db.execute(
+        "INSERT INTO chat_messages (conversation_id, role, content, tokens) VALUES (?, ?, ?, ?)",
+        (conversation_id, role, content, estimate_tokens(content)),
+    )
+    dropped = db.execute(
+        """
+        DELETE FROM chat_messages
+        WHERE conversation_id = ?1 AND id <= (
+            SELECT id FROM chat_messages WHERE conversation_id = ?1
+            ORDER BY id DESC LIMIT 1 OFFSET ?2
+        )
+        """,
+        (conversation_id, max_turns),
+    ).rowcount
+    db.execute(
+        "UPDATE chat_conversations SET updated_at = CURRENT_TIMESTAMP, "
+        "dropped_messages = dropped_messages + ? WHERE id = ?",
+        (dropped, conversation_id),
+    )
+    db.commit()
+
+
+def load_window(db, conversation_id, max_turns=DEFAULT_MAX_TURNS, max_tokens=DEFAULT_MAX_TOKENS,
+                pending=None) -> list:
+    """Most recent messages that fit in ``max_tokens``, oldest first.
+
+    The newest message is always included, clipped to the budget if it is
+    too long on its own. When older messages are left out, a short note in
+    their place tells the model the history is partial. ``pending`` is a
+    message not stored yet, such as the user turn awaiting a reply; it
+    counts as the newest one.
+    """
+    rows = db.execute(
+        "SELECT role, content, tokens FROM chat_messages WHERE conversation_id = ? "
+        "ORDER BY id DESC LIMIT ?",
+        (conversation_id, max_turns),
+    ).fetchall()
+    if pending is not None:
+        rows = [dict(pending, tokens=estimate_tokens(pending["content"]))] + rows
+    window = []
+    used = 0
+    for row in rows[:max_turns]:
+        if used + row["tokens"] > max_tokens:
+            if not window:
+                window.append({"role": row["role"], "content": row["content"][: max_tokens * 4]})
+            break
+        window.append({"role": row["role"], "content": row["content"]})
+        used += row["tokens"]
+    dropped = db.execute(
+        "SELECT dropped_messages FROM chat_conversations WHERE id = ?", (conversation_id,)
+    ).fetchone()
+    if len(window) < len(rows) or (dropped and dropped[0]):
+        window.append({"role": "system", "content": TRUNCATED_NOTE})
+    window.reverse()
+    return window
@@ -0,0 +1,333 @@
+"""Pooled SQLite connections handed out through Flask's app context.
+
+Requests that only read call ``get_db(readonly=True)`` and get a connection
+from a separate pool of ``mode=ro`` connections. ``DB_READ_MODE`` picks
+where those connections point:
+
+``snapshot``
+    The live database file. Each read transaction sees the last commit
+    before it began (a WAL snapshot), so reads are never stale.
+``backup``
+    A copy a background thread refreshes with ``sqlite3.Connection.backup``
+    to keep it within ``DB_READ_MAX_STALENESS`` seconds. Long reports then
+    never pin the live WAL. While the copy is older than that, reads fall
+    back to the read-write pool.
+``primary``
+    No split; read-only callers share the read-write pool.
+"""
+import logging
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g
+
+log = logging.getLogger(__name__)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection frees up in time."""
+
+
+class ConnectionPool:
+    """A fixed-size pool of tuned SQLite connections.
+
+    Connections are created lazily up to ``size`` and reused afterwards, so
+    the connect and PRAGMA cost is paid once per connection instead of once
+    per request. The pool is per process: if it notices it has been forked
+    (e.g. by a gunicorn master with ``--preload``) it drops the inherited
+    connections and starts over.
+    """
+
+    def __init__(self, path, size=8, timeout=30.0, busy_timeout_ms=5000,
+                 mmap_size=268435456, cache_size_kib=65536, factory=sqlite3.Connection,
+                 readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            pathlib.Path(self.path).resolve().as_uri() + "?mode=ro" if self.readonly else self.path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            factory=self.factory,
+            uri=self.readonly,
+        )
+        conn.row_factory = sqlite3.Row
+        if self.readonly:
+            conn.execute("PRAGMA query_only = ON;")
+        else:
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)};")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)};")
+        # Negative cache_size is interpreted by SQLite as KiB rather than pages
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kib)};")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        return conn
+
+    def acquire(self):
+        """Check a connection out of the pool, creating one if there is room."""
+        start = time.perf_counter()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+        if conn is None:
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout(
+                        f"no database connection available after {self.timeout}s"
+                    ) from None
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn):
+        """Return a connection, rolling back anything left uncommitted."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is discarded and replaced on demand
+            conn.close()
+            with self._lock:
+                self._in_use -= 1
+                self._created -= 1
+            return
+        with self._lock:
+            self._in_use -= 1
+            if self._pid != os.getpid():
+                conn.close()
+                return
+        self._idle.put(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": checkouts,
+                "wait_total_ms": round(self._wait_total * 1000, 3),
+                "wait_avg_ms": round(self._wait_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+class ReplicaRefresher:
+    """Keeps ``replica`` a copy of ``source`` no older than ``max_staleness`` seconds.
+
+    The copy is made with the online backup API, page by page under a read
+    transaction, so writers on ``source`` are not blocked. The replica's
+    mtime records the last refresh, so several worker processes sharing one
+    replica do not all copy it.
+    """
+
+    def __init__(self, source, replica, max_staleness=30.0):
+        self.source = source
+        self.replica = replica
+        self.max_staleness = max_staleness
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def age(self) -> float:
+        try:
+            return time.time() - os.path.getmtime(self.replica)
+        except OSError:
+            return float("inf")
+
+    def is_stale(self) -> bool:
+        return self.age() > self.max_staleness
+
+    def refresh(self, force=False, max_age=None) -> bool:
+        """Copy the source now if the replica is older than ``max_age`` (default
+        ``max_staleness``) or ``force``; return True if copied."""
+        if max_age is None:
+            max_age = self.max_staleness
+        with self._lock:
+            if not force and self.age() < max_age:
+                return False
+            src = sqlite3.connect(self.source)
+            dst = sqlite3.connect(self.replica)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+                src.close()
+            os.utime(self.replica)
+            self.refreshes += 1
+            return True
+
+    def start(self):
+        """Refresh in a daemon thread of this process from now on."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="replica-refresher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Copying at half the bound keeps the replica inside it between wakeups
+        interval = max(self.max_staleness / 4, 0.1)
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh(max_age=self.max_staleness / 2)
+            except sqlite3.Error:
+                log.exception("Replica refresh failed")
+
+
+def init_app(app, path, factory=sqlite3.Connection):
+    """Attach connection pools to ``app`` and return pooled connections on teardown.
+
+    ``factory`` is the ``sqlite3.Connection`` subclass used for new connections.
+    Returns the read-write pool.
+    """
+    app.config.setdefault("DB_POOL_SIZE", int(os.getenv("DB_POOL_SIZE", "8")))
+    app.config.setdefault("DB_POOL_TIMEOUT", float(os.getenv("DB_POOL_TIMEOUT", "30")))
+    app.config.setdefault("DB_BUSY_TIMEOUT_MS", int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")))
+    app.config.setdefault("DB_MMAP_SIZE", int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))))
+    app.config.setdefault("DB_CACHE_SIZE_KIB", int(os.getenv("DB_CACHE_SIZE_KIB", "65536")))
+    # Where get_db(readonly=True) reads from: snapshot, backup or primary
+    app.config.setdefault("DB_READ_MODE", os.getenv("DB_READ_MODE", "snapshot"))
+    app.config.setdefault("DB_READ_POOL_SIZE", int(os.getenv("DB_READ_POOL_SIZE", "4")))
+    app.config.setdefault("DB_READ_MAX_STALENESS", float(os.getenv("DB_READ_MAX_STALENESS", "30")))
+    app.config.setdefault("DB_REPLICA_PATH", os.getenv(
+        "DB_REPLICA_PATH", "{}.replica{}".format(*os.path.splitext(path))))
+
+    def make_pool(pool_path, size, readonly=False):
+        return ConnectionPool(
+            pool_path,
+            size=size,
+            timeout=app.config["DB_POOL_TIMEOUT"],
+            busy_timeout_ms=app.config["DB_BUSY_TIMEOUT_MS"],
+            mmap_size=app.config["DB_MMAP_SIZE"],
+            cache_size_kib=app.config["DB_CACHE_SIZE_KIB"],
+            factory=factory,
+            readonly=readonly,
+        )
+
+    pool = make_pool(path, app.config["DB_POOL_SIZE"])
+    app.extensions["db_pool"] = pool
+    read_mode = app.config["DB_READ_MODE"]
+    if read_mode == "snapshot":
+        app.extensions["db_read_pool"] = make_pool(path, app.config["DB_READ_POOL_SIZE"], readonly=True)
+    elif read_mode == "backup":
+        replica = ReplicaRefresher(path, app.config["DB_REPLICA_PATH"], app.config["DB_READ_MAX_STALENESS"])
+        replica.refresh()
+        app.extensions["db_replica"] = replica
+        app.extensions["db_read_pool"] = make_pool(replica.replica, app.config["DB_READ_POOL_SIZE"], readonly=True)
+    elif read_mode != "primary":
+        raise RuntimeError(f"DB_READ_MODE must be snapshot, backup or primary, not {read_mode!r}")
+
+    @app.teardown_appcontext
+    def release_db(exc):
+        _release(pool, g.pop("db", None))
+        _release(app.extensions.get("db_read_pool"), g.pop("db_ro", None))
+
+    return pool
+
+
+def _release(pool, conn):
+    if conn is not None:
+        pool.release(conn)
+
+
+def cache_version(db, name) -> int:
+    """Current value of a ``cache_versions`` counter (0 if never bumped).
+
+    Triggers in schema.sql bump a counter whenever the table it names changes,
+    so in-process caches can tell when to rebuild.
+    """
+    row = db.execute("SELECT version FROM cache_versions WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def get_pool() -> ConnectionPool:
+    return current_app.extensions["db_pool"]
+
+
+def release_db():
+    """Hand this app context's connections back early, e.g. before a long stream."""
+    _release(get_pool(), g.pop("db", None))
+    _release(current_app.extensions.get("db_read_pool"), g.pop("db_ro", None))
+
+
+def get_db(readonly=False):
+    """Return this app context's connection, checking one out on first use.
+
+    ``readonly=True`` is for requests that never write; they are served by
+    the read pool when ``DB_READ_MODE`` is not ``primary``.
+    """
+    if readonly:
+        read_pool = current_app.extensions.get("db_read_pool")
+        if read_pool is not None:
+            if "db_ro" not in g:
+                replica = current_app.extensions.get("db_replica")
+                if replica is not None:
+                    replica.start()
+                # Refreshing is left to the thread; while it is behind, reads
+                # go to the primary rather than past DB_READ_MAX_STALENESS
+                if replica is None or not replica.is_stale():
+                    g.db_ro = read_pool.acquire()
+            if "db_ro" in g:
+                return g.db_ro
+    if "db" not in g:
+        g.db = get_pool().acquire()
+    return g.db
@@ -0,0 +1,89 @@
+"""Streaming statement exports (CSV / JSON Lines).
+
+Rows are pulled from one SQLite cursor with ``fetchmany`` and encoded a
+chunk at a time, so memory use does not depend on the size of the ledger.
+Every row carries a ``cursor`` value; passing the last one received as
+``resume`` restarts the export right after that row.
+"""
+import csv
+import io
+import json
+import zlib
+
+import history
+
+FETCH_SIZE = 1000
+CSV_COLUMNS = ["id", "created_at", "tx_type", "direction", "counterparty", "amount", "description", "cursor"]
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+
+def iter_transactions(conn, account_id, filters=None, resume=None, fetch_size=FETCH_SIZE):
+    """Yield serialized transactions newest first, starting after the ``resume`` cursor."""
+    after = history.decode_cursor(resume) if resume else None
+    sql, params = history.history_query(account_id, after, filters)
+    cur = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                item = history.serialize_transaction(row, account_id)
+                item["amount"] = str(item["amount"])
+                item["cursor"] = history.encode_cursor(row["created_at"], row["id"])
+                yield item
+    finally:
+        cur.close()
+
+
+def _chunks(items, chunk_rows):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_csv(items, header=True, chunk_rows=FETCH_SIZE):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for chunk in _chunks(items, chunk_rows):
+        writer.writerows([[item[col] for col in CSV_COLUMNS] for item in chunk])
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def encode_jsonl(items, chunk_rows=FETCH_SIZE):
+    for chunk in _chunks(items, chunk_rows):
+        yield "".join(json.dumps(item, separators=(",", ":")) + "\n" for item in chunk).encode()
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a byte stream into a single gzip member as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def export_stream(conn, account_id, fmt, filters=None, resume=None, compress=False):
+    items = iter_transactions(conn, account_id, filters, resume)
+    if fmt == "csv":
+        # A resumed download is appended to the partial file, so no second header
+        body = encode_csv(items, header=not resume)
+    else:
+        body = encode_jsonl(items)
+    return gzip_stream(body) if compress else body
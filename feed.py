@@ -0,0 +1,203 @@
+"""Live balance and transaction events for connected browsers.
+
+``Broker`` fans events out to per-account subscriptions. A subscription is
+only a bounded deque and an ``Event``, so idle subscribers cost no thread.
+Under gevent (``--worker-class gevent``) a worker holds thousands of them.
+One ``LedgerWatcher`` thread per process tails ``transactions`` by id and
+publishes what it finds. That catches transfers committed by other workers
+and by the CLI too. Request handlers call ``poke()`` after a commit so their
+own transfers go out without waiting for the next poll.
+"""
+import json
+import logging
+import threading
+from collections import deque
+
+import history
+from money import Money
+
+log = logging.getLogger(__name__)
+
+NEW_TRANSACTIONS_SQL = """
+    SELECT t.id, t.from_account_id, t.to_account_id, t.amount_cents, t.tx_type,
+           t.description, t.created_at,
+           fa.account_number AS from_account_number,
+           ta.account_number AS to_account_number
+    FROM transactions t
+    LEFT JOIN accounts fa ON t.from_account_id = fa.id
+    LEFT JOIN accounts ta ON t.to_account_id = ta.id
+    WHERE t.id > ?
+    ORDER BY t.id
+    LIMIT ?
+"""
+
+
+class FeedFull(Exception):
+    """This process already serves ``max_subscribers`` live feeds."""
+
+
+class Subscription:
+    """Events queued for one connected client."""
+
+    __slots__ = ("account_id", "_events", "_ready", "_lock", "overflowed", "closed")
+
+    def __init__(self, account_id, max_queue):
+        self.account_id = account_id
+        self._events = deque(maxlen=max_queue)
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self.overflowed = False
+        self.closed = False
+
+    def push(self, event, data):
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                # The client fell behind; it is told to reload instead
+                self.overflowed = True
+            self._events.append((event, data))
+        self._ready.set()
+
+    def wait(self, timeout):
+        """Return the queued events, waiting up to ``timeout`` seconds for one."""
+        self._ready.wait(timeout)
+        with self._lock:
+            self._ready.clear()
+            if self.overflowed:
+                self._events.clear()
+                self.overflowed = False
+                return [("resync", {})]
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+
+class Broker:
+    """In-process pub/sub keyed by account id."""
+
+    def __init__(self, max_subscribers=5000, max_queue=100):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subs = {}
+        self._count = 0
+        self.published = 0
+
+    def subscribe(self, account_id) -> Subscription:
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise FeedFull("Too many live connections, please try again later.")
+            sub = Subscription(account_id, self.max_queue)
+            self._subs.setdefault(account_id, set()).add(sub)
+            self._count += 1
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.account_id)
+            if subs and sub in subs:
+                subs.discard(sub)
+                self._count -= 1
+                if not subs:
+                    del self._subs[sub.account_id]
+        sub.closed = True
+        sub._ready.set()
+
+    def accounts(self) -> set:
+        with self._lock:
+            return set(self._subs)
+
+    def publish(self, account_id, event, data) -> int:
+        with self._lock:
+            subs = list(self._subs.get(account_id, ()))
+            self.published += len(subs)
+        for sub in subs:
+            sub.push(event, data)
+        return len(subs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"subscribers": self._count, "accounts": len(self._subs), "published": self.published}
+
+
+class LedgerWatcher:
+    """Tails ``transactions`` and publishes new rows and balances to the broker."""
+
+    def __init__(self, pool, broker, interval=1.0, batch=1000):
+        self.pool = pool
+        self.broker = broker
+        self.interval = interval
+        self.batch = batch
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_id = None
+
+    def start(self):
+        """Start the watcher thread in this process if it is not running yet."""
+        with self._lock:
+            if self._last_id is None:
+                self._last_id = self._max_id()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ledger-watcher", daemon=True)
+                self._thread.start()
+
+    def poke(self):
+        """Check for new transactions now instead of at the next interval."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception:
+                log.exception("Ledger watcher error")
+
+    def _max_id(self):
+        conn = self.pool.acquire()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+        finally:
+            self.pool.release(conn)
+
+    def poll(self) -> int:
+        """Publish transactions committed since the last call; return how many were seen."""
+        if not self.broker.accounts():
+            # Nobody is listening: skip ahead rather than read rows no one wants.
+            # Checking again after reading the id means a feed opened meanwhile
+            # still gets everything committed after it subscribed.
+            max_id = self._max_id()
+            if not self.broker.accounts():
+                self._last_id = max_id
+                return 0
+        conn = self.pool.acquire()
+        try:
+            watched = self.broker.accounts()
+            rows = conn.execute(NEW_TRANSACTIONS_SQL, (self._last_id, self.batch)).fetchall()
+            if not rows:
+                return 0
+            self._last_id = rows[-1]["id"]
+            touched = set()
+            for row in rows:
+                for account_id in (row["from_account_id"], row["to_account_id"]):
+                    if account_id in watched:
+                        item = history.serialize_transaction(row, account_id)
+                        item["amount"] = str(item["amount"])
+                        item["cursor"] = history.encode_cursor(row["created_at"], row["id"])
+                        self.broker.publish(account_id, "transaction", item)
+                        touched.add(account_id)
+            if touched:
+                balances = conn.execute(
+                    "SELECT id, balance_cents FROM accounts WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(sorted(touched)),),
+                ).fetchall()
+                for b in balances:
+                    self.broker.publish(b["id"], "balance",
+                                        {"balance": str(Money(b["balance_cents"])), "balance_cents": b["balance_cents"]})
+            if len(rows) == self.batch:
+                # More are waiting; go again without sleeping
+                self._wake.set()
+            return len(rows)
+        finally:
+            self.pool.release(conn)
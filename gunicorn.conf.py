@@ -0,0 +1,16 @@
+"""gunicorn settings, read automatically when gunicorn starts in this directory.
+
+    gunicorn "app:create_app()"
+
+Chatbot replies wait up to ``CHAT_TIMEOUT`` on the model and SSE feeds stay
+open, so the default sync worker (one request at a time) would let one chat
+hold a whole worker. gthread serves ``GUNICORN_THREADS`` requests per worker.
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Migrations and the app's caches load once in the master, before the fork
+preload_app = True
@@ -0,0 +1,142 @@
+"""Keyset-paginated transaction history queries."""
+import base64
+import json
+
+from money import Money
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(created_at, tx_id) -> str:
+    if isinstance(created_at, str) and '"' not in created_at and "\\" not in created_at:
+        # Same bytes json.dumps would produce, without its per-call overhead;
+        # exports encode one cursor per row
+        raw = f'["{created_at}",{int(tx_id)}]'.encode()
+    else:
+        raw = json.dumps([created_at, tx_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, tx_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), int(tx_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"invalid cursor: {cursor!r}") from e
+
+
+def _like_pattern(term: str) -> str:
+    """A LIKE pattern matching ``term`` anywhere, with its own ``%`` and ``_`` taken literally."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _branch(side: str, other: str, account_id, after, filters: dict, limit):
+    """One half of the UNION ALL: rows where ``side`` is this account.
+
+    Each half walks its own (``side``, created_at, id) index in descending
+    order and stops after ``limit`` rows, so no half ever sorts or scans the
+    whole table.
+    """
+    where = [f"t.{side} = ?"]
+    params = [account_id]
+    if side == "to_account_id":
+        # Rows on both sides are already returned by the from_account_id half
+        where.append("t.from_account_id IS NOT ?")
+        params.append(account_id)
+    if after is not None:
+        where.append("(t.created_at, t.id) < (?, ?)")
+        params.extend(after)
+    if filters.get("date_from"):
+        where.append("t.created_at >= ?")
+        params.append(filters["date_from"])
+    if filters.get("date_to"):
+        where.append("t.created_at < date(?, '+1 day')")
+        params.append(filters["date_to"])
+    if filters.get("tx_type"):
+        where.append("t.tx_type = ?")
+        params.append(filters["tx_type"])
+    if filters.get("search"):
+        pattern = _like_pattern(filters["search"])
+        where.append(
+            f"(t.description LIKE ? ESCAPE '\\' OR EXISTS (SELECT 1 FROM accounts a "
+            f"WHERE a.id = t.{other} AND a.account_number LIKE ? ESCAPE '\\'))"
+        )
+        params.extend([pattern, pattern])
+    sql = (
+        f"SELECT * FROM (SELECT t.id, t.amount_cents, t.tx_type, t.description, t.created_at, "
+        f"t.from_account_id, t.to_account_id FROM transactions t "
+        f"WHERE {' AND '.join(where)} "
+        f"ORDER BY t.created_at DESC, t.id DESC"
+    )
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql + ")", params
+
+
+def history_query(account_id, after=None, filters=None, limit=None):
+    """Build the SQL and parameters for one page of an account's history."""
+    filters = filters or {}
+    from_sql, from_params = _branch("from_account_id", "to_account_id", account_id, after, filters, limit)
+    to_sql, to_params = _branch("to_account_id", "from_account_id", account_id, after, filters, limit)
+    sql = f"""
+        SELECT
+            t.id,
+            t.amount_cents,
+            t.tx_type,
+            t.description,
+            t.created_at,
+            t.from_account_id,
+            t.to_account_id,
+            fa.account_number AS from_account_number,
+            ta.account_number AS to_account_number
+        FROM ({from_sql} UNION ALL {to_sql}) t
+        LEFT JOIN accounts fa ON t.from_account_id = fa.id
+        LEFT JOIN accounts ta ON t.to_account_id = ta.id
+        ORDER BY t.created_at DESC, t.id DESC
+    """
+    params = from_params + to_params
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def serialize_transaction(row, account_id) -> dict:
+    sent = row["from_account_id"] == account_id
+    return {
+        "id": row["id"],
+        "amount": Money(row["amount_cents"]),
+        "amount_cents": row["amount_cents"],
+        "tx_type": row["tx_type"],
+        "description": row["description"],
+        "created_at": row["created_at"],
+        "direction": "sent" if sent else "received",
+        "counterparty": row["to_account_number"] if sent else row["from_account_number"],
+    }
+
+
+def fetch_page(db, account_id, cursor=None, filters=None, limit=DEFAULT_PAGE_SIZE) -> dict:
+    """Return up to ``limit`` transactions older than ``cursor`` plus the next cursor."""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+    # Fetch one extra row to learn whether another page exists
+    sql, params = history_query(account_id, after, filters, limit + 1)
+    rows = db.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return {
+        "transactions": [serialize_transaction(r, account_id) for r in rows],
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,204 @@
+"""Bulk import of users and their accounts from CSV or JSONL.
+
+Rows are read as a stream and handled in batches. Duplicate usernames are
+found with one query per batch. Passwords are hashed on a process pool while
+earlier batches are being written. Each batch goes in as one transaction
+that inserts the users, their accounts and the run's progress, so an
+interrupted import resumes after the last committed batch.
+
+CSV needs a header row with ``username`` and either ``password`` or
+``password_hash`` (a werkzeug hash carried over from the old system).
+``email``, ``phone`` and ``balance`` are optional. JSONL takes the same keys,
+one object per line.
+"""
+import csv
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from werkzeug.security import generate_password_hash
+
+from money import Money, InvalidMoney
+
+MIN_PASSWORD_LENGTH = 6
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    # Rows skipped because an earlier run already committed them
+    resumed_from: int = 0
+    elapsed: float = 0.0
+    # The first few rejected rows as ``(row number, reason)``
+    rejected: list = field(default_factory=list)
+
+    @property
+    def rate(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+def read_rows(path, fmt=None):
+    """Yield one dict per input row; None for a JSONL line that is not an object."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+
+
+def _hash_passwords(passwords, method):
+    # Runs in a pool process
+    return [generate_password_hash(p, method=method) if p is not None else None for p in passwords]
+
+
+def _clean(row, default_balance):
+    """Return ``(fields, None)`` or ``(None, reason)`` for one input row."""
+    if row is None:
+        return None, "not a JSON object"
+    username = str(row.get("username") or "").strip()
+    password = row.get("password")
+    password_hash = str(row.get("password_hash") or "").strip() or None
+    if not username:
+        return None, "missing username"
+    if password_hash is None and (not password or len(str(password)) < MIN_PASSWORD_LENGTH):
+        return None, f"password must be at least {MIN_PASSWORD_LENGTH} characters"
+    try:
+        balance = Money.parse(row["balance"]) if str(row.get("balance") or "").strip() else default_balance
+    except InvalidMoney as e:
+        return None, str(e)
+    if balance.cents < 0:
+        return None, "negative balance"
+    return {
+        "username": username,
+        "password": None if password_hash else str(password),
+        "password_hash": password_hash,
+        "email": str(row.get("email") or "").strip() or None,
+        "phone": str(row.get("phone") or "").strip() or None,
+        "balance": balance,
+    }, None
+
+
+def _existing_usernames(conn, usernames) -> set:
+    rows = conn.execute(
+        "SELECT username FROM users WHERE username IN (SELECT value FROM json_each(?))",
+        (json.dumps(usernames),),
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def _load_run(conn, run_id, source):
+    row = conn.execute("SELECT rows_done, finished_at FROM import_runs WHERE id = ?", (run_id,)).fetchone()
+    if row is None:
+        conn.execute("INSERT INTO import_runs (id, source) VALUES (?, ?)", (run_id, source))
+        conn.commit()
+        return 0, False
+    return row[0], row[1] is not None
+
+
+def _write_batch(conn, run_id, batch, hashes, stats):
+    """Insert one prepared batch and advance the run in a single transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Anyone who registered while this batch was hashing keeps their name
+        taken = _existing_usernames(conn, [r["username"] for r in batch["rows"]])
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM users").fetchone()[0]
+        users, accounts = [], []
+        for r, password_hash in zip(batch["rows"], hashes):
+            if r["username"] in taken:
+                stats.duplicates += 1
+                continue
+            user_id = next_id
+            next_id += 1
+            users.append((user_id, r["username"], password_hash or r["password_hash"], r["email"], r["phone"]))
+            accounts.append((user_id, f"AC{100000 + user_id}", r["balance"]))
+        conn.executemany(
+            "INSERT INTO users (id, username, password_hash, email, phone) VALUES (?, ?, ?, ?, ?)", users)
+        conn.executemany(
+            "INSERT INTO accounts (user_id, account_number, balance_cents) VALUES (?, ?, ?)", accounts)
+        conn.execute(
+            "UPDATE import_runs SET rows_done = rows_done + ?, imported = imported + ?, "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (batch["consumed"], len(users), run_id),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    stats.imported += len(users)
+
+
+def import_users(conn, rows, run_id, source="", hash_method="scrypt:32768:8:1", workers=None,
+                 batch_size=1000, default_balance=Money(0), progress=None) -> ImportStats:
+    """Import ``rows`` (an iterable of dicts) as users with accounts.
+
+    ``run_id`` names the import: running again with the same id skips the
+    rows an earlier run committed. ``progress`` is called with the stats
+    after every batch.
+    """
+    stats = ImportStats()
+    start = time.perf_counter()
+    done, finished = _load_run(conn, run_id, source)
+    stats.resumed_from = done
+    if finished:
+        return stats
+    rows = itertools.islice(rows, done, None)
+    row_number = done
+
+    seen = set()
+    in_flight = deque()
+    workers = workers or os.cpu_count() or 1
+    # Keep enough batches hashing to use every worker, but no more
+    max_in_flight = workers + 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            chunk = list(itertools.islice(rows, batch_size))
+            if chunk:
+                clean = []
+                for raw in chunk:
+                    row_number += 1
+                    r, reason = _clean(raw, default_balance)
+                    if r is None or r["username"] in seen:
+                        reason = reason or "duplicate username in file"
+                        stats.invalid += r is None
+                        stats.duplicates += r is not None
+                        if len(stats.rejected) < 20:
+                            stats.rejected.append((row_number, reason))
+                        continue
+                    seen.add(r["username"])
+                    clean.append(r)
+                taken = _existing_usernames(conn, [r["username"] for r in clean]) if clean else set()
+                stats.duplicates += sum(r["username"] in taken for r in clean)
+                clean = [r for r in clean if r["username"] not in taken]
+                batch = {"rows": clean, "consumed": len(chunk)}
+                future = pool.submit(_hash_passwords, [r["password"] for r in clean], hash_method)
+                in_flight.append((batch, future))
+                stats.read += len(chunk)
+            if not in_flight:
+                break
+            if chunk and len(in_flight) < max_in_flight:
+                continue
+            batch, future = in_flight.popleft()
+            _write_batch(conn, run_id, batch, future.result(), stats)
+            stats.elapsed = time.perf_counter() - start
+            if progress is not None:
+                progress(stats)
+
+    conn.execute("UPDATE import_runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?", (run_id,))
+    conn.commit()
+    stats.elapsed = time.perf_counter() - start
+    return stats
@@ -0,0 +1,219 @@
+"""Atomic policy investments and redemptions.
+
+An investment debits the account, opens or tops up the holding, and
+records an ``investment`` transaction, all in one ``BEGIN IMMEDIATE``
+transaction. Redemptions do the reverse. The limit on policies per user
+is enforced by ``users.policy_count``, which is bumped by a guarded
+primary-key UPDATE that changes no row once the user is at the limit.
+That replaces the COUNT(*) the route ran and the trigger ran again on
+every insert. An AFTER DELETE trigger on ``user_policies`` decrements the
+counter, so cascades from deleted users or policies keep it right.
+"""
+from dataclasses import dataclass
+
+from money import Money, InvalidMoney
+from transfers import with_busy_retry
+
+MAX_HOLDINGS = 2
+
+
+class InvestmentError(Exception):
+    """Base class for investments and redemptions rejected for a business reason."""
+
+    code = "investment_failed"
+    status = 400
+
+
+class InvalidAmount(InvestmentError):
+    code = "invalid_amount"
+
+
+class PolicyNotFound(InvestmentError):
+    code = "policy_not_found"
+    status = 404
+
+
+class HoldingLimitReached(InvestmentError):
+    code = "holding_limit"
+    status = 409
+
+
+class BelowMinimum(InvestmentError):
+    code = "below_minimum"
+
+
+class InsufficientFunds(InvestmentError):
+    code = "insufficient_funds"
+    status = 409
+
+
+class HoldingNotFound(InvestmentError):
+    code = "holding_not_found"
+    status = 404
+
+
+@dataclass(frozen=True)
+class InvestmentResult:
+    policy_id: int
+    amount: Money
+    # Principal held in the policy after this operation
+    holding: Money
+    # None when nothing moved (redeeming an empty holding)
+    transaction_id: int
+    # True when the holding was opened (invest) or closed (redeem)
+    opened: bool = False
+    closed: bool = False
+
+
+def _parse_amount(amount):
+    if amount is None or amount == "":
+        return None
+    try:
+        amount = Money.parse(amount)
+    except InvalidMoney:
+        raise InvalidAmount("Please enter a valid amount") from None
+    if amount.cents <= 0:
+        raise InvalidAmount("Amount must be greater than zero")
+    return amount
+
+
+def _policy(conn, policy_id):
+    row = conn.execute("SELECT name, min_investment_cents FROM policies WHERE id = ?", (policy_id,)).fetchone()
+    if row is None:
+        raise PolicyNotFound("Policy not found")
+    return row[0], Money(row[1] or 0)
+
+
+def _holding(conn, user_id, policy_id):
+    return conn.execute(
+        "SELECT id, amount_cents FROM user_policies WHERE user_id = ? AND policy_id = ?",
+        (user_id, policy_id),
+    ).fetchone()
+
+
+def _invest_once(conn, user_id, account_id, policy_id, amount, max_holdings):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        name, minimum = _policy(conn, policy_id)
+        holding = _holding(conn, user_id, policy_id)
+        if amount is None:
+            # First purchase defaults to the minimum; a top-up needs an amount
+            if holding is not None:
+                raise InvalidAmount("Enter an amount to add to this policy")
+            amount = minimum
+        if holding is None:
+            if amount < minimum:
+                raise BelowMinimum(f"The minimum investment for {name} is ${minimum}")
+            # Limit check and increment in one indexed write
+            claimed = conn.execute(
+                "UPDATE users SET policy_count = policy_count + 1 WHERE id = ? AND policy_count < ?",
+                (user_id, max_holdings),
+            ).rowcount
+            if claimed != 1:
+                raise HoldingLimitReached(f"You can invest in at most {max_holdings} policies")
+        if amount.cents > 0:
+            debited = conn.execute(
+                "UPDATE accounts SET balance_cents = balance_cents - ? WHERE id = ? AND balance_cents >= ?",
+                (amount, account_id, amount),
+            ).rowcount
+            if debited != 1:
+                raise InsufficientFunds("Insufficient funds")
+        if holding is None:
+            conn.execute(
+                "INSERT INTO user_policies (user_id, policy_id, amount_cents) VALUES (?, ?, ?)",
+                (user_id, policy_id, amount),
+            )
+            total = amount
+        else:
+            conn.execute("UPDATE user_policies SET amount_cents = amount_cents + ? WHERE id = ?",
+                         (amount, holding[0]))
+            total = Money(holding[1]) + amount
+        tx_id = None
+        if amount.cents > 0:
+            tx_id = conn.execute(
+                "INSERT INTO transactions (from_account_id, to_account_id, amount_cents, tx_type, description) "
+                "VALUES (?, NULL, ?, 'investment', ?)",
+                (account_id, amount, f"Investment in {name}"),
+            ).lastrowid
+        conn.commit()
+        return InvestmentResult(policy_id, amount, total, tx_id, opened=holding is None)
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def invest(conn, user_id, account_id, policy_id, amount=None, max_holdings=MAX_HOLDINGS,
+           max_retries=6) -> InvestmentResult:
+    """Put ``amount`` into ``policy_id`` from ``account_id``.
+
+    Opening a holding needs at least the policy's ``min_investment`` (the
+    default amount) and a free slot under ``max_holdings``. Adding to a
+    holding the user already has takes any positive amount.
+    """
+    amount = _parse_amount(amount)
+    # Users already at the limit are turned away by a plain read, without
+    # queueing for the write lock; the guarded UPDATE still settles races
+    full = conn.execute(
+        "SELECT policy_count >= ? AND NOT EXISTS "
+        "(SELECT 1 FROM user_policies WHERE user_id = users.id AND policy_id = ?) FROM users WHERE id = ?",
+        (max_holdings, policy_id, user_id),
+    ).fetchone()
+    if full and full[0]:
+        raise HoldingLimitReached(f"You can invest in at most {max_holdings} policies")
+    return with_busy_retry(lambda: _invest_once(conn, user_id, account_id, policy_id, amount, max_holdings),
+                           max_retries=max_retries)
+
+
+def _redeem_once(conn, user_id, account_id, policy_id, amount):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        name, minimum = _policy(conn, policy_id)
+        holding = _holding(conn, user_id, policy_id)
+        if holding is None:
+            raise HoldingNotFound("You do not hold this policy")
+        held = Money(holding[1])
+        amount = held if amount is None else amount
+        if amount > held:
+            raise InvalidAmount(f"You hold ${held} in {name}")
+        remaining = held - amount
+        if remaining.cents and remaining < minimum:
+            raise BelowMinimum(f"Keep at least ${minimum} in {name}, or redeem all of it")
+        if remaining.cents:
+            conn.execute("UPDATE user_policies SET amount_cents = ? WHERE id = ?", (remaining, holding[0]))
+        else:
+            # The delete trigger gives the slot back
+            conn.execute("DELETE FROM user_policies WHERE id = ?", (holding[0],))
+        tx_id = None
+        if amount.cents > 0:
+            conn.execute("UPDATE accounts SET balance_cents = balance_cents + ? WHERE id = ?", (amount, account_id))
+            tx_id = conn.execute(
+                "INSERT INTO transactions (from_account_id, to_account_id, amount_cents, tx_type, description) "
+                "VALUES (NULL, ?, ?, 'redemption', ?)",
+                (account_id, amount, f"Redemption from {name}"),
+            ).lastrowid
+        conn.commit()
+        return InvestmentResult(policy_id, amount, remaining, tx_id, closed=not remaining.cents)
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def redeem(conn, user_id, account_id, policy_id, amount=None, max_retries=6) -> InvestmentResult:
+    """Return ``amount`` (default: all of it) from a holding to ``account_id``.
+
+    A partial redemption must leave at least the policy's minimum invested.
+    Redeeming everything closes the holding and frees its slot.
+    """
+    amount = _parse_amount(amount)
+    return with_busy_retry(lambda: _redeem_once(conn, user_id, account_id, policy_id, amount),
+                           max_retries=max_retries)
+
+
+def holdings(conn, user_id) -> list:
+    """The user's holdings with their principal, newest first."""
+    rows = conn.execute(
+        "SELECT up.policy_id, p.name, up.amount_cents, up.invested_at FROM user_policies up "
+        "JOIN policies p ON p.id = up.policy_id WHERE up.user_id = ? ORDER BY up.invested_at DESC, up.id DESC",
+        (user_id,),
+    ).fetchall()
+    return [{"policy_id": r[0], "name": r[1], "amount": Money(r[2]), "invested_at": r[3]} for r in rows]
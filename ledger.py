@@ -0,0 +1,244 @@
+"""Append-only postings, balance checkpoints and reconciliation.
+
+Triggers in schema.sql write two ``postings`` rows for every transaction
+and for every opening balance, and refuse updates and deletes.
+``accounts.balance_cents`` stays the fast current balance. Postings are the
+history behind it. ``write_checkpoints`` records an account's running
+balance every N postings. ``balance_at`` then finds the balance at any past
+moment by reading one checkpoint and replaying at most N postings.
+``verify`` recomputes every balance from postings in one ordered pass and
+reports the accounts that disagree.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from money import Money
+
+DEFAULT_CHECKPOINT_EVERY = 1000
+
+# Opening postings for accounts that predate the postings table: whatever
+# the balance holds beyond the net of the account's transactions
+BACKFILL_OPENING_SQL = """
+    WITH net AS (
+        SELECT account_id, SUM(amount) AS cents FROM (
+            SELECT to_account_id AS account_id, amount_cents AS amount
+            FROM transactions WHERE to_account_id IS NOT NULL
+            UNION ALL
+            SELECT from_account_id, -amount_cents FROM transactions WHERE from_account_id IS NOT NULL
+        )
+        GROUP BY account_id
+    ),
+    opening AS (
+        SELECT a.id AS account_id, a.created_at, a.balance_cents - COALESCE(net.cents, 0) AS cents
+        FROM accounts a LEFT JOIN net ON net.account_id = a.id
+        WHERE NOT EXISTS (SELECT 1 FROM postings p WHERE p.account_id = a.id)
+    )
+    INSERT INTO postings (account_id, transaction_id, amount_cents, created_at)
+    SELECT account_id, NULL, amount, created_at FROM (
+        SELECT account_id AS sort_key, 1 AS leg, 0 AS account_id, -cents AS amount, created_at
+        FROM opening WHERE cents <> 0
+        UNION ALL
+        SELECT account_id, 2, account_id, cents, created_at FROM opening WHERE cents <> 0
+    )
+    ORDER BY created_at, sort_key, leg
+"""
+
+BACKFILL_TRANSACTIONS_SQL = """
+    INSERT INTO postings (account_id, transaction_id, amount_cents, created_at)
+    SELECT account_id, transaction_id, amount, created_at FROM (
+        SELECT id AS transaction_id, 1 AS leg, COALESCE(from_account_id, 0) AS account_id,
+               -amount_cents AS amount, created_at
+        FROM transactions WHERE id > :after
+        UNION ALL
+        SELECT id, 2, COALESCE(to_account_id, 0), amount_cents, created_at
+        FROM transactions WHERE id > :after
+    )
+    ORDER BY transaction_id, leg
+"""
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    account_id: int
+    # None for postings whose account no longer exists
+    account_number: str
+    stored: Money
+    computed: Money
+
+
+@dataclass
+class VerifyReport:
+    accounts: int = 0
+    # Sum of every posting; anything but zero means a one-legged entry
+    imbalance: Money = Money(0)
+    mismatch_count: int = 0
+    # The first ``limit`` mismatches passed to verify()
+    mismatches: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.mismatch_count == 0 and not self.imbalance
+
+
+def parse_point_in_time(value: str) -> str:
+    """``YYYY-MM-DD`` (end of that day) or an ISO timestamp, as a ``created_at`` string."""
+    value = value.strip()
+    try:
+        if len(value) == 10:
+            return f"{date.fromisoformat(value).isoformat()} 23:59:59"
+        return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise ValueError(f"not a date or timestamp: {value!r}") from None
+
+
+def backfill(conn) -> int:
+    """Write postings missing for databases that predate them; return rows added."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last = conn.execute("SELECT COALESCE(MAX(transaction_id), 0) FROM postings").fetchone()[0]
+        added = conn.execute(BACKFILL_OPENING_SQL).rowcount
+        added += conn.execute(BACKFILL_TRANSACTIONS_SQL, {"after": last}).rowcount
+        conn.commit()
+        return added
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def ensure_populated(conn) -> bool:
+    """Backfill once if transactions exist that have no postings."""
+    behind = conn.execute(
+        "SELECT (SELECT COALESCE(MAX(id), 0) FROM transactions) > "
+        "(SELECT COALESCE(MAX(transaction_id), 0) FROM postings)"
+    ).fetchone()[0]
+    if not behind:
+        return False
+    backfill(conn)
+    return True
+
+
+def write_checkpoints(conn, every=DEFAULT_CHECKPOINT_EVERY, flush=500) -> int:
+    """Checkpoint each account every ``every`` postings since its last checkpoint.
+
+    Only postings after an account's latest checkpoint are read, so a
+    nightly run costs the day's postings. Returns the checkpoints written.
+    """
+    last = {row[0]: (row[1], row[2]) for row in conn.execute(
+        "SELECT account_id, MAX(posting_id), balance_cents FROM balance_checkpoints GROUP BY account_id"
+    )}
+    account_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM accounts ORDER BY id"
+    )]
+    written = 0
+    pending = []
+    for account_id in account_ids:
+        after, balance = last.get(account_id, (0, 0))
+        count = 0
+        cursor = conn.execute(
+            "SELECT id, amount_cents, created_at FROM postings WHERE account_id = ? AND id > ? ORDER BY id",
+            (account_id, after),
+        )
+        for posting_id, amount, created_at in cursor:
+            balance += amount
+            count += 1
+            if count == every:
+                pending.append((account_id, posting_id, balance, created_at))
+                count = 0
+        if len(pending) >= flush:
+            written += _insert_checkpoints(conn, pending)
+            pending.clear()
+    if pending:
+        written += _insert_checkpoints(conn, pending)
+    return written
+
+
+def _insert_checkpoints(conn, rows) -> int:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Postings never change, so a concurrent run computes the same rows
+        conn.executemany(
+            "INSERT OR IGNORE INTO balance_checkpoints (account_id, posting_id, balance_cents, created_at) "
+            "VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        return len(rows)
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def balance_at(conn, account_id, at: str) -> Money:
+    """Balance of ``account_id`` at the end of ``at`` (a ``created_at`` string)."""
+    checkpoint = conn.execute(
+        "SELECT posting_id, balance_cents FROM balance_checkpoints "
+        "WHERE account_id = ? AND created_at <= ? ORDER BY posting_id DESC LIMIT 1",
+        (account_id, at),
+    ).fetchone()
+    after, balance = (checkpoint[0], checkpoint[1]) if checkpoint else (0, 0)
+    # Nothing past the next checkpoint can be at or before ``at``
+    upto = conn.execute(
+        "SELECT MIN(posting_id) FROM balance_checkpoints WHERE account_id = ? AND posting_id > ?",
+        (account_id, after),
+    ).fetchone()[0]
+    sql = ("SELECT COALESCE(SUM(amount_cents), 0) FROM postings "
+           "WHERE account_id = ? AND id > ? AND created_at <= ?")
+    params = [account_id, after, at]
+    if upto is not None:
+        sql += " AND id <= ?"
+        params.append(upto)
+    replayed = conn.execute(sql, params).fetchone()[0]
+    return Money(balance + replayed)
+
+
+def verify(conn, limit=1000, batch=10000) -> VerifyReport:
+    """Compare every ``accounts.balance_cents`` with the sum of its postings.
+
+    Accounts and per-account posting sums are both read in account id order
+    and merged as they stream, so memory stays flat however large the
+    tables are. Both reads share one snapshot.
+    """
+    report = VerifyReport()
+    imbalance = 0
+    conn.execute("BEGIN")
+    try:
+        accounts = conn.execute("SELECT id, account_number, balance_cents FROM accounts ORDER BY id")
+        sums = conn.execute(
+            "SELECT account_id, SUM(amount_cents) FROM postings GROUP BY account_id ORDER BY account_id")
+
+        def rows(cursor):
+            while True:
+                chunk = cursor.fetchmany(batch)
+                if not chunk:
+                    return
+                yield from chunk
+
+        def flag(account_id, number, stored, computed):
+            report.mismatch_count += 1
+            if len(report.mismatches) < limit:
+                report.mismatches.append(Mismatch(account_id, number, Money(stored), Money(computed)))
+
+        posted = rows(sums)
+        pending = next(posted, None)
+        for account_id, number, stored in rows(accounts):
+            report.accounts += 1
+            # Postings for ids with no account row: the external account 0, or orphans
+            while pending is not None and pending[0] < account_id:
+                imbalance += pending[1]
+                if pending[0] != 0:
+                    flag(pending[0], None, 0, pending[1])
+                pending = next(posted, None)
+            computed = 0
+            if pending is not None and pending[0] == account_id:
+                computed = pending[1]
+                imbalance += computed
+                pending = next(posted, None)
+            if computed != stored:
+                flag(account_id, number, stored, computed)
+        while pending is not None:
+            imbalance += pending[1]
+            if pending[0] != 0:
+                flag(pending[0], None, 0, pending[1])
+            pending = next(posted, None)
+    finally:
+        conn.rollback()
+    report.imbalance = Money(imbalance)
+    return report
@@ -0,0 +1,337 @@
+"""Per-request timing and SQL instrumentation, exported at ``/metrics``.
+
+Every request is counted and timed. A sampled share of requests
+(``METRICS_SAMPLE_RATE``) also gets its SQL statements, template rendering
+and Gemini calls timed. Statements slower than ``SLOW_QUERY_MS`` are logged
+to the ``bank.slow_query`` logger with their ``EXPLAIN QUERY PLAN``.
+Everything is served in the Prometheus text format.
+"""
+import logging
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Response, before_render_template, g, request, template_rendered
+
+slow_query_log = logging.getLogger("bank.slow_query")
+
+# Statistics for the request being served, or None when it is not sampled
+_current = ContextVar("request_stats", default=None)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+# Longest statement text put in a label; one series per route either way
+STATEMENT_LABEL_MAX = 120
+
+
+class RequestStats:
+    """What one sampled request spent its time on."""
+
+    __slots__ = ("sql_count", "sql_time", "slowest_sql", "slowest_time",
+                 "template_time", "gemini_time", "_template_start")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.slowest_sql = None
+        self.slowest_time = 0.0
+        self.template_time = 0.0
+        self.gemini_time = 0.0
+        self._template_start = None
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Registry:
+    """Process-wide counters and histograms behind one lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.durations = {}
+        self.sampled = {}
+        self.sql_queries = {}
+        self.sql_seconds = {}
+        self.template_seconds = {}
+        self.gemini_seconds = {}
+        # route -> (seconds, statement) of the slowest statement seen
+        self.slowest_sql = {}
+        self.gemini = Histogram()
+        self.chat_replies = {}
+        self.slow_queries = 0
+
+    def record_request(self, route, method, status, elapsed, stats):
+        with self._lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            hist = self.durations.get(route)
+            if hist is None:
+                hist = self.durations[route] = Histogram()
+            hist.observe(elapsed)
+            if stats is not None:
+                self.sampled[route] = self.sampled.get(route, 0) + 1
+                self.sql_queries[route] = self.sql_queries.get(route, 0) + stats.sql_count
+                self.sql_seconds[route] = self.sql_seconds.get(route, 0.0) + stats.sql_time
+                self.template_seconds[route] = self.template_seconds.get(route, 0.0) + stats.template_time
+                if stats.gemini_time:
+                    self.gemini_seconds[route] = self.gemini_seconds.get(route, 0.0) + stats.gemini_time
+                if stats.slowest_time > self.slowest_sql.get(route, (0.0, None))[0]:
+                    self.slowest_sql[route] = (stats.slowest_time, _statement(stats.slowest_sql))
+
+    def record_gemini(self, elapsed):
+        with self._lock:
+            self.gemini.observe(elapsed)
+
+    def record_chat_reply(self, source):
+        with self._lock:
+            self.chat_replies[source] = self.chat_replies.get(source, 0) + 1
+
+    def record_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self, pool_stats=None, audit_stats=None) -> str:
+        out = []
+        with self._lock:
+            _counter(out, "bank_http_requests_total", "Requests served.",
+                     {_labels(route=r, method=m, status=s): v for (r, m, s), v in self.requests.items()})
+            out.append("# HELP bank_http_request_duration_seconds Wall time per request.")
+            out.append("# TYPE bank_http_request_duration_seconds histogram")
+            for route, hist in sorted(self.durations.items()):
+                _histogram(out, "bank_http_request_duration_seconds", hist, route=route)
+            _counter(out, "bank_http_requests_sampled_total", "Requests with SQL/template timing.",
+                     {_labels(route=r): v for r, v in self.sampled.items()})
+            _counter(out, "bank_sql_queries_total", "SQL statements run by sampled requests.",
+                     {_labels(route=r): v for r, v in self.sql_queries.items()})
+            _counter(out, "bank_sql_seconds_total", "Time in SQL for sampled requests.",
+                     {_labels(route=r): v for r, v in self.sql_seconds.items()})
+            _gauge(out, "bank_sql_slowest_seconds", "Slowest statement seen per route, and its text.",
+                   {_labels(route=r, statement=sql): v for r, (v, sql) in self.slowest_sql.items()})
+            _counter(out, "bank_template_seconds_total", "Time rendering templates for sampled requests.",
+                     {_labels(route=r): v for r, v in self.template_seconds.items()})
+            _counter(out, "bank_sql_slow_queries_total", "Statements over SLOW_QUERY_MS.",
+                     {"": self.slow_queries})
+            out.append("# HELP bank_gemini_request_duration_seconds Time waiting on the Gemini model.")
+            out.append("# TYPE bank_gemini_request_duration_seconds histogram")
+            _histogram(out, "bank_gemini_request_duration_seconds", self.gemini)
+            _counter(out, "bank_gemini_seconds_total", "Time waiting on Gemini for sampled requests.",
+                     {_labels(route=r): v for r, v in self.gemini_seconds.items()})
+            _counter(out, "bank_chat_replies_total", "Chat replies by where they came from (rules, cache, model).",
+                     {_labels(source=s): v for s, v in self.chat_replies.items()})
+        if pool_stats:
+            _gauge(out, "bank_db_pool_connections", "Pooled SQLite connections by state.",
+                   {_labels(state="in_use"): pool_stats["in_use"], _labels(state="idle"): pool_stats["idle"]})
+            _counter(out, "bank_db_pool_checkouts_total", "Connections checked out of the pool.",
+                     {"": pool_stats["checkouts"]})
+            _counter(out, "bank_db_pool_wait_seconds_total", "Time spent waiting for a pooled connection.",
+                     {"": pool_stats["wait_total_ms"] / 1000})
+        if audit_stats:
+            _gauge(out, "bank_audit_queue_depth", "Audit events waiting for the writer.",
+                   {_labels(kind="current"): audit_stats["queued"], _labels(kind="max"): audit_stats["max_depth"]})
+            _counter(out, "bank_audit_events_total", "Audit events by outcome.",
+                     {_labels(outcome=k): audit_stats[k] for k in ("recorded", "written", "dropped", "failed")})
+            _counter(out, "bank_audit_batches_total", "Group commits by the audit writer.",
+                     {"": audit_stats["batches"]})
+            _counter(out, "bank_audit_blocked_total", "record() calls that found the audit queue full.",
+                     {"": audit_stats["blocked"]})
+        return "\n".join(out) + "\n"
+
+
+def _labels(**labels) -> str:
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                     for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def _statement(sql) -> str:
+    """``sql`` on one line, cut to STATEMENT_LABEL_MAX characters."""
+    text = " ".join((sql or "").split())
+    return text if len(text) <= STATEMENT_LABEL_MAX else text[:STATEMENT_LABEL_MAX - 3] + "..."
+
+
+def _counter(out, name, help_text, samples, kind="counter"):
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} {kind}")
+    for labels, value in sorted(samples.items()):
+        out.append(f"{name}{labels} {value:g}" if isinstance(value, float) else f"{name}{labels} {value}")
+
+
+def _gauge(out, name, help_text, samples):
+    _counter(out, name, help_text, samples, kind="gauge")
+
+
+def _histogram(out, name, hist, **labels):
+    base = ",".join('{}="{}"'.format(k, v) for k, v in labels.items())
+    prefix = base + "," if base else ""
+    running = 0
+    for bound, count in zip(BUCKETS, hist.counts):
+        running += count
+        out.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {running}')
+    out.append(f'{name}_bucket{{{prefix}le="+Inf"}} {hist.count}')
+    suffix = "{" + base + "}" if base else ""
+    out.append(f"{name}_sum{suffix} {hist.total:g}")
+    out.append(f"{name}_count{suffix} {hist.count}")
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """A connection that times statements run while a sampled request is active.
+
+    Only the step that produces the first row is timed; rows fetched later
+    with ``fetchmany`` (streamed exports) are not.
+    """
+
+    registry = None
+    slow_threshold = None
+
+    def execute(self, sql, parameters=(), /):
+        stats = _current.get()
+        if stats is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(stats, sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        stats = _current.get()
+        if stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(stats, sql, None, time.perf_counter() - start)
+
+    def _record(self, stats, sql, parameters, elapsed):
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+        if elapsed > stats.slowest_time:
+            stats.slowest_time = elapsed
+            stats.slowest_sql = sql
+        threshold = self.slow_threshold
+        if threshold is not None and elapsed >= threshold:
+            if self.registry is not None:
+                self.registry.record_slow_query()
+            slow_query_log.warning("slow query %.1f ms on %s\n%s\n%s", elapsed * 1000,
+                                   _route(), " ".join(sql.split()), self._explain(sql, parameters))
+
+    def _explain(self, sql, parameters):
+        if parameters is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return "(no plan)"
+        try:
+            rows = sqlite3.Connection.execute(self, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            return f"(plan unavailable: {e})"
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node_id] + detail)
+        return "\n".join(lines)
+
+
+def _route():
+    rule = request.url_rule if request else None
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+@contextmanager
+def timed_gemini(registry):
+    """Time a model call for the metrics and the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.record_gemini(elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.gemini_time += elapsed
+
+
+def init_app(app) -> Registry:
+    """Install the request hooks and the ``/metrics`` endpoint on ``app``."""
+    registry = Registry()
+    app.extensions["metrics"] = registry
+    sample_rate = app.config["METRICS_SAMPLE_RATE"]
+    slow_ms = app.config["SLOW_QUERY_MS"]
+    InstrumentedConnection.registry = registry
+    InstrumentedConnection.slow_threshold = slow_ms / 1000.0 if slow_ms > 0 else None
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+        if sample_rate >= 1.0 or (sample_rate > 0 and random.random() < sample_rate):
+            g.metrics_stats = RequestStats()
+            g.metrics_token = _current.set(g.metrics_stats)
+
+    @app.after_request
+    def add_server_timing(response):
+        g.metrics_status = response.status_code
+        stats = g.get("metrics_stats")
+        if stats is not None and not response.is_streamed:
+            response.headers["Server-Timing"] = (
+                f"sql;desc=\"{stats.sql_count} queries\";dur={stats.sql_time * 1000:.2f}, "
+                f"tpl;dur={stats.template_time * 1000:.2f}, "
+                f"total;dur={(time.perf_counter() - g.metrics_start) * 1000:.2f}"
+            )
+        return response
+
+    @app.teardown_request
+    def finish_request_timer(exc):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return
+        stats = g.pop("metrics_stats", None)
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Streamed bodies can finish in a different context
+                _current.set(None)
+        status = 500 if exc is not None else g.pop("metrics_status", 500)
+        registry.record_request(_route(), request.method, status, time.perf_counter() - start, stats)
+
+    def template_started(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats._template_start = time.perf_counter()
+
+    def template_finished(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None and stats._template_start is not None:
+            stats.template_time += time.perf_counter() - stats._template_start
+            stats._template_start = None
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        pool = app.extensions.get("db_pool")
+        audit_log = app.extensions.get("audit_log")
+        body = registry.render(pool.stats() if pool is not None else None,
+                               audit_log.stats() if audit_log is not None else None)
+        return Response(body, mimetype="text/plain; version=0.0.4")
+
+    return registry
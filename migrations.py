@@ -0,0 +1,246 @@
+"""Versioned schema migrations, applied by ``python migrations.py``.
+
+Each numbered migration runs once. ``schema_version`` records which ones
+are done. schema.sql only uses ``CREATE ... IF NOT EXISTS``, so it is
+re-applied whenever its checksum changes (recorded as version 0).
+``pending()`` is cheap enough to call on every boot: it reads schema.sql
+and one small table.
+"""
+import argparse
+import hashlib
+import sqlite3
+import sys
+
+import ledger
+import summaries
+
+SCHEMA_PATH = "schema.sql"
+SCHEMA_STEP = "schema.sql"
+
+# (table, legacy REAL column, INTEGER cents column, declaration)
+MONEY_COLUMNS = [
+    ("accounts", "balance", "balance_cents", "INTEGER NOT NULL DEFAULT 0"),
+    ("transactions", "amount", "amount_cents", "INTEGER NOT NULL DEFAULT 0"),
+    ("policies", "min_investment", "min_investment_cents", "INTEGER DEFAULT 0"),
+]
+
+POLICY_COLUMNS = [
+    ("min_investment_cents", "INTEGER DEFAULT 0"),
+    ("goal", "TEXT"),
+    ("lock_in", "TEXT"),
+    ("liquidity", "TEXT"),
+]
+
+DEFAULT_POLICIES_SQL = """
+    INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment_cents, description, goal, lock_in, liquidity) VALUES
+        (1, 'Safe Savings', 'Low', 3.0, 5000, 'A secure, low-yield savings product backed by government or bank securities. Ideal for conservative investors or those maintaining emergency funds.', 'Capital preservation and quick liquidity.', 'None (withdraw anytime)', 'High');
+    INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment_cents, description, goal, lock_in, liquidity) VALUES
+        (2, 'Short-Term Bond Fund', 'Low', 4.0, 10000, 'Invests in short-duration bonds and debt instruments. Slightly higher returns than savings accounts but minimal volatility.', 'Low-risk short-term growth (1–2 years).', NULL, 'Moderate');
+    INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment_cents, description, goal, lock_in, liquidity) VALUES
+        (3, 'Balanced Growth', 'Medium', 6.5, 20000, 'A mix of equity (60%) and debt (40%) to balance risk and reward. Designed for users with medium risk tolerance and long-term goals.', 'Steady wealth growth.', '2 years recommended', NULL);
+    INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment_cents, description, goal, lock_in, liquidity) VALUES
+        (4, 'Aggressive Equity', 'High', 12.0, 30000, 'Focuses on high-growth stocks and equity funds. Suitable for users willing to tolerate market volatility for higher returns.', 'Long-term capital appreciation.', '3 years recommended', NULL);
+    INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment_cents, description, goal, lock_in, liquidity) VALUES
+        (5, 'Global Opportunity Fund', 'High', 10.0, 25000, 'Diversified portfolio across international markets and emerging economies. Offers global diversification and currency exposure.', 'Diversified long-term growth.', '3–5 years recommended', NULL);
+    INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment_cents, description, goal, lock_in, liquidity) VALUES
+        (6, 'Green Future Fund', 'Medium', 7.0, 15000, 'Invests in renewable energy, EVs, and sustainable infrastructure. Great for eco-conscious investors seeking moderate returns with positive impact.', 'Ethical investing and stable growth.', '2 years recommended', NULL);
+    INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment_cents, description, goal, lock_in, liquidity) VALUES
+        (7, 'Digital Assets Index', 'High', 15.0, 20000, 'Exposure to leading digital assets (crypto index) with auto-balancing and capped volatility. High reward potential but carries substantial risk.', 'Growth and diversification for tech-savvy investors.', '3–4 years', NULL);
+    INSERT OR IGNORE INTO policies (id, name, risk_level, expected_return, min_investment_cents, description, goal, lock_in, liquidity) VALUES
+        (8, 'Real Estate Mini Trust', 'Medium', 8.0, 25000, 'Fractional real-estate investment in rental and commercial properties. Provides steady passive income through rent yields.', 'Passive income and inflation hedge.', '2 years', NULL);
+        
+"""
+
+VERSION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+      version INTEGER PRIMARY KEY,
+      name TEXT NOT NULL,
+      checksum TEXT,
+      applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def _columns(conn, table) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def money_to_cents(conn):
+    """REAL dollar columns become INTEGER cents.
+
+    Each table is converted in its own short write transaction so readers
+    keep working. This runs before schema.sql so triggers that use the cents
+    columns are only created once those columns exist.
+    """
+    for table, old_col, new_col, decl in MONEY_COLUMNS:
+        cols = _columns(conn, table)
+        if old_col not in cols:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if new_col not in cols:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {new_col} {decl};")
+            conn.execute(f"UPDATE {table} SET {new_col} = CAST(ROUND({old_col} * 100) AS INTEGER);")
+            conn.execute(f"ALTER TABLE {table} DROP COLUMN {old_col};")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def policy_columns(conn):
+    cols = _columns(conn, "policies")
+    for name, decl in POLICY_COLUMNS:
+        if name not in cols:
+            conn.execute(f"ALTER TABLE policies ADD COLUMN {name} {decl};")
+    conn.commit()
+
+
+def idempotency_keys(conn):
+    """Transfers carry an optional client idempotency key, unique per sender."""
+    if "idempotency_key" not in _columns(conn, "transactions"):
+        conn.execute("ALTER TABLE transactions ADD COLUMN idempotency_key TEXT;")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_idempotency "
+        "ON transactions (from_account_id, idempotency_key) WHERE idempotency_key IS NOT NULL;"
+    )
+    conn.commit()
+
+
+def default_policies(conn):
+    """Ensure exactly the 8 default policies exist."""
+    if conn.execute("SELECT COUNT(*) FROM policies").fetchone()[0] != 8:
+        conn.execute("DELETE FROM policies")
+        conn.executescript(DEFAULT_POLICIES_SQL)
+        conn.commit()
+
+
+def investment_holdings(conn):
+    """Holdings carry their principal, and users a policy counter instead of the COUNT(*) trigger.
+
+    Runs before schema.sql, whose release trigger uses the counter. On a
+    fresh database the tables do not exist yet and schema.sql creates them
+    with both columns.
+    """
+    users, holdings = _columns(conn, "users"), _columns(conn, "user_policies")
+    if not users or not holdings:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if "amount_cents" not in holdings:
+            conn.execute("ALTER TABLE user_policies ADD COLUMN amount_cents INTEGER NOT NULL DEFAULT 0;")
+        if "policy_count" not in users:
+            conn.execute("ALTER TABLE users ADD COLUMN policy_count INTEGER NOT NULL DEFAULT 0;")
+        conn.execute("UPDATE users SET policy_count = "
+                     "(SELECT COUNT(*) FROM user_policies up WHERE up.user_id = users.id);")
+        conn.execute("DROP TRIGGER IF EXISTS trg_limit_user_policies;")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def statement_rollups(conn):
+    summaries.ensure_populated(conn)
+
+
+def postings(conn):
+    ledger.ensure_populated(conn)
+
+
+# (version, name, function, runs before schema.sql)
+MIGRATIONS = [
+    (1, "money columns to integer cents", money_to_cents, True),
+    (2, "policy detail columns", policy_columns, False),
+    (3, "transfer idempotency keys", idempotency_keys, False),
+    (4, "default policies", default_policies, False),
+    (5, "backfill account_daily_summary", statement_rollups, False),
+    (6, "backfill postings", postings, False),
+    (7, "investment holdings", investment_holdings, True),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def schema_checksum(path=SCHEMA_PATH) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _state(conn):
+    """Applied versions and the checksum schema.sql was last applied with."""
+    try:
+        rows = conn.execute("SELECT version, checksum FROM schema_version").fetchall()
+    except sqlite3.OperationalError:
+        # No schema_version table yet: nothing has been applied
+        return set(), None
+    applied = {row[0] for row in rows}
+    checksum = next((row[1] for row in rows if row[0] == 0), None)
+    return applied, checksum
+
+
+def pending(conn, schema_path=SCHEMA_PATH) -> list:
+    """Names of the steps ``migrate`` would run, in order."""
+    applied, checksum = _state(conn)
+    names = [name for version, name, _, before in MIGRATIONS if before and version not in applied]
+    if checksum != schema_checksum(schema_path):
+        names.append(SCHEMA_STEP)
+    names += [name for version, name, _, before in MIGRATIONS if not before and version not in applied]
+    return names
+
+
+def migrate(conn, schema_path=SCHEMA_PATH, log=print) -> list:
+    """Apply every pending step and return their names."""
+    conn.execute(VERSION_TABLE_SQL)
+    conn.commit()
+    applied, checksum = _state(conn)
+    done = []
+
+    def run(version, name, fn, checksum=None):
+        fn(conn)
+        conn.execute(
+            "INSERT INTO schema_version (version, name, checksum) VALUES (?, ?, ?) "
+            "ON CONFLICT (version) DO UPDATE SET checksum = excluded.checksum, applied_at = CURRENT_TIMESTAMP",
+            (version, name, checksum),
+        )
+        conn.commit()
+        done.append(name)
+        log(f"Applied migration {version}: {name}")
+
+    for version, name, fn, before in MIGRATIONS:
+        if before and version not in applied:
+            run(version, name, fn)
+    new_checksum = schema_checksum(schema_path)
+    if checksum != new_checksum:
+        with open(schema_path) as f:
+            schema_sql = f.read()
+        run(0, SCHEMA_STEP, lambda c: c.executescript(schema_sql), new_checksum)
+    for version, name, fn, before in MIGRATIONS:
+        if not before and version not in applied:
+            run(version, name, fn)
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("database", nargs="?", default="simple_bank.db")
+    parser.add_argument("--schema", default=SCHEMA_PATH)
+    parser.add_argument("--check", action="store_true", help="only list pending steps; exit 1 if any")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    try:
+        if args.check:
+            steps = pending(conn, args.schema)
+            for name in steps:
+                print(f"pending: {name}")
+            return 1 if steps else 0
+        applied = migrate(conn, args.schema)
+    finally:
+        conn.close()
+    print(f"Applied {len(applied)} steps" if applied else "Database is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Exact money amounts stored as integer cents."""
+import sqlite3
+from decimal import Decimal, InvalidOperation
+from functools import total_ordering
+
+from flask.json.provider import DefaultJSONProvider
+
+# Largest amount accepted from input: $1,000,000,000.00. Far below the 64-bit
+# column limit, so even a batch of many such amounts sums without overflow
+MAX_CENTS = 10 ** 11
+
+
+class InvalidMoney(ValueError):
+    """Raised when text cannot be read as a money amount."""
+
+
+@total_ordering
+class Money:
+    """An amount of money held as a whole number of cents.
+
+    Balances and transaction amounts live in SQLite as 64-bit integer cents,
+    so sums and comparisons are exact. ``Money`` wraps those integers at the
+    edges: parsing form input, formatting for templates and JSON, and as a
+    query parameter (it binds as its cents value).
+    """
+
+    __slots__ = ("cents",)
+
+    def __init__(self, cents: int):
+        if isinstance(cents, bool) or not isinstance(cents, int):
+            raise TypeError(f"Money needs integer cents, got {type(cents).__name__}")
+        self.cents = cents
+
+    @classmethod
+    def parse(cls, value) -> "Money":
+        """Read user input such as ``"12.5"``, ``"$1,000.00"`` or ``7``.
+
+        More than two decimal places is an error rather than silently rounded,
+        and so is anything larger than ``MAX_CENTS`` either way.
+        """
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, float):
+            value = repr(value)
+        text = str(value).strip().replace(",", "").lstrip("$")
+        try:
+            amount = Decimal(text)
+        except InvalidOperation:
+            raise InvalidMoney(f"not a money amount: {value!r}") from None
+        if not amount.is_finite():
+            raise InvalidMoney(f"not a money amount: {value!r}")
+        cents = amount * 100
+        if cents != cents.to_integral_value():
+            raise InvalidMoney(f"more than two decimal places: {value!r}")
+        if abs(cents) > MAX_CENTS:
+            raise InvalidMoney(f"more than {MAX_CENTS // 100:,} in one amount: {value!r}")
+        return cls(int(cents))
+
+    @classmethod
+    def from_db(cls, cents):
+        return None if cents is None else cls(int(cents))
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.cents).scaleb(-2)
+
+    def __str__(self):
+        sign = "-" if self.cents < 0 else ""
+        whole, frac = divmod(abs(self.cents), 100)
+        return f"{sign}{whole}.{frac:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec) if spec else str(self)
+
+    def __html__(self):
+        return str(self)
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        return NotImplemented
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __mul__(self, factor):
+        if isinstance(factor, int) and not isinstance(factor, bool):
+            return Money(self.cents * factor)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+
+ZERO = Money(0)
+
+
+def money_fields(row: dict) -> dict:
+    """Replace each ``*_cents`` key with its decimal string, e.g. ``min_investment: "50.00"``."""
+    out = {}
+    for key, value in row.items():
+        if key.endswith("_cents"):
+            out[key[:-len("_cents")]] = None if value is None else str(Money(int(value)))
+        else:
+            out[key] = value
+    return out
+
+
+# Money binds as its integer cents in any sqlite3 query
+sqlite3.register_adapter(Money, lambda m: m.cents)
+
+
+class MoneyJSONProvider(DefaultJSONProvider):
+    """Serialize Money as a decimal string so JSON clients never see floats."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Money):
+            return str(o)
+        return DefaultJSONProvider.default(o)
@@ -0,0 +1,239 @@
+"""Rule-based policy recommendations that answer a chat without the model.
+
+The catalog is small and structured (risk level, lock-in, liquidity,
+minimum investment), so a message that states preferences can be scored
+locally. ``parse_preferences`` pulls risk appetite, horizon, liquidity
+needs, an amount and goal themes out of the user's turns. ``Recommender``
+then ranks the policies the user can afford and does not already hold, and
+returns the top two. If a message asks something open-ended ("why",
+"explain", "compare"...), or gives too little to go on, ``recommend``
+returns None and the chat falls through to Gemini.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+
+from investments import MAX_HOLDINGS
+from money import Money, InvalidMoney
+
+TOP_N = 2
+RISK_ORDER = {"Low": 0, "Medium": 1, "High": 2}
+
+_RISK_WORDS = (
+    (re.compile(r"\b(low|minimal|no|little)[\s-]+risk\b|\b(conservative|safe|safest|cautious|risk[\s-]?averse)\b"), "Low"),
+    (re.compile(r"\b(medium|moderate|balanced|some)[\s-]+risk\b|\b(balanced|moderate)\b"), "Medium"),
+    (re.compile(r"\b(high|higher|lots? of)[\s-]+risk\b|\b(aggressive|risky|adventurous)\b"), "High"),
+)
+_HORIZON = re.compile(r"\b(\d{1,2}|one|two|three|four|five|six|seven|eight|nine|ten)\s*(?:-\s*\d{1,2}\s*)?"
+                      r"(years?|yrs?|months?)\b")
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+                 "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+_SHORT_TERM = re.compile(r"\bshort[\s-]?term\b")
+_LONG_TERM = re.compile(r"\blong[\s-]?term\b|\bretire")
+_LIQUID = re.compile(r"\b(liquid|liquidity|withdraw|access (?:to )?(?:my|the) money|emergency)\b")
+_NOT_LIQUID = re.compile(r"\b(don'?t|do not|won'?t|will not)\s+need\s+(?:to\s+)?(?:the money|access|withdraw|liquidity)\b"
+                         r"|\block(?:ed)?[\s-]?in is fine\b")
+_AMOUNT = re.compile(r"(?:\$|₹|rs\.?\s*|inr\s*|usd\s*)(\d[\d,]*(?:\.\d{1,2})?)"
+                     r"|\b(\d[\d,]*(?:\.\d{1,2})?)\s*(?:dollars|rupees|usd|inr)\b")
+_ASKS_FOR_PICK = re.compile(r"\b(recommend|suggest|which (?:policy|policies|fund|one)|what should i|best (?:policy|policies|fund|option)"
+                            r"|where should i|invest|pick|options? for me)\b")
+# Questions the rules cannot answer well
+_OPEN_ENDED = re.compile(r"\b(why|explain|how (?:does|do|is|are)|what (?:is|are) (?:a|an)|what does|risks? of|difference"
+                         r"|compare|versus|vs|tax|news|market|inflation|history|tell me about)\b")
+# Goal themes and the words that mark a policy as fitting one
+_THEMES = {
+    "income": (re.compile(r"\b(income|rent|passive|dividend)"), re.compile(r"income|rent")),
+    "ethical": (re.compile(r"\b(green|ethical|sustainab|eco|esg|climate)"), re.compile(r"green|sustainab|ethical|renewable|eco")),
+    "global": (re.compile(r"\b(global|international|abroad|emerging|diversif)"), re.compile(r"global|international|diversif")),
+    "digital": (re.compile(r"\b(crypto|bitcoin|digital|tech)"), re.compile(r"digital|crypto|tech")),
+    "preserve": (re.compile(r"\b(emergency|preserv|protect|safety net)"), re.compile(r"preserv|emergency|secure|savings")),
+}
+THEME_LABELS = {"income": "passive income", "ethical": "ethical investing", "global": "global diversification",
+                "digital": "digital assets", "preserve": "keeping capital safe"}
+_LOCK_YEARS = re.compile(r"(\d+)")
+
+
+@dataclass
+class Preferences:
+    risk: str = None
+    horizon_years: float = None
+    needs_liquidity: bool = None
+    amount: Money = None
+    themes: set = field(default_factory=set)
+    asks_for_pick: bool = False
+
+    @property
+    def known(self) -> int:
+        """How many of risk, horizon and liquidity the user has stated."""
+        return sum(x is not None for x in (self.risk, self.horizon_years, self.needs_liquidity))
+
+
+@dataclass(frozen=True)
+class Recommendation:
+    policy: dict
+    score: float
+    reasons: tuple
+
+
+def parse_preferences(messages) -> Preferences:
+    """Preferences from the user's turns in ``messages``; later turns win."""
+    prefs = Preferences()
+    for m in messages:
+        if m.get("role", "user") != "user":
+            continue
+        text = (m.get("content") or "").lower()
+        for pattern, level in _RISK_WORDS:
+            if pattern.search(text):
+                prefs.risk = level
+        match = _HORIZON.search(text)
+        if match:
+            count = match.group(1)
+            count = int(count) if count.isdigit() else _NUMBER_WORDS[count]
+            prefs.horizon_years = count / 12 if match.group(2).startswith("month") else float(count)
+        elif _SHORT_TERM.search(text):
+            prefs.horizon_years = 1.0
+        elif _LONG_TERM.search(text):
+            prefs.horizon_years = 5.0
+        if _NOT_LIQUID.search(text):
+            prefs.needs_liquidity = False
+        elif _LIQUID.search(text):
+            prefs.needs_liquidity = True
+        match = _AMOUNT.search(text)
+        if match:
+            try:
+                prefs.amount = Money.parse((match.group(1) or match.group(2)).replace(",", ""))
+            except InvalidMoney:
+                pass
+        prefs.themes |= {name for name, (asked, _) in _THEMES.items() if asked.search(text)}
+        prefs.asks_for_pick = bool(_ASKS_FOR_PICK.search(text))
+    return prefs
+
+
+def is_clear(message: str, prefs: Preferences) -> bool:
+    """Whether the latest message can be answered by the rules alone."""
+    text = message.lower()
+    if _OPEN_ENDED.search(text):
+        return False
+    # "Thanks" after a recommendation should not repeat it
+    latest = parse_preferences([{"role": "user", "content": message}])
+    if not (latest.known or latest.asks_for_pick or latest.themes or latest.amount):
+        return False
+    # Risk appetite plus one more signal, or an explicit ask with any preference
+    return (prefs.risk is not None and (prefs.known >= 2 or prefs.asks_for_pick)) or \
+        (prefs.asks_for_pick and prefs.known >= 2)
+
+
+def _lock_in_years(policy) -> float:
+    text = (policy.get("lock_in") or "").lower()
+    match = _LOCK_YEARS.search(text)
+    return float(match.group(1)) if match else 0.0
+
+
+def _features(policy) -> dict:
+    text = " ".join(str(policy.get(k) or "") for k in ("name", "description", "goal")).lower()
+    lock_in = _lock_in_years(policy)
+    liquidity = policy.get("liquidity") or ("High" if lock_in == 0 else "Low")
+    return {
+        "risk": RISK_ORDER.get(policy.get("risk_level"), 1),
+        "lock_in": lock_in,
+        "liquid": {"High": 2, "Moderate": 1}.get(liquidity, 0),
+        "min_investment": Money.parse(policy["min_investment"]) if policy.get("min_investment") else Money(0),
+        "themes": {name for name, (_, marks) in _THEMES.items() if marks.search(text)},
+        "return": float(policy.get("expected_return") or 0),
+    }
+
+
+class Recommender:
+    """Scores the catalog against a user's preferences, balance and holdings.
+
+    Per-policy features (parsed lock-in, liquidity, themes) are computed once
+    per catalog list. PolicyCatalogCache hands out the same list until the
+    policies table changes, so a recommendation costs a few dict lookups.
+    """
+
+    def __init__(self, top_n=TOP_N):
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._features = []
+
+    def _featurize(self, policies):
+        with self._lock:
+            if self._catalog is not policies:
+                self._features = [(p, _features(p)) for p in policies]
+                self._catalog = policies
+            return self._features
+
+    def rank(self, policies, prefs: Preferences, balance: Money, held_ids=()) -> list:
+        """Policies the user can take, best first, as Recommendation objects."""
+        budget = balance if prefs.amount is None else min(prefs.amount, balance)
+        wanted_risk = RISK_ORDER.get(prefs.risk)
+        ranked = []
+        for policy, f in self._featurize(policies):
+            if policy["id"] in held_ids or f["min_investment"] > budget:
+                continue
+            score, reasons = 0.0, []
+            if wanted_risk is not None:
+                gap = abs(f["risk"] - wanted_risk)
+                score += (3.0, 1.0, -2.0)[gap]
+                if gap == 0:
+                    reasons.append(f"{policy['risk_level'].lower()} risk, as you asked")
+            if prefs.horizon_years is not None:
+                if f["lock_in"] > prefs.horizon_years:
+                    score -= 3.0
+                else:
+                    score += 1.0
+                    if f["lock_in"]:
+                        reasons.append(f"its lock-in ({policy['lock_in']}) fits your horizon")
+            if prefs.needs_liquidity:
+                score += (-2.0, 1.0, 2.0)[f["liquid"]]
+                if f["liquid"]:
+                    reasons.append(f"{(policy.get('liquidity') or 'high').lower()} liquidity")
+            elif prefs.needs_liquidity is False:
+                score += 0.5 * (2 - f["liquid"])
+            matched = prefs.themes & f["themes"]
+            if matched:
+                score += 1.5 * len(matched)
+                reasons.append("suits your interest in " + " and ".join(THEME_LABELS[t] for t in sorted(matched)))
+            # Within the same fit, prefer the better return for the risk taken
+            score += f["return"] / 100
+            ranked.append(Recommendation(policy, round(score, 4), tuple(reasons)))
+        ranked.sort(key=lambda r: (-r.score, r.policy["id"]))
+        return ranked
+
+    def recommend(self, message, history, policies, balance, held_ids=(), max_holdings=MAX_HOLDINGS):
+        """Reply text for a clear recommendation request, or None to ask the model.
+
+        ``history`` is the conversation window including ``message``.
+        """
+        prefs = parse_preferences(history)
+        if not is_clear(message, prefs):
+            return None
+        if len(held_ids) >= max_holdings:
+            return (f"You already hold the maximum of {max_holdings} policies, so there is nothing new to recommend. "
+                    "You can review them on the Policies page.")
+        picks = self.rank(policies, prefs, balance, held_ids)[:self.top_n]
+        if not picks:
+            return ("None of the policies you do not already hold fit your balance right now. "
+                    "The smallest minimum investment is "
+                    f"{min((f['min_investment'] for _, f in self._featurize(policies)), default=Money(0))}.")
+        return format_reply(picks, prefs)
+
+
+def format_reply(picks, prefs: Preferences) -> str:
+    asked = []
+    if prefs.risk:
+        asked.append(f"{prefs.risk.lower()} risk")
+    if prefs.horizon_years is not None:
+        years = prefs.horizon_years
+        asked.append(f"a {years:g}-year horizon" if years >= 1 else f"a {round(years * 12)}-month horizon")
+    if prefs.needs_liquidity:
+        asked.append("easy access to your money")
+    lines = [f"Based on {', '.join(asked) or 'what you told me'}, here are my top picks:"]
+    for i, r in enumerate(picks, start=1):
+        p = r.policy
+        why = "; ".join(r.reasons) or "the closest overall fit"
+        lines.append(f"{i}. {p['name']} ({p['risk_level']} risk, {float(p.get('expected_return') or 0):g}% expected return, "
+                     f"minimum {p['min_investment']}): {why}.")
+    lines.append("Ask me anything about these if you would like more detail.")
+    return "\n".join(lines)
@@ -6,14 +6,17 @@ CREATE TABLE IF NOT EXISTS users (
   password_hash TEXT NOT NULL,
   email TEXT,
   phone TEXT,
-  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  -- Rows in user_policies; investments.py claims a slot with a guarded UPDATE
+  policy_count INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS accounts (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER NOT NULL,
   account_number TEXT UNIQUE NOT NULL,
-  balance REAL NOT NULL DEFAULT 0,
+  -- Money columns hold integer cents
+  balance_cents INTEGER NOT NULL DEFAULT 0,
   created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
@@ -22,10 +25,11 @@ CREATE TABLE IF NOT EXISTS transactions (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   from_account_id INTEGER,
   to_account_id INTEGER,
-  amount REAL NOT NULL,
+  amount_cents INTEGER NOT NULL,
   tx_type TEXT NOT NULL,
   description TEXT,
   created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  idempotency_key TEXT,
   FOREIGN KEY (from_account_id) REFERENCES accounts(id),
   FOREIGN KEY (to_account_id) REFERENCES accounts(id)
 );
@@ -37,32 +41,188 @@ CREATE TABLE IF NOT EXISTS policies (
   description TEXT,
   risk_level TEXT CHECK (risk_level IN ('Low','Medium','High')) DEFAULT 'Medium',
   expected_return REAL DEFAULT 0,
-  min_investment REAL DEFAULT 0,
+  min_investment_cents INTEGER DEFAULT 0,
   goal TEXT,
   lock_in TEXT,
   liquidity TEXT
 );
 
--- User to Policy mapping (max 2 policies per user enforced by trigger)
+-- User to Policy mapping (at most 2 per user, see users.policy_count)
 CREATE TABLE IF NOT EXISTS user_policies (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER NOT NULL,
   policy_id INTEGER NOT NULL,
   invested_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  -- Principal currently invested
+  amount_cents INTEGER NOT NULL DEFAULT 0,
   UNIQUE(user_id, policy_id),
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
   FOREIGN KEY (policy_id) REFERENCES policies(id) ON DELETE CASCADE
 );
 
--- Trigger to enforce at most 2 policies per user
-CREATE TRIGGER IF NOT EXISTS trg_limit_user_policies
-BEFORE INSERT ON user_policies
+-- A closed holding, or one removed by a cascade, gives its slot back
+CREATE TRIGGER IF NOT EXISTS trg_user_policies_release
+AFTER DELETE ON user_policies
 FOR EACH ROW
 BEGIN
-  SELECT
-    CASE WHEN (
-      (SELECT COUNT(*) FROM user_policies WHERE user_id = NEW.user_id) >= 2
-    ) THEN RAISE(ABORT, 'User can invest in at most 2 policies') END;
+  UPDATE users SET policy_count = policy_count - 1 WHERE id = OLD.user_id AND policy_count > 0;
 END;
 
--- Seeding is performed in application init to handle migrations safely
\ No newline at end of file
+-- Seeding is performed in application init to handle migrations safely
+
+-- History lookups walk these newest-first, one index per side of a transfer
+CREATE INDEX IF NOT EXISTS idx_transactions_from_created
+  ON transactions (from_account_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_transactions_to_created
+  ON transactions (to_account_id, created_at, id);
+
+-- Daily per-account statement rollups, maintained by the trigger below
+CREATE TABLE IF NOT EXISTS account_daily_summary (
+  account_id INTEGER NOT NULL,
+  day TEXT NOT NULL,
+  sent_count INTEGER NOT NULL DEFAULT 0,
+  sent_cents INTEGER NOT NULL DEFAULT 0,
+  received_count INTEGER NOT NULL DEFAULT 0,
+  received_cents INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (account_id, day)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_transactions_daily_summary
+AFTER INSERT ON transactions
+FOR EACH ROW
+BEGIN
+  INSERT INTO account_daily_summary (account_id, day, sent_count, sent_cents)
+    SELECT NEW.from_account_id, date(NEW.created_at), 1, NEW.amount_cents
+    WHERE NEW.from_account_id IS NOT NULL
+  ON CONFLICT (account_id, day) DO UPDATE SET
+    sent_count = sent_count + 1,
+    sent_cents = sent_cents + excluded.sent_cents;
+  INSERT INTO account_daily_summary (account_id, day, received_count, received_cents)
+    SELECT NEW.to_account_id, date(NEW.created_at), 1, NEW.amount_cents
+    WHERE NEW.to_account_id IS NOT NULL
+  ON CONFLICT (account_id, day) DO UPDATE SET
+    received_count = received_count + 1,
+    received_cents = received_cents + excluded.received_cents;
+END;
+
+-- Append-only double-entry postings: every transaction writes one leg per
+-- side, and each transaction's legs sum to zero. Account 0 stands for money
+-- entering or leaving the bank (opening balances, deposits, withdrawals).
+CREATE TABLE IF NOT EXISTS postings (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  account_id INTEGER NOT NULL,
+  -- NULL for opening balances
+  transaction_id INTEGER,
+  -- Signed cents: negative leaves the account, positive enters it
+  amount_cents INTEGER NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Covers per-account replays and the grouped sums used by verification
+CREATE INDEX IF NOT EXISTS idx_postings_account ON postings (account_id, id, created_at, amount_cents);
+
+CREATE TRIGGER IF NOT EXISTS trg_postings_no_update
+BEFORE UPDATE ON postings
+BEGIN
+  SELECT RAISE(ABORT, 'postings are append-only');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_postings_no_delete
+BEFORE DELETE ON postings
+BEGIN
+  SELECT RAISE(ABORT, 'postings are append-only');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_transactions_postings
+AFTER INSERT ON transactions
+FOR EACH ROW
+BEGIN
+  INSERT INTO postings (account_id, transaction_id, amount_cents, created_at)
+  VALUES (COALESCE(NEW.from_account_id, 0), NEW.id, -NEW.amount_cents, NEW.created_at),
+         (COALESCE(NEW.to_account_id, 0), NEW.id, NEW.amount_cents, NEW.created_at);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_accounts_opening_postings
+AFTER INSERT ON accounts
+FOR EACH ROW WHEN NEW.balance_cents <> 0
+BEGIN
+  INSERT INTO postings (account_id, transaction_id, amount_cents, created_at)
+  VALUES (0, NULL, -NEW.balance_cents, NEW.created_at),
+         (NEW.id, NULL, NEW.balance_cents, NEW.created_at);
+END;
+
+-- Running balance of an account up to and including posting_id, written
+-- every LEDGER_CHECKPOINT_EVERY postings so point-in-time lookups replay
+-- a bounded number of rows
+CREATE TABLE IF NOT EXISTS balance_checkpoints (
+  account_id INTEGER NOT NULL,
+  posting_id INTEGER NOT NULL,
+  balance_cents INTEGER NOT NULL,
+  created_at DATETIME NOT NULL,
+  PRIMARY KEY (account_id, posting_id)
+) WITHOUT ROWID;
+
+-- Progress of `flask import-users` runs; rows_done advances in the same
+-- transaction as each imported batch
+CREATE TABLE IF NOT EXISTS import_runs (
+  id TEXT PRIMARY KEY,
+  source TEXT,
+  rows_done INTEGER NOT NULL DEFAULT 0,
+  imported INTEGER NOT NULL DEFAULT 0,
+  started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  finished_at DATETIME
+) WITHOUT ROWID;
+
+-- Version counters for in-process caches; bumped whenever the source table changes
+CREATE TABLE IF NOT EXISTS cache_versions (
+  name TEXT PRIMARY KEY,
+  version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_policies_version_insert
+AFTER INSERT ON policies
+BEGIN
+  INSERT INTO cache_versions (name, version) VALUES ('policies', 1)
+  ON CONFLICT (name) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_policies_version_update
+AFTER UPDATE ON policies
+BEGIN
+  INSERT INTO cache_versions (name, version) VALUES ('policies', 1)
+  ON CONFLICT (name) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_policies_version_delete
+AFTER DELETE ON policies
+BEGIN
+  INSERT INTO cache_versions (name, version) VALUES ('policies', 1)
+  ON CONFLICT (name) DO UPDATE SET version = version + 1;
+END;
+
+-- Chatbot conversations; the session cookie only holds the conversation id
+CREATE TABLE IF NOT EXISTS chat_conversations (
+  id TEXT PRIMARY KEY,
+  user_id INTEGER NOT NULL,
+  -- Messages pruned once the conversation passed its turn cap
+  dropped_messages INTEGER NOT NULL DEFAULT 0,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_conversations_user ON chat_conversations (user_id, updated_at);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  conversation_id TEXT NOT NULL,
+  role TEXT NOT NULL,
+  content TEXT NOT NULL,
+  -- Estimated token count, used to cut the prompt window
+  tokens INTEGER NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (conversation_id) REFERENCES chat_conversations(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation ON chat_messages (conversation_id, id);
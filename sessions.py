@@ -0,0 +1,110 @@
+"""Server-side sessions kept in a shared-state backend.
+
+Flask's default session is the whole dict, signed, in a cookie. Here the
+cookie holds only a random session id, signed with the app's secret key,
+and the data lives in the backend under ``session:<id>``. So every worker
+sees the same session, a logout really ends it, and the cookie stays
+small however much is flashed.
+
+A session is written only when it changes. Otherwise it is written again
+once more than half its ``ttl`` has passed, which keeps active sessions
+alive (sliding expiry) at no more than one write per half-ttl.
+"""
+import secrets
+import time
+
+from flask.sessions import SecureCookieSession, SessionInterface
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import BadSignature, Signer
+
+KEY_PREFIX = "session:"
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, written_at=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.written_at = written_at
+        # Id to delete on save after rotate()
+        self.stale_sid = None
+
+    def rotate(self):
+        """Move the session to a new id on the next save, e.g. after login."""
+        if self.sid is not None:
+            self.stale_sid = self.sid
+            self.sid = None
+        self.modified = True
+
+
+def rotate(session):
+    """Give ``session`` a new id if it is a server-side session; no-op for cookie sessions."""
+    if isinstance(session, ServerSession):
+        session.rotate()
+
+
+class ServerSessionInterface(SessionInterface):
+    """Sessions stored in ``backend`` for ``ttl`` seconds since their last save."""
+
+    serializer = TaggedJSONSerializer()
+    salt = "server-session"
+
+    def __init__(self, backend, ttl=86400.0):
+        self.backend = backend
+        self.ttl = ttl
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie and app.secret_key:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            stored = self.backend.get(KEY_PREFIX + sid) if sid else None
+            if stored is not None:
+                written_at, payload = stored.split(":", 1)
+                return ServerSession(self.serializer.loads(payload), sid, float(written_at))
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.stale_sid:
+            self.backend.delete(KEY_PREFIX + session.stale_sid)
+        if not session:
+            if session.modified and (session.sid or session.stale_sid):
+                # Cleared, e.g. by logout: end it server-side too
+                if session.sid:
+                    self.backend.delete(KEY_PREFIX + session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                response.vary.add("Cookie")
+            return
+        if session.accessed:
+            response.vary.add("Cookie")
+        now = time.time()
+        stale = session.written_at is None or now - session.written_at > self.ttl / 2
+        if not (session.modified or stale):
+            return
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        self.backend.set(KEY_PREFIX + session.sid, f"{now:.0f}:{self.serializer.dumps(dict(session))}", self.ttl)
+        if new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+                partitioned=self.get_cookie_partitioned(app),
+            )
+            response.vary.add("Cookie")
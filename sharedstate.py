@@ -0,0 +1,400 @@
+"""State shared by every worker process: sessions, rate limits, invalidations.
+
+gunicorn runs several worker processes, and anything kept in a Python dict
+stays in the worker that wrote it. A backend here holds three kinds of
+state behind one small interface:
+
+* keys with a time to live (``get``/``set``/``add``/``delete``/``touch``),
+  used for server-side sessions
+* token buckets updated in one atomic step (``take_token``), used for the
+  login throttle
+* append-only channels (``publish``/``poll``), used to tell every worker to
+  drop a local cache
+
+``SQLiteStateBackend`` keeps the state in its own WAL database file, so
+every worker on the host sees the same state. Each operation is a single
+statement on a primary key: one B-tree probe, a level or two deeper at
+100k sessions than at 1k, with the hot pages memory-mapped.
+
+``MemoryStateBackend`` has the same semantics in one process. It serves
+tests, single-process runs, and stands in for Redis locally: the
+operations map onto Redis (SET EX/NX, a token bucket script, streams), so
+a Redis backend only needs these methods.
+
+Expired keys are skipped on read. At most every ``purge_interval`` seconds,
+a write also deletes expired keys, idle buckets and old messages.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+STATE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS state_kv (
+      key TEXT PRIMARY KEY,
+      value TEXT NOT NULL,
+      expires_at REAL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_state_kv_expiry ON state_kv (expires_at) WHERE expires_at IS NOT NULL;
+    CREATE TABLE IF NOT EXISTS state_buckets (
+      key TEXT PRIMARY KEY,
+      tokens REAL NOT NULL,
+      allowed INTEGER NOT NULL,
+      updated_at REAL NOT NULL,
+      -- When the bucket is full again and the row can go
+      expires_at REAL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_state_buckets_expiry ON state_buckets (expires_at);
+    CREATE TABLE IF NOT EXISTS state_messages (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      channel TEXT NOT NULL,
+      body TEXT NOT NULL,
+      created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_state_messages_channel ON state_messages (channel, id);
+"""
+
+# Rows removed per table by one purge, so a purge never holds the write lock for long
+PURGE_BATCH = 1000
+
+# Tokens in a bucket after refilling since its last update (old row values)
+_REFILLED = "min(:capacity, tokens + max(0.0, :now - updated_at) * :rate)"
+_TAKE_TOKEN_SQL = f"""
+    INSERT INTO state_buckets (key, tokens, allowed, updated_at, expires_at)
+    VALUES (:key, max(:capacity - 1, 0.0), :capacity >= 1, :now, :now + 1.0 / :rate)
+    ON CONFLICT(key) DO UPDATE SET
+      tokens = {_REFILLED} - ({_REFILLED} >= 1),
+      allowed = {_REFILLED} >= 1,
+      updated_at = :now,
+      expires_at = :now + (:capacity - {_REFILLED} + ({_REFILLED} >= 1)) / :rate
+    RETURNING tokens, allowed
+"""
+
+
+def _bucket_wait(tokens, allowed, rate) -> float:
+    if allowed:
+        return 0.0
+    return (1 - tokens) / rate if rate else float("inf")
+
+
+class SQLiteStateBackend:
+    """State in a SQLite file shared by every process that opens ``path``.
+
+    Connections are per thread and per process, opened on first use, so a
+    backend created before gunicorn forks is safe to use in the workers.
+    Writes are single autocommit statements; WAL lets reads run beside them.
+    """
+
+    def __init__(self, path, busy_timeout=5.0, purge_interval=60.0, message_ttl=3600.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.purge_interval = purge_interval
+        self.message_ttl = message_ttl
+        self._local = threading.local()
+        self._next_purge = time.monotonic() + purge_interval
+        conn = self._connect()
+        conn.executescript(STATE_SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Sessions and counters can be rebuilt, so a power cut may lose the last commits
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Serve hot pages from the OS page cache without copying them into SQLite
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
+
+    def _conn(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    def _wrote(self):
+        now = time.monotonic()
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            self.purge()
+
+    # ---------- Keys with a time to live ----------
+    def get(self, key, now=None):
+        """The value of ``key``, or None if it is missing or expired."""
+        row = self._conn().execute(
+            "SELECT value FROM state_kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time() if now is None else now),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None, now=None):
+        now = time.time() if now is None else now
+        self._conn().execute(
+            "INSERT INTO state_kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, value, None if ttl is None else now + ttl),
+        )
+        self._wrote()
+
+    def add(self, key, value, ttl=None, now=None) -> bool:
+        """Set ``key`` only if it is missing or expired; True if this call set it."""
+        now = time.time() if now is None else now
+        added = self._conn().execute(
+            "INSERT INTO state_kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE state_kv.expires_at <= ?",
+            (key, value, None if ttl is None else now + ttl, now),
+        ).rowcount
+        self._wrote()
+        return added == 1
+
+    def touch(self, key, ttl, now=None):
+        now = time.time() if now is None else now
+        self._conn().execute("UPDATE state_kv SET expires_at = ? WHERE key = ?", (now + ttl, key))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM state_kv WHERE key = ?", (key,))
+
+    # ---------- Token buckets ----------
+    def take_token(self, key, capacity, refill_per_second, now=None) -> float:
+        """Take one token from ``key``'s bucket; 0 if allowed, else seconds until one is free."""
+        params = {"key": key, "capacity": float(capacity), "rate": float(refill_per_second),
+                  "now": time.time() if now is None else now}
+        tokens, allowed = self._conn().execute(_TAKE_TOKEN_SQL, params).fetchone()
+        self._wrote()
+        return _bucket_wait(tokens, allowed, params["rate"])
+
+    def reset_bucket(self, key):
+        self._conn().execute("DELETE FROM state_buckets WHERE key = ?", (key,))
+
+    # ---------- Channels ----------
+    def publish(self, channel, body, now=None) -> int:
+        """Append ``body`` (a string) to ``channel``; returns its id."""
+        msg_id = self._conn().execute(
+            "INSERT INTO state_messages (channel, body, created_at) VALUES (?, ?, ?)",
+            (channel, body, time.time() if now is None else now),
+        ).lastrowid
+        self._wrote()
+        return msg_id
+
+    def last_id(self, channel) -> int:
+        return self._conn().execute(
+            "SELECT coalesce(max(id), 0) FROM state_messages WHERE channel = ?", (channel,)
+        ).fetchone()[0]
+
+    def poll(self, channel, after_id) -> list:
+        """``(id, body)`` for messages on ``channel`` newer than ``after_id``, oldest first."""
+        return self._conn().execute(
+            "SELECT id, body FROM state_messages WHERE channel = ? AND id > ? ORDER BY id",
+            (channel, after_id),
+        ).fetchall()
+
+    # ---------- Housekeeping ----------
+    def purge(self, now=None) -> int:
+        """Delete up to PURGE_BATCH expired rows from each table; returns rows deleted."""
+        now = time.time() if now is None else now
+        conn = self._conn()
+        deleted = 0
+        for sql, args in (
+            ("DELETE FROM state_kv WHERE key IN "
+             "(SELECT key FROM state_kv WHERE expires_at <= ? LIMIT ?)", (now, PURGE_BATCH)),
+            ("DELETE FROM state_buckets WHERE key IN "
+             "(SELECT key FROM state_buckets WHERE expires_at <= ? LIMIT ?)", (now, PURGE_BATCH)),
+            ("DELETE FROM state_messages WHERE id IN "
+             "(SELECT id FROM state_messages WHERE created_at <= ? ORDER BY id LIMIT ?)",
+             (now - self.message_ttl, PURGE_BATCH)),
+        ):
+            try:
+                deleted += conn.execute(sql, args).rowcount
+            except sqlite3.OperationalError:
+                # Another worker holds the write lock; the next purge catches up
+                break
+        return deleted
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        now = time.time()
+        return {
+            "backend": "sqlite",
+            "keys": conn.execute("SELECT count(*) FROM state_kv WHERE expires_at IS NULL OR expires_at > ?",
+                                 (now,)).fetchone()[0],
+            "buckets": conn.execute("SELECT count(*) FROM state_buckets").fetchone()[0],
+            "messages": conn.execute("SELECT count(*) FROM state_messages").fetchone()[0],
+        }
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local = threading.local()
+
+
+class MemoryStateBackend:
+    """The same operations on dicts in this process, behind one lock.
+
+    Nothing is shared with other processes, so with several workers each
+    has its own sessions and buckets.
+    """
+
+    def __init__(self, purge_interval=60.0, message_ttl=3600.0):
+        self.purge_interval = purge_interval
+        self.message_ttl = message_ttl
+        self._lock = threading.Lock()
+        self._kv = {}
+        self._buckets = {}
+        self._messages = []
+        self._next_id = 1
+        self._next_purge = time.monotonic() + purge_interval
+
+    def _wrote(self):
+        # Called with the lock held
+        now = time.monotonic()
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            self._purge(time.time())
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._kv.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= now):
+                return None
+            return entry[0]
+
+    def set(self, key, value, ttl=None, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._kv[key] = (value, None if ttl is None else now + ttl)
+            self._wrote()
+
+    def add(self, key, value, ttl=None, now=None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._kv.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                return False
+            self._kv[key] = (value, None if ttl is None else now + ttl)
+            self._wrote()
+            return True
+
+    def touch(self, key, ttl, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._kv.get(key)
+            if entry is not None:
+                self._kv[key] = (entry[0], now + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._kv.pop(key, None)
+
+    def take_token(self, key, capacity, refill_per_second, now=None) -> float:
+        now = time.time() if now is None else now
+        capacity, rate = float(capacity), float(refill_per_second)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = capacity if bucket is None else min(capacity, bucket[0] + max(0.0, now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            expires_at = now + (capacity - tokens) / rate if rate else None
+            self._buckets[key] = (tokens, now, expires_at)
+            self._wrote()
+        return _bucket_wait(tokens, allowed, rate)
+
+    def reset_bucket(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def publish(self, channel, body, now=None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            msg_id = self._next_id
+            self._next_id += 1
+            self._messages.append((msg_id, channel, body, now))
+            self._wrote()
+            return msg_id
+
+    def last_id(self, channel) -> int:
+        with self._lock:
+            return max((m[0] for m in self._messages if m[1] == channel), default=0)
+
+    def poll(self, channel, after_id) -> list:
+        with self._lock:
+            return [(m[0], m[2]) for m in self._messages if m[1] == channel and m[0] > after_id]
+
+    def _purge(self, now):
+        expired = [k for k, (_, exp) in self._kv.items() if exp is not None and exp <= now]
+        for k in expired:
+            del self._kv[k]
+        idle = [k for k, (_, _, exp) in self._buckets.items() if exp is not None and exp <= now]
+        for k in idle:
+            del self._buckets[k]
+        kept = [m for m in self._messages if m[3] > now - self.message_ttl]
+        dropped = len(self._messages) - len(kept)
+        self._messages = kept
+        return len(expired) + len(idle) + dropped
+
+    def purge(self, now=None) -> int:
+        with self._lock:
+            return self._purge(time.time() if now is None else now)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            return {
+                "backend": "memory",
+                "keys": sum(1 for _, exp in self._kv.values() if exp is None or exp > now),
+                "buckets": len(self._buckets),
+                "messages": len(self._messages),
+            }
+
+    def close(self):
+        pass
+
+
+class ChannelReader:
+    """Hands each new message on ``channel`` to ``handler``, checking at most every ``interval`` seconds.
+
+    Reading starts after the newest message at the first ``poll``, so a
+    worker that boots later does not replay old messages.
+    """
+
+    def __init__(self, backend, channel, handler, interval=1.0):
+        self.backend = backend
+        self.channel = channel
+        self.handler = handler
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_id = None
+        self._next_check = 0.0
+        self.received = 0
+
+    def poll(self, now=None) -> int:
+        """Apply messages published since the last poll; returns how many."""
+        now = time.monotonic() if now is None else now
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            self._next_check = now + self.interval
+            if self._last_id is None:
+                self._last_id = self.backend.last_id(self.channel)
+                return 0
+            messages = self.backend.poll(self.channel, self._last_id)
+            for msg_id, body in messages:
+                self._last_id = msg_id
+                self.handler(body)
+            self.received += len(messages)
+            return len(messages)
+        finally:
+            self._lock.release()
+
+
+def open_backend(kind, path):
+    """``sqlite`` backend at ``path`` or an in-process ``memory`` one."""
+    if kind == "sqlite":
+        return SQLiteStateBackend(path)
+    if kind == "memory":
+        return MemoryStateBackend()
+    raise ValueError(f"unknown STATE_BACKEND {kind!r}; use sqlite or memory")
@@ -29,6 +29,31 @@ document.addEventListener('DOMContentLoaded', () => {
         wrap.appendChild(bubble);
         chatWindow.appendChild(wrap);
         chatWindow.scrollTop = chatWindow.scrollHeight;
+        return bubble;
+    }
+
+    // Parse a text/event-stream body, calling onEvent(name, data) per event
+    async function readEvents(resp, onEvent) {
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+                let name = 'message';
+                let data = '';
+                raw.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) name = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                onEvent(name, data ? JSON.parse(data) : {});
+            }
+        }
     }
 
     async function sendMessage() {
@@ -39,19 +64,30 @@ document.addEventListener('DOMContentLoaded', () => {
         sendBtn.disabled = true;
 
         try {
-            const resp = await fetch('/api/chatbot', {
+            const resp = await fetch('/api/chatbot/stream', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
                 body: JSON.stringify({ message: text })
             });
-            const data = await resp.json();
-            if (data.reply) {
-                appendMessage('assistant', data.reply);
-            } else if (data.error) {
-                appendMessage('assistant', 'Error: ' + data.error);
-            } else {
-                appendMessage('assistant', 'No reply received.');
+            const type = resp.headers.get('Content-Type') || '';
+            if (!resp.ok || !type.startsWith('text/event-stream') || !resp.body) {
+                const data = await resp.json();
+                appendMessage('assistant', data.detail || (data.error ? 'Error: ' + data.error : 'No reply received.'));
+                return;
             }
+
+            // Tokens are appended to one bubble as they arrive
+            const bubble = appendMessage('assistant', '');
+            await readEvents(resp, (name, data) => {
+                if (name === 'token') {
+                    bubble.textContent += data.text;
+                } else if (name === 'error') {
+                    bubble.textContent += (bubble.textContent ? '\n\n' : '') + (data.detail || 'Error: ' + data.error);
+                } else if (name === 'done' && !bubble.textContent) {
+                    bubble.textContent = 'No reply received.';
+                }
+                chatWindow.scrollTop = chatWindow.scrollHeight;
+            });
         } catch (e) {
             appendMessage('assistant', 'Network error: ' + e.message);
         } finally {
@@ -85,7 +85,13 @@ document.addEventListener('DOMContentLoaded', function() {
         refreshBtn.addEventListener('click', refreshBalance);
     }
 
-    function refreshBalance() {
+    const balanceEl = document.querySelector('.balance-amount');
+
+    function showBalance(balance) {
+        if (balanceEl) balanceEl.textContent = `$${balance}`;
+    }
+
+    async function refreshBalance() {
         const btn = refreshBtn;
         const originalText = btn.innerHTML;
         
@@ -108,13 +114,35 @@ document.addEventListener('DOMContentLoaded', function() {
         `;
         document.head.appendChild(spinStyle);
 
-        // Simulate API call
-        setTimeout(() => {
+        try {
+            const resp = await fetch('/api/balance', { headers: { 'Accept': 'application/json' } });
+            if (!resp.ok) {
+                throw new Error(`Request failed with status ${resp.status}`);
+            }
+            const data = await resp.json();
+            showBalance(data.balance);
+            showNotification('Balance refreshed successfully!', 'success');
+        } catch (e) {
+            showNotification('Could not refresh balance: ' + e.message, 'error');
+        } finally {
             btn.innerHTML = originalText;
             btn.disabled = false;
-            showNotification('Balance refreshed successfully!', 'success');
             spinStyle.remove();
-        }, 1500);
+        }
+    }
+
+    // Live updates: the server pushes balance changes and incoming transfers
+    if ('EventSource' in window) {
+        const feed = new EventSource('/api/feed');
+        feed.addEventListener('balance', (e) => showBalance(JSON.parse(e.data).balance));
+        feed.addEventListener('transaction', (e) => {
+            const tx = JSON.parse(e.data);
+            if (tx.direction === 'received') {
+                showNotification(`Received $${tx.amount} from ${tx.counterparty || 'another account'}`, 'success');
+            }
+        });
+        feed.addEventListener('resync', refreshBalance);
+        window.addEventListener('beforeunload', () => feed.close());
     }
 
     function showRequestLoanForm() {
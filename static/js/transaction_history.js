@@ -44,6 +44,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const applyFiltersBtn = document.getElementById('applyFiltersBtn');
     const clearFiltersBtn = document.getElementById('clearFiltersBtn');
     const refreshBtn = document.getElementById('refreshBtn');
+    const exportBtn = document.getElementById('exportBtn');
 
     // View controls
     const listViewBtn = document.getElementById('listViewBtn');
@@ -56,16 +57,15 @@ document.addEventListener('DOMContentLoaded', function() {
     const totalReceivedEl = document.getElementById('totalReceived');
     const thisMonthEl = document.getElementById('thisMonth');
 
-    // Transaction data (would normally come from server)
-    let allTransactions = Array.from(document.querySelectorAll('.transaction-item')).map(item => ({
-        id: item.dataset.id || Math.random().toString(36).substr(2, 9),
-        type: item.dataset.type || 'transfer',
-        date: item.dataset.date || new Date().toISOString(),
-        amount: parseFloat(item.querySelector('.transaction-amount')?.textContent?.replace(/[^0-9.-]/g, '') || '0'),
-        title: item.querySelector('.transaction-title')?.textContent || '',
-        description: item.querySelector('.transaction-description')?.textContent || '',
-        isSent: item.querySelector('.transaction-amount')?.classList.contains('sent') || false
-    }));
+    // Paging state: rows are fetched from /api/transactions one page at a time
+    const loadMoreWrap = document.getElementById('loadMore');
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
+    const pageSize = parseInt(transactionsList.dataset.pageSize, 10) || 50;
+    const accountId = transactionsList.dataset.accountId;
+    let loadedTransactions = [];
+    let nextCursor = null;
+    let requestSeq = 0;
+    let loading = false;
 
     // Initialize filters
     function initializeFilters() {
@@ -80,38 +80,129 @@ document.addEventListener('DOMContentLoaded', function() {
         applyFilters();
     }
 
-    // Apply filters
-    function applyFilters() {
-        const dateFrom = dateFromInput.value ? new Date(dateFromInput.value) : null;
-        const dateTo = dateToInput.value ? new Date(dateToInput.value) : null;
-        const type = transactionTypeSelect.value;
-        const searchTerm = searchTermInput.value.toLowerCase();
-
-        const filteredTransactions = allTransactions.filter(transaction => {
-            const transactionDate = new Date(transaction.date);
-            
-            // Date filter
-            if (dateFrom && transactionDate < dateFrom) return false;
-            if (dateTo && transactionDate > dateTo) return false;
-            
-            // Type filter
-            if (type && transaction.type !== type) return false;
-            
-            // Search filter
-            if (searchTerm) {
-                const searchableText = `${transaction.title} ${transaction.description}`.toLowerCase();
-                if (!searchableText.includes(searchTerm)) return false;
-            }
-            
-            return true;
+    // Build the query string for the current filters
+    function filterParams(cursor) {
+        const params = new URLSearchParams();
+        if (dateFromInput.value) params.set('from', dateFromInput.value);
+        if (dateToInput.value) params.set('to', dateToInput.value);
+        if (transactionTypeSelect.value) params.set('type', transactionTypeSelect.value);
+        const searchTerm = searchTermInput.value.trim();
+        if (searchTerm) params.set('q', searchTerm);
+        params.set('limit', pageSize);
+        if (cursor) params.set('cursor', cursor);
+        return params;
+    }
+
+    async function fetchPage(cursor) {
+        const resp = await fetch(`/api/transactions?${filterParams(cursor)}`, {
+            headers: { 'Accept': 'application/json' }
         });
+        if (!resp.ok) {
+            throw new Error(`Request failed with status ${resp.status}`);
+        }
+        return resp.json();
+    }
 
-        displayTransactions(filteredTransactions);
-        updateSummary(filteredTransactions);
+    // Apply filters: restart from the newest page
+    async function applyFilters() {
+        const seq = ++requestSeq;
+        updateSummary();
+        loading = true;
+        try {
+            const page = await fetchPage(null);
+            // Drop responses for filters that have since changed
+            if (seq !== requestSeq) return;
+            loadedTransactions = page.transactions;
+            nextCursor = page.next_cursor;
+            displayTransactions(loadedTransactions, false);
+        } catch (e) {
+            if (seq === requestSeq) showNotification('Could not load transactions: ' + e.message, 'error');
+        } finally {
+            if (seq === requestSeq) loading = false;
+        }
+    }
+
+    // Append the next page after the rows already shown
+    async function loadMore() {
+        if (loading || !nextCursor) return;
+        const seq = requestSeq;
+        loading = true;
+        try {
+            const page = await fetchPage(nextCursor);
+            if (seq !== requestSeq) return;
+            loadedTransactions = loadedTransactions.concat(page.transactions);
+            nextCursor = page.next_cursor;
+            displayTransactions(page.transactions, true);
+        } catch (e) {
+            showNotification('Could not load more transactions: ' + e.message, 'error');
+        } finally {
+            if (seq === requestSeq) loading = false;
+        }
     }
 
-    // Display transactions
-    function displayTransactions(transactions) {
+    // SQLite timestamps are UTC without a zone marker
+    function parseDate(value) {
+        return new Date(String(value).replace(' ', 'T') + (/[zZ]|[+-]\d\d:?\d\d$/.test(value) ? '' : 'Z'));
+    }
+
+    function escapeHtml(value) {
+        return String(value ?? '').replace(/[&<>"']/g, ch => ({
+            '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+        })[ch]);
+    }
+
+    function transactionTitle(transaction) {
+        if (transaction.tx_type === 'transfer') {
+            return transaction.direction === 'sent'
+                ? `Sent to ${transaction.counterparty || 'unknown account'}`
+                : `Received from ${transaction.counterparty || 'unknown account'}`;
+        }
+        return transaction.tx_type.charAt(0).toUpperCase() + transaction.tx_type.slice(1);
+    }
+
+    function renderTransaction(transaction) {
+        const isSent = transaction.direction === 'sent';
+        const formattedDate = parseDate(transaction.created_at).toLocaleDateString('en-US', {
+            year: 'numeric',
+            month: 'long',
+            day: 'numeric',
+            hour: '2-digit',
+            minute: '2-digit'
+        });
+
+        return `
+            <div class="transaction-item" data-id="${transaction.id}" data-type="${escapeHtml(transaction.tx_type)}" data-date="${escapeHtml(transaction.created_at)}">
+                <div class="transaction-icon">
+                    ${getTransactionIcon(transaction.tx_type)}
+                </div>
+                <div class="transaction-content">
+                    <div class="transaction-header">
+                        <div class="transaction-title">${escapeHtml(transactionTitle(transaction))}</div>
+                        <div class="transaction-amount ${isSent ? 'sent' : 'received'}">
+                            ${isSent ? '-' : '+'}$${escapeHtml(transaction.amount)}
+                        </div>
+                    </div>
+                    <div class="transaction-details">
+                        <div class="transaction-description">${escapeHtml(transaction.description || 'No description provided')}</div>
+                        <div class="transaction-meta">
+                            <span class="transaction-date">${formattedDate}</span>
+                            <span class="transaction-id">ID: ${transaction.id}</span>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        `;
+    }
+
+    // Display transactions (replace the list, or append a page to it)
+    function displayTransactions(transactions, append) {
+        loadMoreWrap.hidden = !nextCursor;
+
+        if (append) {
+            transactionsList.insertAdjacentHTML('beforeend', transactions.map(renderTransaction).join(''));
+            return;
+        }
+
         if (transactions.length === 0) {
             transactionsList.innerHTML = `
                 <div class="empty-state">
@@ -130,42 +221,7 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
-        // Sort by date (newest first)
-        transactions.sort((a, b) => new Date(b.date) - new Date(a.date));
-
-        transactionsList.innerHTML = transactions.map(transaction => {
-            const date = new Date(transaction.date);
-            const formattedDate = date.toLocaleDateString('en-US', {
-                year: 'numeric',
-                month: 'long',
-                day: 'numeric',
-                hour: '2-digit',
-                minute: '2-digit'
-            });
-
-            return `
-                <div class="transaction-item" data-type="${transaction.type}" data-date="${transaction.date}">
-                    <div class="transaction-icon">
-                        ${getTransactionIcon(transaction.type)}
-                    </div>
-                    <div class="transaction-content">
-                        <div class="transaction-header">
-                            <div class="transaction-title">${transaction.title}</div>
-                            <div class="transaction-amount ${transaction.isSent ? 'sent' : 'received'}">
-                                ${transaction.isSent ? '-' : '+'}$${transaction.amount.toFixed(2)}
-                            </div>
-                        </div>
-                        <div class="transaction-details">
-                            <div class="transaction-description">${transaction.description}</div>
-                            <div class="transaction-meta">
-                                <span class="transaction-date">${formattedDate}</span>
-                                <span class="transaction-id">ID: ${transaction.id}</span>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            `;
-        }).join('');
+        transactionsList.innerHTML = transactions.map(renderTransaction).join('');
     }
 
     // Get transaction icon based on type
@@ -187,24 +243,44 @@ document.addEventListener('DOMContentLoaded', function() {
         return icons[type] || icons.transfer;
     }
 
+    // Summary totals come from the server-side daily rollups for the date range
+    async function fetchSummary(from, to) {
+        const params = new URLSearchParams();
+        if (from) params.set('from', from);
+        if (to) params.set('to', to);
+        const resp = await fetch(`/api/accounts/${accountId}/summary?${params}`, {
+            headers: { 'Accept': 'application/json' }
+        });
+        if (!resp.ok) {
+            throw new Error(`Request failed with status ${resp.status}`);
+        }
+        return resp.json();
+    }
+
     // Update summary
-    function updateSummary(transactions) {
-        const totalTransactions = transactions.length;
-        const totalSent = transactions.filter(t => t.isSent).reduce((sum, t) => sum + t.amount, 0);
-        const totalReceived = transactions.filter(t => !t.isSent).reduce((sum, t) => sum + t.amount, 0);
-        
-        // This month's transactions
-        const thisMonth = new Date();
-        const thisMonthTransactions = transactions.filter(t => {
-            const transactionDate = new Date(t.date);
-            return transactionDate.getMonth() === thisMonth.getMonth() && 
-                   transactionDate.getFullYear() === thisMonth.getFullYear();
-        }).length;
-
-        totalTransactionsEl.textContent = totalTransactions;
-        totalSentEl.textContent = `$${totalSent.toFixed(2)}`;
-        totalReceivedEl.textContent = `$${totalReceived.toFixed(2)}`;
-        thisMonthEl.textContent = thisMonthTransactions;
+    async function updateSummary() {
+        const today = new Date();
+        const monthStart = `${today.getUTCFullYear()}-${String(today.getUTCMonth() + 1).padStart(2, '0')}-01`;
+        try {
+            const [range, month] = await Promise.all([
+                fetchSummary(dateFromInput.value, dateToInput.value),
+                fetchSummary(monthStart, null)
+            ]);
+            totalTransactionsEl.textContent = range.transactions;
+            totalSentEl.textContent = `$${range.sent.total}`;
+            totalReceivedEl.textContent = `$${range.received.total}`;
+            thisMonthEl.textContent = month.transactions;
+        } catch (e) {
+            showNotification('Could not load summary: ' + e.message, 'error');
+        }
+    }
+
+    // Download the current date range as a streamed CSV statement
+    function exportStatement() {
+        const params = new URLSearchParams({ format: 'csv' });
+        if (dateFromInput.value) params.set('from', dateFromInput.value);
+        if (dateToInput.value) params.set('to', dateToInput.value);
+        window.location.href = `/api/transactions/export?${params}`;
     }
 
     // Clear filters
@@ -217,7 +293,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Refresh data
-    function refreshData() {
+    async function refreshData() {
         const btn = refreshBtn;
         const originalText = btn.innerHTML;
         
@@ -240,16 +316,63 @@ document.addEventListener('DOMContentLoaded', function() {
         `;
         document.head.appendChild(spinStyle);
 
-        // Simulate API call
-        setTimeout(() => {
+        try {
+            // Re-apply current filters and pick up the latest balance
+            await Promise.all([applyFilters(), refreshBalance()]);
+            showNotification('Transaction history refreshed!', 'success');
+        } finally {
             btn.innerHTML = originalText;
             btn.disabled = false;
-            showNotification('Transaction history refreshed!', 'success');
             spinStyle.remove();
-            
-            // Re-apply current filters
+        }
+    }
+
+    const balanceEl = document.querySelector('.balance-amount');
+
+    async function refreshBalance() {
+        try {
+            const resp = await fetch('/api/balance', { headers: { 'Accept': 'application/json' } });
+            if (!resp.ok) {
+                throw new Error(`Request failed with status ${resp.status}`);
+            }
+            balanceEl.textContent = `$${(await resp.json()).balance}`;
+        } catch (e) {
+            showNotification('Could not refresh balance: ' + e.message, 'error');
+        }
+    }
+
+    // Would a new transaction show up under the filters currently applied?
+    function matchesFilters(tx) {
+        const day = String(tx.created_at).slice(0, 10);
+        if (dateFromInput.value && day < dateFromInput.value) return false;
+        if (dateToInput.value && day > dateToInput.value) return false;
+        if (transactionTypeSelect.value && tx.tx_type !== transactionTypeSelect.value) return false;
+        const term = searchTermInput.value.trim().toLowerCase();
+        if (term && !`${tx.description || ''} ${tx.counterparty || ''}`.toLowerCase().includes(term)) return false;
+        return true;
+    }
+
+    // Live updates pushed by the server as transfers commit
+    function connectFeed() {
+        if (!('EventSource' in window)) return;
+        const feed = new EventSource('/api/feed');
+        feed.addEventListener('balance', (e) => {
+            balanceEl.textContent = `$${JSON.parse(e.data).balance}`;
+        });
+        feed.addEventListener('transaction', (e) => {
+            const tx = JSON.parse(e.data);
+            if (!matchesFilters(tx) || loadedTransactions.some(t => t.id === tx.id)) return;
+            if (loadedTransactions.length === 0) transactionsList.innerHTML = '';
+            loadedTransactions.unshift(tx);
+            transactionsList.insertAdjacentHTML('afterbegin', renderTransaction(tx));
+            updateSummary();
+        });
+        // The server dropped events for us; start over from the newest page
+        feed.addEventListener('resync', () => {
             applyFilters();
-        }, 1500);
+            refreshBalance();
+        });
+        window.addEventListener('beforeunload', () => feed.close());
     }
 
     // View toggle
@@ -265,12 +388,22 @@ document.addEventListener('DOMContentLoaded', function() {
     applyFiltersBtn.addEventListener('click', applyFilters);
     clearFiltersBtn.addEventListener('click', clearFilters);
     refreshBtn.addEventListener('click', refreshData);
+    exportBtn.addEventListener('click', exportStatement);
+    loadMoreBtn.addEventListener('click', loadMore);
+
+    // Fetch the next page as the end of the list scrolls into view
+    if ('IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadMore();
+        }, { rootMargin: '200px' }).observe(loadMoreWrap);
+    }
     
     listViewBtn.addEventListener('click', () => toggleView('list'));
     cardViewBtn.addEventListener('click', () => toggleView('card'));
 
     // Real-time search
     searchTermInput.addEventListener('input', debounce(applyFilters, 300));
+    transactionTypeSelect.addEventListener('change', applyFilters);
 
     // Debounce function
     function debounce(func, wait) {
@@ -351,6 +484,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Initialize
     initializeFilters();
+    connectFeed();
 
     console.log('Transaction History page initialized successfully!');
 });
@@ -0,0 +1,92 @@
+"""Per-account daily statement rollups.
+
+``account_daily_summary`` holds one row per account per UTC day with sent
+and received counts and totals. Triggers in schema.sql keep it current as
+transactions are inserted, so range totals cost O(days) instead of
+O(transactions).
+"""
+from money import Money
+
+REBUILD_SQL = """
+    INSERT INTO account_daily_summary
+        (account_id, day, sent_count, sent_cents, received_count, received_cents)
+    SELECT account_id, day, SUM(sent_count), SUM(sent_cents), SUM(received_count), SUM(received_cents)
+    FROM (
+        SELECT from_account_id AS account_id, date(created_at) AS day,
+               1 AS sent_count, amount_cents AS sent_cents, 0 AS received_count, 0 AS received_cents
+        FROM transactions WHERE from_account_id IS NOT NULL {from_filter}
+        UNION ALL
+        SELECT to_account_id, date(created_at), 0, 0, 1, amount_cents
+        FROM transactions WHERE to_account_id IS NOT NULL {to_filter}
+    )
+    GROUP BY account_id, day
+"""
+
+
+def rebuild(conn, account_id=None) -> int:
+    """Recompute rollups from ``transactions``; all accounts unless ``account_id`` is given.
+
+    Runs in one write transaction so readers never see a half-built table.
+    Returns the number of summary rows written.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if account_id is None:
+            conn.execute("DELETE FROM account_daily_summary")
+            sql = REBUILD_SQL.format(from_filter="", to_filter="")
+            params = ()
+        else:
+            conn.execute("DELETE FROM account_daily_summary WHERE account_id = ?", (account_id,))
+            sql = REBUILD_SQL.format(from_filter="AND from_account_id = ?", to_filter="AND to_account_id = ?")
+            params = (account_id, account_id)
+        written = conn.execute(sql, params).rowcount
+        conn.commit()
+        return written
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def ensure_populated(conn) -> bool:
+    """Backfill the rollups once for databases that predate them."""
+    if conn.execute("SELECT 1 FROM account_daily_summary LIMIT 1").fetchone():
+        return False
+    if not conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone():
+        return False
+    rebuild(conn)
+    return True
+
+
+def range_totals(conn, account_id, date_from=None, date_to=None) -> dict:
+    """Sent/received totals for ``account_id`` between two inclusive ``YYYY-MM-DD`` days."""
+    where = ["account_id = ?"]
+    params = [account_id]
+    if date_from:
+        where.append("day >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("day <= ?")
+        params.append(date_to)
+    row = conn.execute(
+        f"""
+        SELECT COUNT(*) AS days,
+               COALESCE(SUM(sent_count), 0) AS sent_count,
+               COALESCE(SUM(sent_cents), 0) AS sent_cents,
+               COALESCE(SUM(received_count), 0) AS received_count,
+               COALESCE(SUM(received_cents), 0) AS received_cents
+        FROM account_daily_summary
+        WHERE {' AND '.join(where)}
+        """,
+        params,
+    ).fetchone()
+    return {
+        "account_id": account_id,
+        "from": date_from or None,
+        "to": date_to or None,
+        "active_days": row["days"],
+        "transactions": row["sent_count"] + row["received_count"],
+        "sent": {"count": row["sent_count"], "total": Money(row["sent_cents"]),
+                 "total_cents": row["sent_cents"]},
+        "received": {"count": row["received_count"], "total": Money(row["received_cents"]),
+                     "total_cents": row["received_cents"]},
+    }
@@ -0,0 +1,57 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+from database import ConnectionPool  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def app_factory(tmp_path, monkeypatch):
+    """``create_app`` in an empty directory, with cheap hashing and no audit or shared files."""
+    shutil.copy(os.path.join(REPO, "schema.sql"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    for name, value in {"AUTH_HASH_METHOD": "pbkdf2:sha256:1000", "AUDIT_SINK": "off",
+                        "STATE_BACKEND": "memory", "SECRET_KEY": "test"}.items():
+        monkeypatch.setenv(name, value)
+
+    def make(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        import app
+        return app.create_app()
+    return make
+
+
+@pytest.fixture
+def login():
+    """Register and sign in ``username`` on a test client."""
+    def sign_in(client, username="ann", password="secret1"):
+        client.post("/register", data={"username": username, "password": password})
+        client.post("/login", data={"username": username, "password": password})
+        return client
+    return sign_in
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A pooled connection to a migrated database with accounts 1-3 (AC100001-3), $1,000.00 each."""
+    path = str(tmp_path / "bank.db")
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn, os.path.join(REPO, "schema.sql"), log=lambda _: None)
+    conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'x')",
+                     [(i, f"user{i}") for i in range(1, 4)])
+    conn.executemany("INSERT INTO accounts (id, user_id, account_number, balance_cents) VALUES (?, ?, ?, 100000)",
+                     [(i, i, f"AC{100000 + i}") for i in range(1, 4)])
+    conn.commit()
+    conn.close()
+    pool = ConnectionPool(path, size=2)
+    conn = pool.acquire()
+    yield conn
+    pool.release(conn)
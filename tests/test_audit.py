@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+
+import audit
+
+
+class GatedSink:
+    """Holds every write until ``gate`` is set; fails while ``fail`` is true."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.writing = threading.Event()
+        self.fail = False
+        self.events = []
+
+    def write(self, events):
+        self.writing.set()
+        self.gate.wait(5)
+        if self.fail:
+            raise OSError("disk full")
+        self.events.extend(events)
+
+    def close(self):
+        pass
+
+
+def test_flush_writes_everything_in_grouped_batches(tmp_path):
+    log = audit.AuditLog(audit.SQLiteSink(str(tmp_path / "audit.db")), batch_size=500, flush_interval=0.05)
+    for i in range(1200):
+        assert log.record("login", user_id=i, ip="127.0.0.1", ok=True)
+    assert log.flush()
+    stats = log.stats()
+    assert (stats["recorded"], stats["written"], stats["queued"], stats["dropped"]) == (1200, 1200, 0, 0)
+    assert 3 <= stats["batches"] < 1200
+    log.close()
+    conn = sqlite3.connect(tmp_path / "audit.db")
+    assert conn.execute("SELECT COUNT(*), MIN(user_id), MAX(user_id) FROM audit_events").fetchone() == (1200, 0, 1199)
+    assert conn.execute("SELECT detail FROM audit_events LIMIT 1").fetchone()[0] == '{"ok": true}'
+
+
+def test_full_queue_blocks_then_drops_and_counts_it():
+    sink = GatedSink()
+    log = audit.AuditLog(sink, max_queue=3, batch_size=1, flush_interval=0.01, block_timeout=0.02)
+    assert log.record("first")
+    # The writer holds "first" in the sink; the queue then fills up
+    assert sink.writing.wait(5)
+    assert all(log.record(f"queued-{i}") for i in range(3))
+    assert log.record("overflow") is False
+    stats = log.stats()
+    assert (stats["blocked"], stats["dropped"], stats["queued"], stats["max_depth"]) == (1, 1, 3, 3)
+
+    sink.gate.set()
+    assert log.flush()
+    assert [e["action"] for e in sink.events] == ["first", "queued-0", "queued-1", "queued-2"]
+    assert log.stats()["written"] == 4
+    log.close()
+
+
+def test_failed_batches_are_counted_and_the_writer_carries_on(caplog):
+    sink = GatedSink()
+    sink.gate.set()
+    sink.fail = True
+    log = audit.AuditLog(sink, batch_size=10, flush_interval=0.01)
+    log.record("lost")
+    assert log.flush()
+    sink.fail = False
+    log.record("kept")
+    assert log.flush()
+    stats = log.stats()
+    assert (stats["failed"], stats["written"]) == (1, 1)
+    assert [e["action"] for e in sink.events] == ["kept"]
+    (error,) = [r for r in caplog.records if r.getMessage() == "Audit writer error"]
+    assert error.name == "audit" and error.exc_info[0] is OSError
+    log.close()
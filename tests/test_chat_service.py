@@ -0,0 +1,171 @@
+"""ChatService and the chatbot routes against a local fake model."""
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from chat import ChatBusy, ChatService, ChatTimeout
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for ``genai.GenerativeModel``: fixed chunks, optional delay, gate or failure."""
+
+    def __init__(self, chunks=("Hello", ", world"), delay=0.0, gate=None, fail_after=None):
+        self.chunks = chunks
+        self.delay = delay
+        self.gate = gate
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def _chunks(self):
+        for i, text in enumerate(self.chunks):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("model exploded")
+            yield Chunk(text)
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        time.sleep(self.delay)
+        if stream:
+            return self._chunks()
+        return Chunk("".join(self.chunks))
+
+
+def sse_events(body):
+    """``(event, data)`` pairs from a text/event-stream body."""
+    events = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":") and ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_complete_returns_reply():
+    service = ChatService(FakeModel(), timeout=1)
+    assert service.complete("hi") == "Hello, world"
+
+
+def test_complete_times_out():
+    service = ChatService(FakeModel(delay=0.5), timeout=0.05)
+    with pytest.raises(ChatTimeout):
+        service.complete("hi")
+
+
+def test_stream_times_out():
+    service = ChatService(FakeModel(delay=0.5), timeout=0.05)
+    with pytest.raises(ChatTimeout):
+        list(service.stream("hi"))
+
+
+def test_rejects_past_max_in_flight():
+    gate = threading.Event()
+    service = ChatService(FakeModel(gate=gate), max_workers=1, max_in_flight=2, timeout=5)
+    running = [service.stream("a"), service.stream("b")]
+    with pytest.raises(ChatBusy):
+        service.stream("c")
+    gate.set()
+    assert ["".join(r) for r in running] == ["Hello, world", "Hello, world"]
+    # Slots come back once the calls finish
+    assert "".join(service.stream("d")) == "Hello, world"
+
+
+def test_stream_reraises_model_error_after_first_chunk():
+    service = ChatService(FakeModel(chunks=("one", "two"), fail_after=1), timeout=1)
+    chunks = service.stream("hi")
+    assert next(chunks) == "one"
+    with pytest.raises(RuntimeError, match="model exploded"):
+        next(chunks)
+
+
+@pytest.fixture
+def chat_client(app_factory, login):
+    def make(model, **env):
+        app = app_factory(GEMINI_API_KEY="test", CHAT_RULES="0", **env)
+        app.extensions["chat_service"].model = model
+        return app, login(app.test_client())
+    return make
+
+
+def test_stream_sse_framing(chat_client):
+    _, client = chat_client(FakeModel(chunks=("Hel", "lo")))
+    response = client.post("/api/chatbot/stream", json={"message": "hello there"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    assert body.startswith("event: token\ndata: ")
+    assert all(block.startswith("event: ") for block in body.strip().split("\n\n"))
+    assert sse_events(body) == [("token", {"text": "Hel"}), ("token", {"text": "lo"}), ("done", {"reply": "Hello"})]
+
+
+def test_stream_model_error_mid_stream(chat_client):
+    _, client = chat_client(FakeModel(chunks=("partial", "never"), fail_after=1))
+    events = sse_events(client.post("/api/chatbot/stream", json={"message": "hello there"}).get_data(as_text=True))
+    assert events[0] == ("token", {"text": "partial"})
+    assert events[1][0] == "error" and events[1][1]["error"] == "chat_failed"
+    # What arrived before the error is kept
+    assert events[-1] == ("done", {"reply": "partial"})
+
+
+def test_stream_timeout_is_an_sse_error(chat_client):
+    _, client = chat_client(FakeModel(delay=0.5), CHAT_TIMEOUT="0.05")
+    events = sse_events(client.post("/api/chatbot/stream", json={"message": "hello there"}).get_data(as_text=True))
+    assert events[0] == ("error", {"error": "chat_timeout", "detail": "The assistant took too long to answer."})
+
+
+def test_busy_pool_returns_503(chat_client):
+    gate = threading.Event()
+    app, client = chat_client(FakeModel(gate=gate), CHAT_MAX_IN_FLIGHT="1")
+    held = app.extensions["chat_service"].stream("occupies the only slot")
+    response = client.post("/api/chatbot", json={"message": "hello there"})
+    gate.set()
+    list(held)
+    assert response.status_code == 503
+    assert response.get_json()["error"] == "chat_busy"
+
+
+def test_open_stream_does_not_hold_a_db_connection(chat_client):
+    gate = threading.Event()
+    app, client = chat_client(FakeModel(gate=gate), DB_POOL_SIZE="1", DB_POOL_TIMEOUT="1")
+    stream = client.post("/api/chatbot/stream", json={"message": "hello there"}, buffered=False)
+    try:
+        # The pool has one connection; a banking route still gets it mid-stream
+        assert client.get("/api/investments").status_code == 200
+    finally:
+        gate.set()
+        body = stream.get_data(as_text=True)
+    assert sse_events(body)[-1] == ("done", {"reply": "Hello, world"})
+    # The connection taken for the final write went back too
+    assert app.extensions["db_pool"].stats()["in_use"] == 0
+
+
+def test_sync_worker_still_serves_model_chats_and_warns(chat_client, caplog):
+    model = FakeModel()
+    _, client = chat_client(model)
+    environ = {"SERVER_SOFTWARE": "gunicorn/23.0.0", "wsgi.multithread": False}
+    for _ in range(2):
+        response = client.post("/api/chatbot", json={"message": "hello there"}, environ_base=environ)
+        assert response.status_code == 200
+    assert model.calls == 2
+    assert sum("sync worker" in r.getMessage() for r in caplog.records) == 1
+
+
+def test_failed_chats_leave_no_unanswered_turn(chat_client):
+    model = FakeModel(delay=0.5)
+    _, client = chat_client(model, CHAT_TIMEOUT="0.05")
+    assert client.post("/api/chatbot", json={"message": "first try"}).status_code == 504
+    client.post("/api/chatbot/stream", json={"message": "second try"}).get_data()
+    model.delay = 0.0
+    assert client.post("/api/chatbot", json={"message": "third try"}).get_json() == {"reply": "Hello, world"}
+    conn = sqlite3.connect("simple_bank.db")
+    messages = conn.execute("SELECT role, content FROM chat_messages ORDER BY id").fetchall()
+    assert messages == [("user", "third try"), ("model", "Hello, world")]
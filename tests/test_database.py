@@ -0,0 +1,32 @@
+import os
+import time
+
+from database import ReplicaRefresher, get_db
+
+
+def test_stale_backup_replica_reads_from_primary_without_refreshing(app_factory):
+    app = app_factory(DB_READ_MODE="backup", DB_READ_MAX_STALENESS="60")
+    replica = app.extensions["db_replica"]
+    refreshes = replica.refreshes
+
+    with app.app_context():
+        assert get_db(readonly=True) is not get_db()
+
+    # Past the bound, e.g. while the refresher thread is stuck
+    old = time.time() - 120
+    os.utime(replica.replica, (old, old))
+    with app.app_context():
+        assert get_db(readonly=True) is get_db()
+    assert replica.refreshes == refreshes
+
+
+def test_refresh_failures_are_logged_and_the_thread_keeps_going(tmp_path, caplog):
+    replica = ReplicaRefresher(str(tmp_path / "bank.db"), str(tmp_path / "missing" / "replica.db"), max_staleness=0.2)
+    replica.start()
+    deadline = time.monotonic() + 5
+    while sum(r.getMessage() == "Replica refresh failed" for r in caplog.records) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    (tmp_path / "missing").mkdir()
+    failures = [r for r in caplog.records if r.getMessage() == "Replica refresh failed"]
+    assert len(failures) >= 2
+    assert failures[0].name == "database" and failures[0].exc_info is not None
@@ -0,0 +1,26 @@
+import threading
+
+import feed
+
+
+class FailingBroker:
+    def __init__(self):
+        self.calls = 0
+        self.failed_twice = threading.Event()
+
+    def accounts(self):
+        self.calls += 1
+        if self.calls >= 2:
+            self.failed_twice.set()
+        raise RuntimeError("broker gone")
+
+
+def test_watcher_errors_are_logged_and_polling_continues(caplog):
+    broker = FailingBroker()
+    watcher = feed.LedgerWatcher(pool=None, broker=broker, interval=0.01)
+    watcher._last_id = 0
+    watcher.start()
+    assert broker.failed_twice.wait(5)
+    watcher.interval = 3600
+    errors = [r for r in caplog.records if r.getMessage() == "Ledger watcher error"]
+    assert errors and errors[0].name == "feed" and errors[0].exc_info[0] is RuntimeError
@@ -0,0 +1,75 @@
+import base64
+
+import pytest
+
+import history
+
+
+def add(db, created_at, src, dst, cents, description=""):
+    return db.execute(
+        "INSERT INTO transactions (from_account_id, to_account_id, amount_cents, tx_type, description, created_at) "
+        "VALUES (?, ?, ?, 'transfer', ?, ?) RETURNING id",
+        (src, dst, cents, description, created_at),
+    ).fetchone()[0]
+
+
+@pytest.fixture
+def ledger(db):
+    """Account 1's transactions, several sharing a timestamp, plus one it is not part of."""
+    rows = [
+        ("2025-01-01 09:00:00", 1, 2), ("2025-01-02 09:00:00", 2, 1), ("2025-01-02 09:00:00", 1, 3),
+        ("2025-01-02 09:00:00", 3, 1), ("2025-01-03 09:00:00", 1, 2), ("2025-01-03 09:00:00", 1, 2),
+        ("2025-01-04 09:00:00", 2, 1),
+    ]
+    ids = {add(db, at, src, dst, 100 + n): at for n, (at, src, dst) in enumerate(rows)}
+    add(db, "2025-01-03 09:00:00", 2, 3, 999)
+    db.commit()
+    # Newest first, ties broken by id
+    return [tx_id for tx_id, _ in sorted(ids.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)]
+
+
+def test_pages_cover_every_row_once_across_equal_timestamps(db, ledger):
+    seen, cursor = [], None
+    while True:
+        page = history.fetch_page(db, 1, cursor, limit=2)
+        assert len(page["transactions"]) <= 2
+        seen += [t["id"] for t in page["transactions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ledger
+
+
+def test_page_directions_and_counterparties(db, ledger):
+    page = history.fetch_page(db, 1, limit=50)
+    assert page["next_cursor"] is None
+    newest = page["transactions"][0]
+    assert (newest["direction"], newest["counterparty"]) == ("received", "AC100002")
+    assert {t["direction"] for t in page["transactions"]} == {"sent", "received"}
+
+
+def test_search_takes_wildcards_literally(db):
+    add(db, "2025-02-01 09:00:00", 1, 2, 100, "100% refund")
+    add(db, "2025-02-02 09:00:00", 1, 2, 100, "1000 refund")
+    db.commit()
+    page = history.fetch_page(db, 1, filters={"search": "100%"})
+    assert [t["description"] for t in page["transactions"]] == ["100% refund"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b'["2025-01-01"]').decode(),
+    base64.urlsafe_b64encode(b'{"created_at": 1}').decode(),
+    base64.urlsafe_b64encode(b'["2025-01-01", "x"]').decode(),
+])
+def test_tampered_cursor_is_rejected(db, ledger, cursor):
+    with pytest.raises(history.InvalidCursor):
+        history.fetch_page(db, 1, cursor)
+
+
+def test_api_rejects_a_tampered_cursor_and_bad_dates(app_factory, login):
+    client = login(app_factory().test_client())
+    assert client.get("/api/transactions?cursor=%25%25").get_json() == {"error": "invalid_cursor"}
+    response = client.get("/api/transactions?from=2025-13-01")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "invalid_date"
@@ -0,0 +1,40 @@
+import pytest
+
+import importer
+
+HASH = "pbkdf2:sha256:1000"
+
+
+class Interrupted(Exception):
+    pass
+
+
+def rows():
+    for i in range(23):
+        yield {"username": f"imported{i:02d}", "password": "secret123", "balance": f"{i}.50"}
+    yield {"username": "imported03", "password": "secret123"}
+    yield {"username": "", "password": "secret123"}
+
+
+def test_interrupted_import_resumes_after_the_last_committed_batch(db):
+    def stop_after_two(stats):
+        if stats.read >= 10 and stats.imported >= 10:
+            raise Interrupted
+
+    with pytest.raises(Interrupted):
+        importer.import_users(db, rows(), "run-1", hash_method=HASH, workers=1, batch_size=5,
+                              progress=stop_after_two)
+    committed = db.execute("SELECT rows_done, imported FROM import_runs WHERE id = 'run-1'").fetchone()
+    assert tuple(committed) == (10, 10)
+
+    stats = importer.import_users(db, rows(), "run-1", hash_method=HASH, workers=1, batch_size=5)
+    assert stats.resumed_from == 10
+    assert (stats.imported, stats.duplicates, stats.invalid) == (13, 1, 1)
+
+    names = [r[0] for r in db.execute("SELECT username FROM users WHERE username LIKE 'imported%' ORDER BY username")]
+    assert names == [f"imported{i:02d}" for i in range(23)]
+    balance = db.execute("SELECT a.balance_cents FROM accounts a JOIN users u ON u.id = a.user_id "
+                         "WHERE u.username = 'imported22'").fetchone()[0]
+    assert balance == 2250
+    # A finished run is not read again
+    assert importer.import_users(db, rows(), "run-1", hash_method=HASH, workers=1).read == 0
@@ -0,0 +1,87 @@
+import os
+import random
+import sqlite3
+import threading
+
+from database import ConnectionPool, get_db
+from money import Money
+import investments
+import ledger
+import migrations
+
+from conftest import REPO
+
+START_BALANCE = Money.parse("5000.00")
+
+
+def test_invest_without_an_account_is_refused(app_factory, login):
+    app = app_factory()
+    client = login(app.test_client())
+    with app.app_context():
+        db = get_db()
+        db.execute("DELETE FROM accounts")
+        db.commit()
+        policy_id = db.execute("SELECT id FROM policies LIMIT 1").fetchone()[0]
+
+    response = client.post("/policies", data={"policy_id": policy_id, "amount": "10"})
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith("/login")
+    with client.session_transaction() as sess:
+        assert ("error", "Account not found") in sess["_flashes"]
+
+
+def test_concurrent_investments_in_one_account(tmp_path):
+    path = str(tmp_path / "bank.db")
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn, os.path.join(REPO, "schema.sql"), log=lambda _: None)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'ann', 'x')")
+    conn.execute("INSERT INTO accounts (id, user_id, account_number, balance_cents) VALUES (1, 1, 'AC100001', ?)",
+                 (START_BALANCE,))
+    conn.commit()
+    conn.close()
+    pool = ConnectionPool(path, size=8, timeout=10)
+    policies = list(range(1, 9))
+    accepted, errors = [], []
+    lock = threading.Lock()
+
+    def worker(n):
+        rng = random.Random(n)
+        conn = pool.acquire()
+        try:
+            for _ in range(10):
+                # Every policy's minimum is at most $300
+                amount = f"{rng.randint(300, 700)}.00"
+                try:
+                    result = investments.invest(conn, 1, 1, rng.choice(policies), amount)
+                except (investments.HoldingLimitReached, investments.InsufficientFunds):
+                    continue
+                with lock:
+                    accepted.append(result)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pool.release(conn)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert accepted
+
+    conn = pool.acquire()
+    try:
+        policy_count = conn.execute("SELECT policy_count FROM users WHERE id = 1").fetchone()[0]
+        held = conn.execute("SELECT COUNT(*) FROM user_policies WHERE user_id = 1").fetchone()[0]
+        balance = conn.execute("SELECT balance_cents FROM accounts WHERE id = 1").fetchone()[0]
+        debits = conn.execute("SELECT COUNT(*), SUM(amount_cents) FROM transactions "
+                              "WHERE tx_type = 'investment' AND from_account_id = 1").fetchone()
+        assert policy_count <= investments.MAX_HOLDINGS
+        assert policy_count == held
+        spent = sum((r.amount for r in accepted), Money(0))
+        assert Money(balance) == START_BALANCE - spent
+        assert tuple(debits) == (len(accepted), spent.cents)
+        assert ledger.verify(conn).ok
+    finally:
+        pool.release(conn)
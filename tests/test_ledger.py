@@ -0,0 +1,37 @@
+import random
+
+import ledger
+from money import Money
+
+
+def replay(db, account_id, at):
+    """Balance at ``at`` from every posting, no checkpoints."""
+    return Money(db.execute("SELECT COALESCE(SUM(amount_cents), 0) FROM postings "
+                            "WHERE account_id = ? AND created_at <= ?", (account_id, at)).fetchone()[0])
+
+
+def test_balance_at_matches_a_full_replay(db):
+    rng = random.Random(3)
+    stamps = [f"2027-01-{1 + i // 24:02d} {i % 24:02d}:30:00" for i in range(200)]
+    for at in stamps:
+        src, dst = rng.sample([1, 2, 3], 2)
+        db.execute("INSERT INTO transactions (from_account_id, to_account_id, amount_cents, tx_type, created_at) "
+                   "VALUES (?, ?, ?, 'transfer', ?)", (src, dst, rng.randint(1, 900), at))
+    db.commit()
+    assert ledger.write_checkpoints(db, every=7) > 0
+    # A second run has nothing new to checkpoint
+    assert ledger.write_checkpoints(db, every=7) == 0
+
+    moments = ["2026-01-01 00:00:00", "2099-01-01 00:00:00"] + stamps[::9] + [s.replace(":30:", ":29:") for s in stamps[::13]]
+    for account_id in (1, 2, 3):
+        for at in moments:
+            assert ledger.balance_at(db, account_id, at) == replay(db, account_id, at), (account_id, at)
+
+
+def test_verify_flags_a_balance_that_disagrees_with_its_postings(db):
+    assert ledger.verify(db).ok
+    db.execute("UPDATE accounts SET balance_cents = balance_cents + 1 WHERE id = 2")
+    db.commit()
+    report = ledger.verify(db)
+    assert not report.ok
+    assert [(m.account_id, m.stored - m.computed) for m in report.mismatches] == [(2, Money(1))]
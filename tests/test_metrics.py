@@ -0,0 +1,30 @@
+import metrics
+
+
+def sampled(sql, seconds, gemini=0.0):
+    stats = metrics.RequestStats()
+    stats.slowest_sql, stats.slowest_time, stats.gemini_time = sql, seconds, gemini
+    return stats
+
+
+def test_gemini_seconds_are_counted_per_route():
+    registry = metrics.Registry()
+    registry.record_request("/api/chatbot", "POST", 200, 1.0, sampled(None, 0.0, gemini=0.75))
+    registry.record_request("/api/chatbot", "POST", 200, 1.0, sampled(None, 0.0, gemini=0.25))
+    registry.record_request("/dashboard", "GET", 200, 0.1, sampled(None, 0.0))
+    body = registry.render()
+    assert 'bank_gemini_seconds_total{route="/api/chatbot"} 1' in body
+    assert 'bank_gemini_seconds_total{route="/dashboard"}' not in body
+
+
+def test_slowest_statement_text_is_one_bounded_label_per_route():
+    registry = metrics.Registry()
+    registry.record_request("/history", "GET", 200, 0.1, sampled("SELECT 1", 0.01))
+    registry.record_request("/history", "GET", 200, 0.1, sampled("SELECT *\n  FROM transactions" + " x" * 200, 0.02))
+    registry.record_request("/history", "GET", 200, 0.1, sampled("SELECT 2", 0.005))
+    lines = [l for l in registry.render().splitlines() if l.startswith("bank_sql_slowest_seconds{")]
+    assert len(lines) == 1
+    statement = lines[0].split('statement="', 1)[1].rsplit('"}', 1)[0]
+    assert statement.startswith("SELECT * FROM transactions x")
+    assert len(statement) == metrics.STATEMENT_LABEL_MAX
+    assert lines[0].endswith(" 0.02")
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+
+import pytest
+
+from money import MAX_CENTS, InvalidMoney, Money
+import ledger
+import migrations
+
+from conftest import REPO
+
+# The tables as they were before amounts moved to integer cents
+BASELINE_SCHEMA = """
+    CREATE TABLE users (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      username TEXT UNIQUE NOT NULL,
+      password_hash TEXT NOT NULL,
+      email TEXT,
+      phone TEXT,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE accounts (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER NOT NULL,
+      account_number TEXT UNIQUE NOT NULL,
+      balance REAL NOT NULL DEFAULT 0,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+    CREATE TABLE transactions (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      from_account_id INTEGER,
+      to_account_id INTEGER,
+      amount REAL NOT NULL,
+      tx_type TEXT NOT NULL,
+      description TEXT,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (from_account_id) REFERENCES accounts(id),
+      FOREIGN KEY (to_account_id) REFERENCES accounts(id)
+    );
+    CREATE TABLE policies (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      name TEXT UNIQUE NOT NULL,
+      description TEXT,
+      risk_level TEXT CHECK (risk_level IN ('Low','Medium','High')) DEFAULT 'Medium',
+      expected_return REAL DEFAULT 0,
+      min_investment REAL DEFAULT 0,
+      goal TEXT,
+      lock_in TEXT,
+      liquidity TEXT
+    );
+    CREATE TABLE user_policies (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER NOT NULL,
+      policy_id INTEGER NOT NULL,
+      invested_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      UNIQUE(user_id, policy_id),
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+      FOREIGN KEY (policy_id) REFERENCES policies(id) ON DELETE CASCADE
+    );
+"""
+
+
+@pytest.mark.parametrize("text, cents", [
+    ("12.5", 1250),
+    ("$1,000.00", 100000),
+    (" 7 ", 700),
+    (7, 700),
+    (0.1, 10),
+    (19.99, 1999),
+    ("-5.25", -525),
+    ("$-0.01", -1),
+])
+def test_parse(text, cents):
+    assert Money.parse(text) == Money(cents)
+
+
+@pytest.mark.parametrize("text", ["1.001", "0.005", 1.001, "abc", "", None, "NaN", "inf", "1e400"])
+def test_parse_rejects(text):
+    with pytest.raises(InvalidMoney):
+        Money.parse(text)
+
+
+def test_parse_limit():
+    top = f"{MAX_CENTS // 100}.00"
+    assert Money.parse(top).cents == MAX_CENTS
+    assert Money.parse("-" + top).cents == -MAX_CENTS
+    with pytest.raises(InvalidMoney):
+        Money.parse(f"{MAX_CENTS // 100}.01")
+    with pytest.raises(InvalidMoney):
+        Money.parse(f"-{MAX_CENTS // 100}.01")
+
+
+def test_format_and_arithmetic():
+    assert str(Money(-5)) == "-0.05"
+    assert f"{Money(123456):,.2f}" == "1,234.56"
+    assert Money.parse("0.1") + Money.parse("0.2") == Money.parse("0.3")
+    assert Money(250) * 3 == Money(750)
+
+
+def test_migration_converts_real_amounts_to_cents(tmp_path):
+    conn = sqlite3.connect(tmp_path / "bank.db")
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'ann', 'x'), (2, 'bob', 'x')")
+    # 0.1 + 0.2 style values that REAL cannot hold exactly
+    conn.execute("INSERT INTO accounts (id, user_id, account_number, balance) VALUES "
+                 "(1, 1, 'AC100001', 1000.3), (2, 2, 'AC100002', 0.29)")
+    conn.execute("INSERT INTO transactions (from_account_id, to_account_id, amount, tx_type) VALUES "
+                 "(NULL, 1, 1000.1, 'deposit'), (1, 2, 0.29, 'transfer'), (NULL, 1, 0.49, 'deposit')")
+    conn.execute("INSERT INTO policies (id, name, min_investment) VALUES (1, 'Safe Savings', 50.0)")
+    conn.commit()
+
+    migrations.migrate(conn, os.path.join(REPO, "schema.sql"), log=lambda _: None)
+
+    assert conn.execute("SELECT id, balance_cents FROM accounts ORDER BY id").fetchall() == [(1, 100030), (2, 29)]
+    assert [r[0] for r in conn.execute("SELECT amount_cents FROM transactions ORDER BY id")] == [100010, 29, 49]
+    assert conn.execute("SELECT min_investment_cents FROM policies WHERE id = 1").fetchone()[0] == 5000
+    assert "balance" not in migrations._columns(conn, "accounts")
+    assert "amount" not in migrations._columns(conn, "transactions")
+    assert conn.execute("SELECT typeof(balance_cents) FROM accounts LIMIT 1").fetchone()[0] == "integer"
+    assert migrations.pending(conn, os.path.join(REPO, "schema.sql")) == []
+    assert ledger.verify(conn).ok
@@ -0,0 +1,47 @@
+import numpy as np
+
+import projection
+
+POLICIES = [
+    {"id": 1, "risk_level": "Low", "expected_return": 3.0},
+    {"id": 4, "risk_level": "High", "expected_return": 12.0},
+    {"id": 6, "risk_level": "Medium", "expected_return": 7.0},
+]
+
+
+def test_percentile_bands_are_ordered_every_year():
+    result = projection.Projector().project(POLICIES, 10, 4000)
+    for policy in result:
+        bands = np.array([policy["bands"][f"p{pct}"] for pct in projection.PERCENTILES])
+        assert bands.shape == (len(projection.PERCENTILES), 11)
+        assert (bands[:, 0] == 1.0).all()
+        # p5 <= p25 <= p50 <= p75 <= p95 in every year, strictly after year 0
+        assert (np.diff(bands[:, 1:], axis=0) > 0).all()
+        assert 0.0 <= policy["probability_of_loss"] <= 1.0
+
+
+def test_bands_match_a_direct_percentile_of_simulated_values():
+    years, paths = 5, 20000
+    shocks = projection.simulate_shocks(years, paths)
+    (high,) = projection.project([POLICIES[1]], years, paths, shocks)
+    # The same paths, valued directly and then sorted
+    values = np.exp(np.log1p(0.12) * years + projection.VOLATILITY["High"] * shocks[-1])
+    for pct in projection.PERCENTILES:
+        direct = np.percentile(values, pct, method="nearest")
+        assert abs(high["bands"][f"p{pct}"][-1] - direct) / direct < 1e-3
+    assert high["probability_of_loss"] == round(float((values < 1.0).mean()), 4)
+
+
+def test_wider_volatility_widens_the_bands():
+    low, high, _ = projection.project(POLICIES, 10, 4000)
+    assert (high["bands"]["p95"][-1] / high["bands"]["p5"][-1]
+            > low["bands"]["p95"][-1] / low["bands"]["p5"][-1])
+
+
+def test_projector_caches_and_keys_on_policy_terms():
+    projector = projection.Projector()
+    first = projector.project(POLICIES, 10, 2000)
+    assert projector.project(POLICIES, 10, 2000) is first
+    edited = [dict(POLICIES[0], expected_return=4.0)] + POLICIES[1:]
+    assert projector.project(edited, 10, 2000) is not first
+    assert projector.stats() == {"entries": 2, "shock_sets": 1, "hits": 1, "misses": 2}
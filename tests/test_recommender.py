@@ -0,0 +1,58 @@
+import pytest
+
+from chat import PolicyCatalogCache
+from money import Money
+import recommender
+
+
+@pytest.fixture
+def catalog(db):
+    policies, _ = PolicyCatalogCache().get(db)
+    return policies
+
+
+def turn(text):
+    return {"role": "user", "content": text}
+
+
+@pytest.mark.parametrize("message, clear", [
+    ("I want low risk and may need to withdraw in an emergency, what do you recommend?", True),
+    ("aggressive, long term, which policy should I pick?", True),
+    ("Moderate risk over 2 years please", True),
+    ("why are bonds safe?", False),
+    ("compare the high risk funds for me", False),
+    ("hello", False),
+    ("low risk", False),
+])
+def test_is_clear(message, clear):
+    assert recommender.is_clear(message, recommender.parse_preferences([turn(message)])) is clear
+
+
+def test_a_thank_you_after_a_recommendation_goes_to_the_model():
+    history = [turn("low risk, short term, what do you recommend?"),
+               {"role": "model", "content": "Here are my top picks"}, turn("thanks!")]
+    assert not recommender.is_clear("thanks!", recommender.parse_preferences(history))
+
+
+@pytest.mark.parametrize("message, balance, held, top2", [
+    ("I want low risk and may need to withdraw in an emergency, what do you recommend?", "5000", (), [1, 2]),
+    ("aggressive, long term, which policy should I pick?", "5000", (), [7, 4]),
+    # The $300 minimum of Aggressive Equity is out of reach
+    ("aggressive, long term, which policy should I pick?", "250", (), [7, 5]),
+    ("aggressive, long term, which policy should I pick?", "5000", (7,), [4, 5]),
+    ("I like green investing, moderate risk, 2 years, suggest something", "5000", (), [6, 8]),
+])
+def test_top_two(catalog, message, balance, held, top2):
+    prefs = recommender.parse_preferences([turn(message)])
+    ranked = recommender.Recommender().rank(catalog, prefs, Money.parse(balance), held)
+    assert [r.policy["id"] for r in ranked[:2]] == top2
+
+
+def test_recommend_replies_with_two_picks_or_defers(catalog):
+    rec = recommender.Recommender()
+    message = "aggressive, long term, which policy should I pick?"
+    reply = rec.recommend(message, [turn(message)], catalog, Money.parse("5000"))
+    assert "1. Digital Assets Index" in reply and "2. Aggressive Equity" in reply and "3." not in reply
+    assert rec.recommend("why?", [turn("why?")], catalog, Money.parse("5000")) is None
+    full = rec.recommend(message, [turn(message)], catalog, Money.parse("5000"), held_ids=(1, 2))
+    assert "maximum of 2 policies" in full
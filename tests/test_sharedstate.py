@@ -0,0 +1,75 @@
+import threading
+
+from itsdangerous import Signer
+
+import sessions
+from sharedstate import SQLiteStateBackend
+
+
+def test_token_bucket_refills_at_its_rate_and_caps_at_capacity(tmp_path):
+    state = SQLiteStateBackend(str(tmp_path / "state.db"))
+    assert [state.take_token("b", 3, 1.0, now=100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert state.take_token("b", 3, 1.0, now=100.0) == 1.0
+    assert state.take_token("b", 3, 1.0, now=100.5) == 0.5
+    assert state.take_token("b", 3, 1.0, now=101.0) == 0.0
+    # A long idle spell refills to capacity, not beyond
+    assert [state.take_token("b", 3, 1.0, now=1000.0) for _ in range(4)] == [0.0, 0.0, 0.0, 1.0]
+    state.reset_bucket("b")
+    assert state.take_token("b", 3, 1.0, now=1000.0) == 0.0
+
+
+def test_token_bucket_is_shared_by_backends_on_one_file_and_threads(tmp_path):
+    path = str(tmp_path / "state.db")
+    # One backend per "worker", each taking from many threads at once
+    backends = [SQLiteStateBackend(path), SQLiteStateBackend(path)]
+    allowed = []
+    lock = threading.Lock()
+
+    def take(state):
+        for _ in range(10):
+            wait = state.take_token("login:ann", 25, 0.001, now=100.0)
+            with lock:
+                allowed.append(wait == 0.0)
+
+    threads = [threading.Thread(target=take, args=(backends[i % 2],)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(allowed) == 80 and sum(allowed) == 25
+
+
+# Cookie signer of the app_factory apps (SECRET_KEY=test)
+SIGNER = Signer("test", salt=sessions.ServerSessionInterface.salt)
+
+
+def sid(client):
+    return SIGNER.unsign(client.get_cookie("session").value).decode()
+
+
+def test_login_rotates_and_logout_ends_the_server_session(app_factory, login):
+    app = app_factory(STATE_BACKEND="sqlite")
+    state = app.extensions["shared_state"]
+    assert isinstance(state, SQLiteStateBackend)
+    client = app.test_client()
+    client.post("/register", data={"username": "ann", "password": "secret1"})
+    # The flash from registering gives the anonymous session an id
+    before = sid(client)
+    assert state.get(sessions.KEY_PREFIX + before) is not None
+
+    login(client)
+    after = sid(client)
+    assert after != before
+    assert state.get(sessions.KEY_PREFIX + before) is None
+    assert state.get(sessions.KEY_PREFIX + after) is not None
+    assert client.get("/dashboard").status_code == 200
+
+    # A second worker on the same file sees the session
+    assert SQLiteStateBackend(app.config["STATE_PATH"]).get(sessions.KEY_PREFIX + after) is not None
+
+    client.get("/logout")
+    assert state.get(sessions.KEY_PREFIX + after) is None
+    # Replaying the old cookie does not bring the login back
+    replay = app.test_client()
+    replay.set_cookie("session", SIGNER.sign(after).decode())
+    assert replay.get("/dashboard").status_code == 302
@@ -0,0 +1,152 @@
+import os
+import random
+import threading
+
+import pytest
+
+from database import ConnectionPool
+from money import Money
+import transfers
+
+from conftest import REPO
+
+ACCOUNTS = 6
+BALANCE = 50000
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "bank.db"), size=8, timeout=10)
+    conn = pool.acquire()
+    with open(os.path.join(REPO, "schema.sql")) as f:
+        conn.executescript(f.read())
+    conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'x')",
+                     [(i, f"user{i}") for i in range(1, ACCOUNTS + 1)])
+    conn.executemany(
+        "INSERT INTO accounts (id, user_id, account_number, balance_cents) VALUES (?, ?, ?, ?)",
+        [(i, i, f"AC{100000 + i}", BALANCE) for i in range(1, ACCOUNTS + 1)],
+    )
+    conn.commit()
+    pool.release(conn)
+    return pool
+
+
+def test_hot_account_under_concurrent_transfers(pool):
+    threads, per_thread = 8, 60
+    replays, errors = [], []
+
+    def worker(n):
+        rng = random.Random(n)
+        conn = pool.acquire()
+        try:
+            for i in range(per_thread):
+                # Account 1 is on one side of every transfer
+                other = rng.randint(2, ACCOUNTS)
+                src, dst = (1, other) if rng.random() < 0.5 else (other, 1)
+                amount = Money(rng.randint(100, 20000))
+                key = f"{n}-{i}"
+                # Every tenth transfer is sent twice, as a retrying client would
+                for attempt in range(2 if i % 10 == 0 else 1):
+                    try:
+                        result = transfers.transfer(conn, src, f"AC{100000 + dst}", amount,
+                                                    idempotency_key=key)
+                    except transfers.InsufficientFunds:
+                        break
+                    if attempt:
+                        replays.append(result.replayed)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pool.release(conn)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    assert errors == []
+
+    conn = pool.acquire()
+    try:
+        total, lowest = conn.execute("SELECT SUM(balance_cents), MIN(balance_cents) FROM accounts").fetchone()
+        duplicates = conn.execute(
+            "SELECT idempotency_key FROM transactions WHERE idempotency_key IS NOT NULL "
+            "GROUP BY from_account_id, idempotency_key HAVING COUNT(*) > 1"
+        ).fetchall()
+    finally:
+        pool.release(conn)
+    assert total == ACCOUNTS * BALANCE
+    assert lowest >= 0
+    assert duplicates == []
+    assert replays and all(replays)
+
+
+def balances(pool):
+    conn = pool.acquire()
+    try:
+        return dict(conn.execute("SELECT id, balance_cents FROM accounts").fetchall())
+    finally:
+        pool.release(conn)
+
+
+def test_replayed_batch_posts_once(pool):
+    items = [{"recipient_account": "AC100002", "amount": "10.00", "description": ""},
+             {"recipient_account": "AC100003", "amount": "5.00", "description": ""}]
+    conn = pool.acquire()
+    try:
+        first = transfers.transfer_batch(conn, 1, items, batch_key="payroll-1")
+        after_first = balances(pool)
+        again = transfers.transfer_batch(conn, 1, items, batch_key="payroll-1")
+    finally:
+        pool.release(conn)
+    assert [r["status"] for r in first] == ["posted", "posted"]
+    assert [r["status"] for r in again] == ["replayed", "replayed"]
+    assert [r["transaction_id"] for r in again] == [r["transaction_id"] for r in first]
+    assert balances(pool) == after_first
+    assert after_first[1] == BALANCE - 1500
+
+
+def test_single_transfer_key_is_not_taken_for_a_batch_item(pool):
+    conn = pool.acquire()
+    try:
+        transfers.transfer(conn, 1, "AC100002", Money(100), idempotency_key="payroll#0")
+        results = transfers.transfer_batch(
+            conn, 1, [{"recipient_account": "AC100003", "amount": "1.00", "description": ""}],
+            batch_key="payroll")
+        with pytest.raises(transfers.InvalidIdempotencyKey):
+            transfers.transfer(conn, 1, "AC100002", Money(100), idempotency_key="batch:payroll#0")
+    finally:
+        pool.release(conn)
+    assert results[0]["status"] == "posted"
+    assert balances(pool)[3] == BALANCE + 100
+
+
+def test_batch_rejects_unknown_recipients_and_posts_the_rest(pool):
+    items = [{"recipient_account": "AC100002", "amount": "10.00", "description": ""},
+             {"recipient_account": "AC999999", "amount": "10.00", "description": ""},
+             {"recipient_account": "AC100003", "amount": "2.50", "description": ""}]
+    conn = pool.acquire()
+    try:
+        results = transfers.transfer_batch(conn, 1, items)
+    finally:
+        pool.release(conn)
+    assert [r["status"] for r in results] == ["posted", "rejected", "posted"]
+    assert results[1]["error"] == transfers.RecipientNotFound.code
+    assert transfers.summarize_batch(results)["total_posted"] == Money(1250)
+    after = balances(pool)
+    assert (after[1], after[2], after[3]) == (BALANCE - 1250, BALANCE + 1000, BALANCE + 250)
+
+
+def test_batch_over_the_balance_posts_nothing(pool):
+    items = [{"recipient_account": "AC100002", "amount": str(Money(BALANCE)), "description": ""},
+             {"recipient_account": "AC100003", "amount": "0.01", "description": ""}]
+    before = balances(pool)
+    conn = pool.acquire()
+    try:
+        results = transfers.transfer_batch(conn, 1, items, batch_key="too-much")
+        posted = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+    finally:
+        pool.release(conn)
+    assert {r["error"] for r in results} == {transfers.InsufficientFunds.code}
+    assert posted == 0
+    assert balances(pool) == before
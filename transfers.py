@@ -0,0 +1,337 @@
+"""Atomic money transfers between accounts."""
+import csv
+import io
+import json
+import random
+import sqlite3
+import time
+from dataclasses import dataclass
+
+from money import MAX_CENTS, Money, InvalidMoney
+
+# Batch items are stored under "batch:<batch key>#<index>", a namespace
+# single transfers may not use, so neither can be replayed as the other
+BATCH_KEY_PREFIX = "batch:"
+
+
+class TransferError(Exception):
+    """Base class for transfers rejected for a business reason."""
+
+    code = "transfer_failed"
+
+
+class InvalidAmount(TransferError):
+    code = "invalid_amount"
+
+
+class RecipientNotFound(TransferError):
+    code = "recipient_not_found"
+
+
+class SameAccount(TransferError):
+    code = "same_account"
+
+
+class InsufficientFunds(TransferError):
+    code = "insufficient_funds"
+
+
+class InvalidIdempotencyKey(TransferError):
+    code = "invalid_idempotency_key"
+
+
+@dataclass(frozen=True)
+class TransferResult:
+    transaction_id: int
+    from_account_id: int
+    to_account_id: int
+    amount: Money
+    # True when an earlier transfer with the same idempotency key was returned
+    replayed: bool = False
+
+
+def is_busy_error(exc: sqlite3.OperationalError) -> bool:
+    msg = str(exc).lower()
+    return "database is locked" in msg or "database is busy" in msg
+
+
+def with_busy_retry(fn, max_retries=6, base_delay=0.005, max_delay=0.25):
+    """Run ``fn`` again with jittered exponential backoff while SQLite reports SQLITE_BUSY."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def _find_replay(conn, from_account_id, idempotency_key):
+    return conn.execute(
+        "SELECT id, from_account_id, to_account_id, amount_cents FROM transactions "
+        "WHERE from_account_id = ? AND idempotency_key = ?",
+        (from_account_id, idempotency_key),
+    ).fetchone()
+
+
+def _transfer_once(conn, from_account_id, to_account_number, amount, description, idempotency_key):
+    # IMMEDIATE takes the write lock up front, so two transfers can never both
+    # read a balance, pass the check and then overdraw the account.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if idempotency_key:
+            prior = _find_replay(conn, from_account_id, idempotency_key)
+            if prior is not None:
+                conn.rollback()
+                return TransferResult(prior[0], prior[1], prior[2], Money(prior[3]), replayed=True)
+
+        recipient = conn.execute(
+            "SELECT id FROM accounts WHERE account_number = ?",
+            (to_account_number,),
+        ).fetchone()
+        if recipient is None:
+            raise RecipientNotFound("Recipient account not found")
+        to_account_id = recipient[0]
+        if to_account_id == from_account_id:
+            raise SameAccount("Cannot send money to yourself")
+
+        # Balance check and debit in one statement: no row changes unless funds suffice
+        debited = conn.execute(
+            "UPDATE accounts SET balance_cents = balance_cents - ? WHERE id = ? AND balance_cents >= ?",
+            (amount, from_account_id, amount),
+        ).rowcount
+        if debited != 1:
+            raise InsufficientFunds("Insufficient funds")
+        conn.execute(
+            "UPDATE accounts SET balance_cents = balance_cents + ? WHERE id = ?",
+            (amount, to_account_id),
+        )
+        cur = conn.execute(
+            "INSERT INTO transactions (from_account_id, to_account_id, amount_cents, tx_type, description, idempotency_key) "
+            "VALUES (?, ?, ?, 'transfer', ?, ?)",
+            (from_account_id, to_account_id, amount, description, idempotency_key or None),
+        )
+        conn.commit()
+        return TransferResult(cur.lastrowid, from_account_id, to_account_id, amount)
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def transfer(conn, from_account_id, to_account_number, amount, description="",
+             idempotency_key=None, max_retries=6) -> TransferResult:
+    """Move ``amount`` from ``from_account_id`` to the account numbered ``to_account_number``.
+
+    The whole transfer runs in one ``BEGIN IMMEDIATE`` transaction and is
+    retried with bounded backoff if the database stays busy. Passing the same
+    ``idempotency_key`` again for the same sender returns the original
+    transfer instead of posting a second one.
+    """
+    try:
+        amount = Money.parse(amount)
+    except InvalidMoney:
+        raise InvalidAmount("Please enter a valid amount") from None
+    if amount.cents <= 0:
+        raise InvalidAmount("Amount must be greater than zero")
+    if idempotency_key and idempotency_key.startswith(BATCH_KEY_PREFIX):
+        raise InvalidIdempotencyKey(f"Idempotency keys may not start with {BATCH_KEY_PREFIX!r}")
+
+    def attempt():
+        try:
+            return _transfer_once(conn, from_account_id, to_account_number, amount,
+                                  description, idempotency_key)
+        except sqlite3.IntegrityError:
+            # A concurrent request with the same key committed first
+            if idempotency_key:
+                prior = _find_replay(conn, from_account_id, idempotency_key)
+                if prior is not None:
+                    return TransferResult(prior[0], prior[1], prior[2], Money(prior[3]), replayed=True)
+            raise
+
+    return with_busy_retry(attempt, max_retries=max_retries)
+
+
+# ---------- Batch transfers ----------
+
+def _batch_item_key(batch_key, index):
+    return f"{BATCH_KEY_PREFIX}{batch_key}#{index}"
+
+
+class InvalidBatch(ValueError):
+    """Raised when a batch payload cannot be parsed."""
+
+
+def parse_batch(payload, fmt="json") -> list:
+    """Turn a JSON or CSV payload into a list of ``{recipient_account, amount, description}`` dicts.
+
+    JSON may be a bare list or ``{"transfers": [...]}``. CSV needs a header
+    row with ``recipient_account`` (or ``account_number``) and ``amount``.
+    """
+    if fmt == "csv":
+        text = payload.decode("utf-8-sig") if isinstance(payload, bytes) else payload
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or "amount" not in reader.fieldnames:
+            raise InvalidBatch("CSV needs a header row with recipient_account and amount")
+        rows = list(reader)
+    else:
+        try:
+            data = json.loads(payload) if isinstance(payload, (str, bytes)) else payload
+        except ValueError as e:
+            raise InvalidBatch(f"invalid JSON: {e}") from e
+        rows = data.get("transfers") if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise InvalidBatch("expected a list of transfers")
+
+    items = []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise InvalidBatch("each transfer must be an object")
+        items.append({
+            "recipient_account": str(row.get("recipient_account") or row.get("account_number") or "").strip(),
+            "amount": row.get("amount"),
+            "description": str(row.get("description") or "").strip(),
+        })
+    return items
+
+
+def _batch_replay(conn, from_account_id, batch_key, items):
+    """Return item results for a batch already posted under ``batch_key``, or None."""
+    # Exact keys: a range scan would also match batches whose key starts
+    # with this one followed by "#"
+    rows = conn.execute(
+        "SELECT idempotency_key, id FROM transactions "
+        "WHERE from_account_id = ? AND idempotency_key IN (SELECT value FROM json_each(?))",
+        (from_account_id, json.dumps([_batch_item_key(batch_key, i) for i in range(len(items))])),
+    ).fetchall()
+    if not rows:
+        return None
+    posted = dict(rows)
+    results = []
+    for i, item in enumerate(items):
+        tx_id = posted.get(_batch_item_key(batch_key, i))
+        results.append({
+            "index": i,
+            "recipient_account": item["recipient_account"],
+            "amount": item["amount"],
+            "status": "replayed" if tx_id else "not_posted",
+            "transaction_id": tx_id,
+        })
+    return results
+
+
+def _transfer_batch_once(conn, from_account_id, items, batch_key):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if batch_key:
+            replay = _batch_replay(conn, from_account_id, batch_key, items)
+            if replay is not None:
+                conn.rollback()
+                return replay
+
+        # Resolve every recipient in one set-based lookup
+        numbers = sorted({item["recipient_account"] for item in items if item["recipient_account"]})
+        recipients = dict(conn.execute(
+            "SELECT account_number, id FROM accounts "
+            "WHERE account_number IN (SELECT value FROM json_each(?))",
+            (json.dumps(numbers),),
+        ).fetchall())
+
+        results = []
+        valid = []
+        total = 0
+        for i, item in enumerate(items):
+            result = {
+                "index": i,
+                "recipient_account": item["recipient_account"],
+                "amount": item["amount"],
+                "status": "posted",
+                "transaction_id": None,
+            }
+            results.append(result)
+            try:
+                amount = Money.parse(item["amount"]).cents
+            except (InvalidMoney, TypeError):
+                amount = 0
+            to_account_id = recipients.get(item["recipient_account"])
+            if amount <= 0:
+                error = InvalidAmount.code
+            elif to_account_id is None:
+                error = RecipientNotFound.code
+            elif to_account_id == from_account_id:
+                error = SameAccount.code
+            elif total + amount > MAX_CENTS:
+                # The batch is one debit, held to the same limit as one amount
+                error = InvalidAmount.code
+            else:
+                error = None
+            if error:
+                result["status"] = "rejected"
+                result["error"] = error
+                continue
+            result["amount"] = Money(amount)
+            total += amount
+            valid.append((result, to_account_id, amount, item["description"]))
+
+        if not valid:
+            conn.rollback()
+            return results
+
+        # One balance check for the whole batch
+        debited = conn.execute(
+            "UPDATE accounts SET balance_cents = balance_cents - ? WHERE id = ? AND balance_cents >= ?",
+            (total, from_account_id, total),
+        ).rowcount
+        if debited != 1:
+            conn.rollback()
+            for result, *_ in valid:
+                result["status"] = "rejected"
+                result["error"] = InsufficientFunds.code
+            return results
+
+        credits = {}
+        for _, to_account_id, amount, _ in valid:
+            credits[to_account_id] = credits.get(to_account_id, 0) + amount
+        conn.executemany(
+            "UPDATE accounts SET balance_cents = balance_cents + ? WHERE id = ?",
+            [(amount, to_account_id) for to_account_id, amount in credits.items()],
+        )
+
+        insert = ("INSERT INTO transactions (from_account_id, to_account_id, amount_cents, tx_type, description, "
+                  "idempotency_key) VALUES (?, ?, ?, 'transfer', ?, ?) RETURNING id")
+        for result, to_account_id, amount, description in valid:
+            result["transaction_id"] = conn.execute(
+                insert,
+                (from_account_id, to_account_id, amount, description,
+                 _batch_item_key(batch_key, result["index"]) if batch_key else None),
+            ).fetchone()[0]
+        conn.commit()
+        return results
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def transfer_batch(conn, from_account_id, items, batch_key=None, max_retries=6) -> list:
+    """Post many transfers from one account in a single transaction.
+
+    Recipients are resolved in one query and the sender's balance is checked
+    once against the batch total; if it does not cover the total nothing is
+    posted. Items with a bad amount or unknown recipient are rejected on
+    their own without affecting the rest. Returns one status dict per item.
+    """
+    return with_busy_retry(
+        lambda: _transfer_batch_once(conn, from_account_id, items, batch_key),
+        max_retries=max_retries,
+    )
+
+
+def summarize_batch(results) -> dict:
+    posted = [r for r in results if r["status"] == "posted"]
+    return {
+        "submitted": len(results),
+        "posted": len(posted),
+        "replayed": sum(1 for r in results if r["status"] == "replayed"),
+        "rejected": sum(1 for r in results if r["status"] == "rejected"),
+        "total_posted": Money(sum(r["amount"].cents for r in posted)),
+    }
@@ -0,0 +1,82 @@
+"""Page data loaded in one round trip, and cached rendered fragments."""
+import threading
+from dataclasses import dataclass, field
+
+from markupsafe import Markup
+
+from database import cache_version
+from money import Money
+
+ACCOUNT_VIEW_SQL = """
+    SELECT a.account_number, a.balance_cents, up.invested_at, up.amount_cents,
+           p.id, p.name, p.description, p.risk_level, p.expected_return,
+           p.min_investment_cents, p.goal, p.lock_in, p.liquidity
+    FROM accounts a
+    LEFT JOIN user_policies up ON up.user_id = a.user_id
+    LEFT JOIN policies p ON p.id = up.policy_id
+    WHERE a.user_id = ?
+    ORDER BY up.invested_at DESC
+"""
+INVESTMENT_COLUMNS = ("id", "name", "description", "risk_level", "expected_return",
+                      "min_investment_cents", "goal", "lock_in", "liquidity", "invested_at", "amount_cents")
+
+
+@dataclass(frozen=True)
+class AccountView:
+    """Account header data plus the user's investments, newest first."""
+
+    account_number: str
+    balance: Money
+    investments: list = field(default_factory=list)
+
+
+def load_account_view(db, user_id, with_investments=True):
+    """One query for everything the page header and "Your Policies" need; None if no account."""
+    if not with_investments:
+        row = db.execute(
+            "SELECT account_number, balance_cents FROM accounts WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return AccountView(row["account_number"], Money(row["balance_cents"])) if row else None
+    rows = db.execute(ACCOUNT_VIEW_SQL, (user_id,)).fetchall()
+    if not rows:
+        return None
+    investments = [
+        {col: row[col] for col in INVESTMENT_COLUMNS}
+        for row in rows if row["id"] is not None
+    ]
+    return AccountView(rows[0]["account_number"], Money(rows[0]["balance_cents"]), investments)
+
+
+class FragmentCache:
+    """Rendered HTML fragments keyed by a ``cache_versions`` counter.
+
+    A fragment is rendered again only after a write to its source table bumps
+    the counter, or after ``invalidate`` is called.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fragments = {}
+        self.hits = 0
+        self.renders = 0
+
+    def get(self, db, name, render):
+        """Return the fragment for ``name``, calling ``render()`` if it is stale."""
+        version = cache_version(db, name)
+        with self._lock:
+            cached = self._fragments.get(name)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+        html = Markup(render())
+        with self._lock:
+            self._fragments[name] = (version, html)
+            self.renders += 1
+        return html
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._fragments.clear()
+            else:
+                self._fragments.pop(name, None)